@@ -4,21 +4,32 @@ from core.metrics import Metrics
 from core.redis_client import RedisClient
 from core.db import DB
 from core.health import HealthChecker
+from core.order_queue import OrderQueue, OrderFlusher, ORDERS_WRITE_BEHIND, ORDERS_FLUSHER
+from core.warmup import STOCK_WARMUP, start_warmup
+from core.changefeed import StockChangeFeed, STOCK_CHANGEFEED
 from services.checkoutService import CheckoutService
 
 app = Flask(__name__)
 
 # init infra
-log = JsonLogger(service="api")
 metrics = Metrics()
+log = JsonLogger(service="api", metrics=metrics)
 redis_client = RedisClient(logger=log, metrics=metrics)
 db = DB(logger=log, metrics=metrics)
-health = HealthChecker(logger=log, metrics=metrics, redis_client=redis_client, db=db)
-checkout_service = CheckoutService(logger=log, metrics=metrics, redis_client=redis_client, db=db)
+health = HealthChecker(logger=log, metrics=metrics, redis_client=redis_client, db=db).start()
+orders = OrderQueue(logger=log, metrics=metrics, redis_client=redis_client, db=db) if ORDERS_WRITE_BEHIND else None
+checkout_service = CheckoutService(logger=log, metrics=metrics, redis_client=redis_client, db=db, orders=orders)
+if orders and ORDERS_FLUSHER == "inproc":
+    OrderFlusher(logger=log, metrics=metrics, redis_client=redis_client, db=db).start()
+if STOCK_WARMUP:
+    start_warmup(log, redis_client, db)
+if STOCK_CHANGEFEED == "inproc":
+    StockChangeFeed(logger=log, metrics=metrics, redis_client=redis_client, db=db).start()
 
 @app.get("/live")
 def live():
-    return jsonify(health.liveness())
+    body, code = health.liveness()
+    return jsonify(body), code
 
 @app.get("/health")
 def healthRoute():
@@ -34,6 +45,16 @@ def enquire(item_id):
     body, code = checkout_service.enquire(item_id)
     return jsonify(body), code
 
+# Batch enquiry: GET /enquire?ids=I001,I002 or POST {"ids": ["I001", "I002"]}
+@app.route("/enquire", methods=["GET", "POST"])
+def enquire_batch():
+    if request.method == "POST":
+        ids = _json().get("ids")
+    else:
+        ids = [i for i in request.args.get("ids", "").split(",") if i.strip()]
+    body, code = checkout_service.enquire_many(ids)
+    return jsonify(body), code
+
 # Support GET with ?qty= and POST; also support GET with /<qty> path
 @app.route("/checkout/<item_id>", methods=["GET", "POST"])
 @app.get("/checkout/<item_id>/<int:qty>")
@@ -47,12 +68,27 @@ def checkout(item_id, qty=None):
     body, code = checkout_service.checkout(user_id=user_id, item_id=item_id, qty=qty)
     return jsonify(body), code
 
+# Multi-item cart: {"user": "u1", "items": [{"item_id": "I001", "qty": 2}, ...]}
+@app.post("/checkout")
+def checkout_cart():
+    payload = _json()
+    user_id = payload.get("user") or request.args.get("user")
+    body, code = checkout_service.checkout_many(user_id=user_id, items=payload.get("items"))
+    return jsonify(body), code
+
+def _json():
+    # lenient body: anything that isn't a JSON object (bad JSON, [], "x") counts as empty
+    payload = request.get_json(silent=True)
+    return payload if isinstance(payload, dict) else {}
+
 @app.get("/")
 def home():
     return jsonify(
         message="AICS",
         try_enquire="/enquire/I001 or /enquire/1",
+        try_enquire_batch="/enquire?ids=I001,I002,I003",
         try_checkout="/checkout/I001?qty=2&user=u1",
+        try_cart='POST /checkout {"user": "u1", "items": [{"item_id": "I001", "qty": 2}]}',
         health="/health", live="/live", metrics="/metrics"
     )
 
@@ -0,0 +1,135 @@
+# ASGI twin of app.py: same routes, backed by redis.asyncio and the psycopg async pool.
+# Selected at startup with SERVER_MODE=async (see serve.sh).
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from core.logging import JsonLogger
+from core.metrics import Metrics
+from core.async_redis_client import AsyncRedisClient
+from core.async_db import AsyncDB
+from core.health import AsyncHealthChecker
+from core.order_queue import AsyncOrderQueue, OrderFlusher, ORDERS_WRITE_BEHIND, ORDERS_FLUSHER
+from core.warmup import STOCK_WARMUP, start_warmup
+from core.changefeed import StockChangeFeed, STOCK_CHANGEFEED
+from services.asyncCheckoutService import AsyncCheckoutService
+
+# init infra
+metrics = Metrics()
+log = JsonLogger(service="api", metrics=metrics)
+redis_client = AsyncRedisClient(logger=log, metrics=metrics)
+db = AsyncDB(logger=log, metrics=metrics)
+health = AsyncHealthChecker(logger=log, metrics=metrics, redis_client=redis_client, db=db)
+orders = AsyncOrderQueue(logger=log, metrics=metrics, redis_client=redis_client, db=db) if ORDERS_WRITE_BEHIND else None
+checkout_service = AsyncCheckoutService(logger=log, metrics=metrics, redis_client=redis_client, db=db, orders=orders)
+
+def _aux_clients():
+    # sync clients shared by the background threads (order flusher, warm-up, change feed).
+    # DB() opens a pool and runs SCHEMA and RedisClient() preloads scripts, so this runs
+    # off the event loop; they only write stock, so no L1 or invalidation listener.
+    from core.redis_client import RedisClient
+    from core.db import DB
+    return RedisClient(logger=log, metrics=metrics, l1=False), DB(logger=log, metrics=metrics)
+
+@asynccontextmanager
+async def lifespan(app):
+    await db.open()
+    await redis_client.open()
+    await health.start()
+    flusher = feed = aux_db = None
+    run_flusher = orders is not None and ORDERS_FLUSHER == "inproc"
+    if run_flusher or STOCK_WARMUP or STOCK_CHANGEFEED == "inproc":
+        aux_redis, aux_db = await asyncio.to_thread(_aux_clients)
+        if run_flusher:
+            flusher = OrderFlusher(logger=log, metrics=metrics, redis_client=aux_redis, db=aux_db).start()
+        if STOCK_WARMUP:
+            start_warmup(log, aux_redis, aux_db)
+        if STOCK_CHANGEFEED == "inproc":
+            feed = StockChangeFeed(logger=log, metrics=metrics, redis_client=aux_redis, db=aux_db).start()
+    yield
+    if flusher:
+        await asyncio.to_thread(flusher.stop)
+    if feed:
+        await asyncio.to_thread(feed.stop)
+    if aux_db:
+        await asyncio.to_thread(aux_db.close)
+    await health.stop()
+    await redis_client.close()
+    await db.close()
+
+app = FastAPI(title="AICS", lifespan=lifespan, docs_url=None, redoc_url=None, openapi_url=None)
+
+@app.get("/live")
+async def live():
+    body, code = health.liveness()
+    return JSONResponse(body, status_code=code)
+
+@app.get("/health")
+async def healthRoute():
+    body, code = await health.readiness()
+    return JSONResponse(body, status_code=code)
+
+@app.get("/metrics")
+async def prom():
+    body, code, headers = metrics.expose()
+    return Response(content=body, status_code=code, headers=headers)
+
+@app.get("/enquire/{item_id}")
+async def enquire(item_id: str):
+    body, code = await checkout_service.enquire(item_id)
+    return JSONResponse(body, status_code=code)
+
+# Batch enquiry: GET /enquire?ids=I001,I002 or POST {"ids": ["I001", "I002"]}
+@app.api_route("/enquire", methods=["GET", "POST"])
+async def enquire_batch(request: Request):
+    if request.method == "POST":
+        ids = (await _json(request)).get("ids")
+    else:
+        ids = [i for i in request.query_params.get("ids", "").split(",") if i.strip()]
+    body, code = await checkout_service.enquire_many(ids)
+    return JSONResponse(body, status_code=code)
+
+# Support GET with ?qty= and POST; also support GET with /<qty> path
+@app.api_route("/checkout/{item_id}", methods=["GET", "POST"])
+async def checkout(item_id: str, request: Request):
+    try:
+        qty = int(request.query_params.get("qty", "1"))
+    except ValueError:
+        qty = 1
+    return await _checkout(item_id, qty, request)
+
+@app.get("/checkout/{item_id}/{qty}")
+async def checkout_qty(item_id: str, qty: int, request: Request):
+    return await _checkout(item_id, qty, request)
+
+async def _checkout(item_id, qty, request):
+    user_id = request.query_params.get("user")
+    body, code = await checkout_service.checkout(user_id=user_id, item_id=item_id, qty=qty)
+    return JSONResponse(body, status_code=code)
+
+# Multi-item cart: {"user": "u1", "items": [{"item_id": "I001", "qty": 2}, ...]}
+@app.post("/checkout")
+async def checkout_cart(request: Request):
+    payload = await _json(request)
+    user_id = payload.get("user") or request.query_params.get("user")
+    body, code = await checkout_service.checkout_many(user_id=user_id, items=payload.get("items"))
+    return JSONResponse(body, status_code=code)
+
+async def _json(request):
+    # same leniency as Flask's get_json(silent=True)
+    try:
+        payload = await request.json()
+    except ValueError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+@app.get("/")
+async def home():
+    return dict(
+        message="AICS",
+        try_enquire="/enquire/I001 or /enquire/1",
+        try_enquire_batch="/enquire?ids=I001,I002,I003",
+        try_checkout="/checkout/I001?qty=2&user=u1",
+        try_cart='POST /checkout {"user": "u1", "items": [{"item_id": "I001", "qty": 2}]}',
+        health="/health", live="/live", metrics="/metrics", mode="async"
+    )
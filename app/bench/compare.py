@@ -0,0 +1,48 @@
+# Diff two loadgen JSON results: python -m bench.compare base.json new.json
+import json, sys
+
+METRICS = ("rps", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+
+def _pct_change(a, b):
+    if a in (None, 0) or b is None:
+        return ""
+    return f"{(b - a) / a * 100:+.1f}%"
+
+def _rows(name, a, b):
+    rows = []
+    for m in METRICS:
+        rows.append((f"{name} {m}", a.get(m), b.get(m), _pct_change(a.get(m), b.get(m))))
+    for code in sorted(set(a.get("codes", {})) | set(b.get("codes", {}))):
+        ca, cb = a.get("codes", {}).get(code, 0), b.get("codes", {}).get(code, 0)
+        rows.append((f"{name} code={code}", ca, cb, _pct_change(ca, cb)))
+    return rows
+
+def compare(base, new):
+    rows = _rows("total", base["total"], new["total"])
+    for ep in sorted(set(base["endpoints"]) | set(new["endpoints"])):
+        rows += _rows(ep, base["endpoints"].get(ep, {}), new["endpoints"].get(ep, {}))
+    # op counts normalised per request so runs of different length compare
+    na, nb = base["total"]["requests"] or 1, new["total"]["requests"] or 1
+    for k in sorted(set(base["op_counts"]) | set(new["op_counts"])):
+        a, b = base["op_counts"].get(k, 0) / na, new["op_counts"].get(k, 0) / nb
+        rows.append((f"{k} /req", round(a, 4), round(b, 4), _pct_change(a, b)))
+    return rows
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    if len(argv) != 2:
+        print("usage: python -m bench.compare BASE.json NEW.json", file=sys.stderr)
+        return 2
+    with open(argv[0]) as f:
+        base = json.load(f)
+    with open(argv[1]) as f:
+        new = json.load(f)
+    print(f"base: {base.get('workload')} @ {base.get('git')}   new: {new.get('workload')} @ {new.get('git')}")
+    rows = compare(base, new)
+    w = max(len(r[0]) for r in rows)
+    for name, a, b, d in rows:
+        print(f"{name:<{w}}  {str(a):>12}  {str(b):>12}  {d:>8}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+# Load generator for the shopping API.
+#
+#   python -m bench.loadgen --workload read_heavy --duration 30 --concurrency 32 --out results/base.json
+#   python -m bench.loadgen --standins docker --start-app --mode async --workload hot_checkout
+#   python -m bench.compare results/base.json results/new.json
+#
+# Reports throughput, p50/p95/p99 per endpoint, status-code breakdown and the
+# db_ops_total / redis_ops_total deltas scraped from /metrics, written as JSON.
+import argparse, json, os, random, re, subprocess, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OP_COUNTERS = ("db_ops_total", "redis_ops_total", "stock_l1_cache_total", "stock_cache_refill_total")
+_SERIES = re.compile(r"^(\w+)(\{[^}]*\})?\s+([0-9.eE+-]+)$")
+
+# ---------- workloads: each returns (endpoint, method, path, json_body) ----------
+def _item(rng, args):
+    # skewed towards a small hot set, like a real storefront
+    if rng.random() < args.hot_ratio:
+        return f"I{rng.randint(1, args.hot_items):03d}"
+    return f"I{rng.randint(1, args.items):03d}"
+
+def op_read_heavy(rng, args, user):
+    if rng.random() < 0.05:
+        ids = ",".join(_item(rng, args) for _ in range(args.batch_size))
+        return "/enquire?ids", "GET", f"/enquire?ids={ids}", None
+    return "/enquire", "GET", f"/enquire/{_item(rng, args)}", None
+
+def op_hot_checkout(rng, args, user):
+    # every user hammers the same SKU
+    return "/checkout", "POST", f"/checkout/I001?qty=1&user={user}", None
+
+def op_mixed_carts(rng, args, user):
+    r = rng.random()
+    if r < 0.6:
+        return "/enquire", "GET", f"/enquire/{_item(rng, args)}", None
+    if r < 0.8:
+        return "/checkout", "POST", f"/checkout/{_item(rng, args)}?qty=1&user={user}", None
+    lines = [{"item_id": _item(rng, args), "qty": rng.randint(1, 2)} for _ in range(rng.randint(1, 5))]
+    return "/checkout cart", "POST", "/checkout", {"user": user, "items": lines}
+
+WORKLOADS = {
+    "read_heavy": op_read_heavy,
+    "hot_checkout": op_hot_checkout,
+    "mixed_carts": op_mixed_carts,
+    "cold_start": op_read_heavy,  # same mix, but stock:* keys are flushed first
+}
+
+# ---------- measurement ----------
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lat = {}     # endpoint -> [seconds]
+        self.codes = {}   # endpoint -> {code: n}
+
+    def add(self, endpoint, code, dt):
+        with self._lock:
+            self.lat.setdefault(endpoint, []).append(dt)
+            c = self.codes.setdefault(endpoint, {})
+            c[code] = c.get(code, 0) + 1
+
+def _pct(vals, p):
+    if not vals:
+        return None
+    return vals[min(len(vals) - 1, int(round(p / 100.0 * (len(vals) - 1))))]
+
+def _summary(vals, codes, elapsed):
+    vals = sorted(vals)
+    return {
+        "requests": len(vals),
+        "rps": round(len(vals) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(_pct(vals, 50) * 1000, 3) if vals else None,
+        "p95_ms": round(_pct(vals, 95) * 1000, 3) if vals else None,
+        "p99_ms": round(_pct(vals, 99) * 1000, 3) if vals else None,
+        "max_ms": round(vals[-1] * 1000, 3) if vals else None,
+        "codes": {str(k): v for k, v in sorted(codes.items(), key=lambda kv: str(kv[0]))},
+    }
+
+def scrape_op_counters(base_url):
+    # cumulative DB/Redis op counters from /metrics; {series: value}
+    try:
+        text = requests.get(base_url + "/metrics", timeout=5).text
+    except requests.RequestException:
+        return {}
+    out = {}
+    for line in text.splitlines():
+        m = _SERIES.match(line)
+        if m and m.group(1) in OP_COUNTERS:
+            out[m.group(1) + (m.group(2) or "")] = float(m.group(3))
+    return out
+
+def _delta(before, after):
+    return {k: round(v - before.get(k, 0.0), 3) for k, v in sorted(after.items()) if v - before.get(k, 0.0)}
+
+# ---------- environment prep ----------
+def flush_stock_cache(env):
+    import redis
+    r = redis.Redis(host=env.get("REDIS_HOST", "localhost"), port=int(env.get("REDIS_PORT", "6379")),
+                    db=int(env.get("REDIS_DB", "0")))
+    keys = list(r.scan_iter("stock:*", count=1000))
+    for i in range(0, len(keys), 1000):
+        r.delete(*keys[i:i + 1000])
+    return len(keys)
+
+def restock(env, qty):
+    import psycopg
+    dsn = env.get("DB_DSN") or "postgresql://{u}:{p}@{h}:{port}/{n}".format(
+        u=env.get("DB_USER", "app"), p=env.get("DB_PASS", "app"), h=env.get("DB_HOST", "localhost"),
+        port=env.get("DB_PORT", "5432"), n=env.get("DB_NAME", "postgres"))
+    with psycopg.connect(dsn) as con:
+        con.execute("UPDATE inventory SET qty = %s", (qty,))
+
+def start_app(env, mode, port, timeout=30.0):
+    proc_env = dict(os.environ, **env, SERVER_MODE=mode, PORT=str(port), PYTHONUNBUFFERED="1",
+                    METRICS_CACHE_MS="0")  # op-count deltas need fresh scrapes
+    proc = subprocess.Popen(["sh", "serve.sh"], cwd=APP_DIR, env=proc_env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(base + "/live", timeout=1).ok:
+                return proc
+        except requests.RequestException:
+            pass
+        if proc.poll() is not None:
+            break
+        time.sleep(0.3)
+    proc.terminate()
+    raise RuntimeError("app did not come up")
+
+# ---------- runner ----------
+def run(args):
+    op = WORKLOADS[args.workload]
+    rec = Recorder()
+    deadline = time.time() + args.warmup + args.duration
+    measure_from = time.time() + args.warmup
+
+    def worker(n):
+        rng = random.Random(args.seed + n)
+        s = requests.Session()
+        while True:
+            now = time.time()
+            if now >= deadline:
+                return
+            user = f"bench-{n}-{rng.randint(0, args.users)}"
+            endpoint, method, path, body = op(rng, args, user)
+            t0 = time.perf_counter()
+            try:
+                code = s.request(method, args.base_url + path, json=body, timeout=args.timeout).status_code
+            except requests.RequestException as e:
+                code = type(e).__name__
+            dt = time.perf_counter() - t0
+            if now >= measure_from:
+                rec.add(endpoint, code, dt)
+
+    # workers start right away; the warmup window is excluded from latencies and op counts
+    with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+        for n in range(args.concurrency):
+            ex.submit(worker, n)
+        time.sleep(max(0.0, measure_from - time.time()))
+        before = scrape_op_counters(args.base_url)
+        t0 = time.time()
+    elapsed = time.time() - t0
+    after = scrape_op_counters(args.base_url)
+
+    all_lat, all_codes = [], {}
+    for ep, vals in rec.lat.items():
+        all_lat.extend(vals)
+        for c, k in rec.codes[ep].items():
+            all_codes[c] = all_codes.get(c, 0) + k
+    return {
+        "workload": args.workload,
+        "mode": args.mode,
+        "started_at": t0,
+        "duration_s": round(elapsed, 3),
+        "concurrency": args.concurrency,
+        "total": _summary(all_lat, all_codes, elapsed),
+        "endpoints": {ep: _summary(v, rec.codes[ep], elapsed) for ep, v in sorted(rec.lat.items())},
+        "op_counts": _delta(before, after),
+        "git": _git_rev(),
+    }
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="AICS load generator")
+    ap.add_argument("--workload", choices=sorted(WORKLOADS), default="read_heavy")
+    ap.add_argument("--base-url", default="http://127.0.0.1:8000")
+    ap.add_argument("--duration", type=float, default=30.0)
+    ap.add_argument("--warmup", type=float, default=3.0)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--timeout", type=float, default=5.0)
+    ap.add_argument("--items", type=int, default=100)
+    ap.add_argument("--hot-items", type=int, default=5)
+    ap.add_argument("--hot-ratio", type=float, default=0.8)
+    ap.add_argument("--batch-size", type=int, default=50)
+    ap.add_argument("--users", type=int, default=1000)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--restock", type=int, default=None, help="set every inventory.qty before the run")
+    ap.add_argument("--standins", choices=["none", "docker"], default="none")
+    ap.add_argument("--start-app", action="store_true", help="launch serve.sh against the target Redis/Postgres")
+    ap.add_argument("--mode", choices=["sync", "async"], default=os.getenv("SERVER_MODE", "sync"))
+    ap.add_argument("--out", default=None, help="write the JSON result here (default: stdout)")
+    args = ap.parse_args(argv)
+
+    standins, app = None, None
+    env = {k: v for k, v in os.environ.items() if k.startswith(("REDIS_", "DB_"))}
+    try:
+        if args.standins == "docker":
+            from bench.standins import Standins
+            standins = Standins()
+            env.update(standins.start())
+        if args.start_app:
+            app = start_app(env, args.mode, port=int(args.base_url.rsplit(":", 1)[1]))
+        if args.restock is not None:
+            restock(env, args.restock)
+            flush_stock_cache(env)
+        if args.workload == "cold_start":
+            flush_stock_cache(env)
+        result = run(args)
+    finally:
+        if app:
+            app.terminate()
+            app.wait(10)
+        if standins:
+            standins.stop()
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+if __name__ == "__main__":
+    sys.exit(main())
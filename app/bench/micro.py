@@ -0,0 +1,64 @@
+# Microbenchmarks for per-request hot paths: python -m bench.micro [--number N]
+import argparse, io, json, sys, timeit
+from contextlib import redirect_stdout
+
+def bench_parse_item_id():
+    from services.checkoutService import CheckoutService
+    f = CheckoutService._parse_item_id
+    return lambda: (f("I001"), f("42"), f(" i0099 "))
+
+def bench_logger():
+    from core.logging import JsonLogger
+    log = JsonLogger(service="bench")
+    return lambda: log.info(route="/enquire/I001", status=200, msg="cache", stock=12)
+
+_metrics = None
+
+def _shared_metrics():
+    # prometheus collectors register globally, so every bench shares one Metrics
+    global _metrics
+    if _metrics is None:
+        from core.metrics import Metrics
+        _metrics = Metrics()
+    return _metrics
+
+def bench_metrics():
+    m = _shared_metrics()
+    def observe():
+        m.LAT.labels("/enquire").observe(0.0012)
+        m.REQS.labels("/enquire", "200").inc()
+    return observe
+
+def bench_record_request():
+    # same two updates through the cached-children path used by instrument.route
+    m = _shared_metrics()
+    return lambda: m.record_request("/enquire", 200, 0.0012)
+
+BENCHES = {
+    "parse_item_id": bench_parse_item_id,
+    "json_logger": bench_logger,
+    "metrics_observe": bench_metrics,
+    "metrics_record_request": bench_record_request,
+}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--number", type=int, default=100000)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--only", nargs="*", default=None)
+    args = ap.parse_args(argv)
+
+    results = {}
+    for name, make in BENCHES.items():
+        if args.only and name not in args.only:
+            continue
+        fn = make()
+        sink = io.StringIO()
+        with redirect_stdout(sink):  # keep the logger's output out of the report
+            times = timeit.repeat(fn, number=args.number, repeat=args.repeat)
+        best = min(times) / args.number
+        results[name] = {"ns_per_call": round(best * 1e9, 1), "calls_per_s": round(1 / best)}
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    sys.exit(main())
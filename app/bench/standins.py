@@ -0,0 +1,47 @@
+# Throwaway Redis + Postgres containers for benchmarks (needs docker on PATH).
+# Ports are picked by docker (-P) so several runs can coexist.
+import subprocess, time
+
+REDIS_IMAGE = "redis:7.2-alpine"
+PG_IMAGE = "postgres:16-alpine"
+
+def _sh(*cmd) -> str:
+    return subprocess.run(cmd, check=True, capture_output=True, text=True).stdout.strip()
+
+def _host_port(cid: str, port: str) -> int:
+    # "0.0.0.0:49153\n[::]:49153" -> 49153
+    return int(_sh("docker", "port", cid, port).splitlines()[0].rsplit(":", 1)[1])
+
+class Standins:
+    def __init__(self):
+        self.ids = []
+        self.env = {}
+
+    def start(self, timeout: float = 60.0):
+        rid = _sh("docker", "run", "-d", "--rm", "-P", REDIS_IMAGE)
+        self.ids.append(rid)
+        pid = _sh("docker", "run", "-d", "--rm", "-P",
+                  "-e", "POSTGRES_USER=app", "-e", "POSTGRES_PASSWORD=app", "-e", "POSTGRES_DB=app",
+                  PG_IMAGE)
+        self.ids.append(pid)
+        deadline = time.time() + timeout
+        while True:
+            ok = subprocess.run(["docker", "exec", pid, "pg_isready", "-U", "app", "-h", "127.0.0.1"],
+                                capture_output=True).returncode == 0
+            if ok:
+                break
+            if time.time() > deadline:
+                self.stop()
+                raise RuntimeError("postgres stand-in did not become ready")
+            time.sleep(0.5)
+        self.env = {
+            "REDIS_HOST": "127.0.0.1", "REDIS_PORT": str(_host_port(rid, "6379/tcp")),
+            "DB_HOST": "127.0.0.1", "DB_PORT": str(_host_port(pid, "5432/tcp")),
+            "DB_USER": "app", "DB_PASS": "app", "DB_NAME": "app",
+        }
+        return self.env
+
+    def stop(self):
+        for cid in self.ids:
+            subprocess.run(["docker", "rm", "-f", cid], capture_output=True)
+        self.ids = []
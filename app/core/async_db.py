@@ -0,0 +1,246 @@
+# Async Postgres DB adapter (psycopg AsyncConnection + async pool), mirrors core.db.DB
+import time
+from contextlib import asynccontextmanager
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from core.instrument import OpTimer, now_ns, elapsed
+from core.db import (
+    SCHEMA, SQL_SCHEMA_LOCK, SCHEMA_LOCK_ID, SQL_SEED, SQL_GET_ITEM, SQL_GET_ITEMS, SQL_GET_STOCK, SQL_PURCHASE,
+    SQL_INSERT_ORDER, SQL_PURCHASE_ORDER, PREPARE_HOT, SQL_LOCK_ITEMS, SQL_PURCHASE_MANY, SQL_INSERT_ORDERS,
+    SQL_ORDERS_STAGE, SQL_COPY_ORDERS_STAGE, SQL_FLUSH_ORDERS_STAGE, ORDER_COLS,
+    SQL_ITEM_META, SQL_PURCHASE_SHARD, SQL_LOCK_SHARDS, SQL_PURCHASE_SHARDS,
+    _dsn, _pool_config, _seed_rows, _merge_lines, _pool_stats, _first_shard, _plan_take,
+)
+
+class AsyncDB:
+    def __init__(self, logger=None, metrics=None):
+        self.log = logger
+        self.metrics = metrics
+        self._op = OpTimer(metrics, "DB_LAT", "DB_OPS")
+        self._stmt = OpTimer(metrics, "DB_STMT_LAT", "DB_STMT_OPS")
+        self.dsn = _dsn()
+        # async pools must be opened from inside the event loop, see open()
+        self.pool = AsyncConnectionPool(
+            self.dsn, check=AsyncConnectionPool.check_connection,
+            name="api-db-async", open=False, **_pool_config()
+        )
+
+    async def open(self):
+        await self.pool.open()
+        await self._init()
+
+    async def close(self):
+        await self.pool.close()
+
+    @asynccontextmanager
+    async def _connect(self):
+        t0 = now_ns()
+        try:
+            async with self.pool.connection() as con:
+                if self.metrics: self.metrics.DB_POOL_ACQUIRE_LAT.observe(elapsed(t0))
+                self._pool_stats()
+                yield con
+        except PoolTimeout:
+            if self.metrics: self.metrics.DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            self._pool_stats()
+
+    def _pool_stats(self):
+        _pool_stats(self.pool, self.metrics)
+
+    async def _init(self):
+        async with self._connect() as con:
+            async with con.cursor() as cur:
+                await cur.execute(SQL_SCHEMA_LOCK, (SCHEMA_LOCK_ID,))
+                await cur.execute(SCHEMA)
+                await cur.execute("SELECT COUNT(*) AS n FROM inventory")
+                n = (await cur.fetchone())["n"]
+                if n == 0:
+                    async with cur.copy(SQL_SEED) as cp:
+                        for row in _seed_rows():
+                            await cp.write_row(row)
+            await con.commit()
+        if self.log: self.log.info(msg="postgres schema ready/seeded")
+
+    # ---- health ----
+    async def health(self):
+        try:
+            with self._op("health"):
+                async with self._connect() as con:
+                    async with con.cursor() as cur:
+                        await cur.execute("SELECT 1")
+                        await cur.fetchone()
+            return True
+        except Exception as e:
+            if self.log: self.log.error(route="/health", msg="db error", err=str(e))
+            return False
+
+    # ---- item retrieval ----
+    async def get_item(self, item_id: int):
+        try:
+            with self._op("get_item"):
+                async with self._connect() as con:
+                    async with con.cursor() as cur:
+                        with self._stmt("get_item"):
+                            await cur.execute(SQL_GET_ITEM, (item_id,), prepare=PREPARE_HOT)
+                            return await cur.fetchone()  # dict or None
+        except Exception as e:
+            if self.log: self.log.error(route="/enquire", msg="db get_item error", err=str(e))
+            return None
+
+    async def get_items(self, item_ids):
+        try:
+            with self._op("get_items"):
+                async with self._connect() as con:
+                    async with con.cursor() as cur:
+                        with self._stmt("get_items"):
+                            await cur.execute(SQL_GET_ITEMS, (list(item_ids),), prepare=PREPARE_HOT)
+                            rows = await cur.fetchall()
+                        return {r["id"]: r for r in rows}
+        except Exception as e:
+            if self.log: self.log.error(route="/enquire", msg="db get_items error", err=str(e))
+            return None
+
+    async def get_stock_by_id(self, item_id: int):
+        try:
+            with self._op("get_stock"):
+                async with self._connect() as con:
+                    async with con.cursor() as cur:
+                        with self._stmt("get_stock"):
+                            await cur.execute(SQL_GET_STOCK, (item_id,), prepare=PREPARE_HOT)
+                            row = await cur.fetchone()
+                        return row["qty"] if row else None
+        except Exception as e:
+            if self.log: self.log.error(route="/enquire", msg="db get_stock error", err=str(e))
+            return None
+
+    # ---- purchase (atomic) ----
+    async def purchase(self, item_id: int, qty: int, record_order: bool = True, shard_key=None):
+        try:
+            with self._op("purchase"):
+                async with self._connect() as con:
+                    async with con.cursor() as cur:
+                        # same pipelined fast path as DB.purchase
+                        with self._stmt("purchase"):
+                            async with con.pipeline():
+                                if record_order:
+                                    await cur.execute(SQL_PURCHASE_ORDER,
+                                                      (qty, item_id, qty, qty, qty, time.time()),
+                                                      prepare=PREPARE_HOT)
+                                else:
+                                    await cur.execute(SQL_PURCHASE, (qty, item_id, qty), prepare=PREPARE_HOT)
+                                await con.commit()
+                            row = await cur.fetchone()
+                        if row:
+                            price_cents, new_qty = int(row["price_cents"]), int(row["qty"])
+                            total = price_cents * qty
+                        else:
+                            price_cents, new_qty = await self._purchase_sharded(cur, item_id, qty, shard_key)
+                            if price_cents is None:
+                                await con.rollback()
+                                return None  # out of stock
+                            total = price_cents * qty
+                            if record_order:
+                                with self._stmt("insert_order"):
+                                    await cur.execute(SQL_INSERT_ORDER,
+                                                      (item_id, qty, price_cents, total, time.time()),
+                                                      prepare=PREPARE_HOT)
+                            await con.commit()
+            return {
+                "order": {
+                    "item_id": item_id, "qty": qty,
+                    "unit_price_cents": price_cents, "total_cents": total
+                },
+                "new_qty": new_qty
+            }
+        except Exception as e:
+            if self.log: self.log.error(route="/checkout", msg="db purchase error", err=str(e))
+            return None
+
+    async def _purchase_sharded(self, cur, item_id: int, qty: int, shard_key):
+        # same contract as DB._purchase_sharded
+        await cur.execute(SQL_ITEM_META, (item_id,), prepare=PREPARE_HOT)
+        meta = await cur.fetchone()
+        if not meta or meta["shards"] <= 1:
+            return None, None
+        n = meta["shards"]
+        with self._stmt("purchase_shard"):
+            await cur.execute(SQL_PURCHASE_SHARD, (qty, item_id, item_id, qty, n, _first_shard(n, shard_key), n),
+                              prepare=PREPARE_HOT)
+            took = await cur.fetchone()
+        if took is None:
+            await cur.execute(SQL_LOCK_ITEMS, ([item_id],))
+            rows = {r["id"]: r for r in await cur.fetchall()}
+            await cur.execute(SQL_LOCK_SHARDS, ([item_id],))
+            short, plan = _plan_take([item_id], {item_id: qty}, rows, await cur.fetchall())
+            if short:
+                return None, None
+            await self._apply_take(cur, plan)
+        await cur.execute(SQL_GET_STOCK, (item_id,), prepare=PREPARE_HOT)
+        return int(meta["price_cents"]), int((await cur.fetchone())["qty"])
+
+    @staticmethod
+    async def _apply_take(cur, plan):
+        base_ids, base_qtys, shard_updates, _ = plan
+        if base_ids:
+            await cur.execute(SQL_PURCHASE_MANY, (base_ids, base_qtys))
+        if shard_updates[0]:
+            await cur.execute(SQL_PURCHASE_SHARDS, shard_updates)
+
+    # ---- bulk purchase (all-or-nothing cart) ----
+    async def purchase_many(self, lines, record_order: bool = True):
+        # same contract as DB.purchase_many
+        ids, want = _merge_lines(lines)
+        try:
+            with self._op("purchase_many"):
+                async with self._connect() as con:
+                    async with con.cursor() as cur:
+                        await cur.execute(SQL_LOCK_ITEMS, (ids,))
+                        rows = {r["id"]: r for r in await cur.fetchall()}
+                        sharded = [i for i in ids if i in rows and rows[i]["shards"] > 1]
+                        shard_rows = []
+                        if sharded:
+                            await cur.execute(SQL_LOCK_SHARDS, (sharded,))
+                            shard_rows = await cur.fetchall()
+                        short, plan = _plan_take(ids, want, rows, shard_rows)
+                        if short:
+                            await con.rollback()
+                            return {"short": short}
+
+                        await self._apply_take(cur, plan)
+                        new_qty = plan[3]
+                        qtys = [want[i] for i in ids]
+                        prices = [int(rows[i]["price_cents"]) for i in ids]
+                        totals = [p * q for p, q in zip(prices, qtys)]
+                        if record_order:
+                            await cur.execute(SQL_INSERT_ORDERS, (time.time(), ids, qtys, prices, totals))
+                    await con.commit()
+            return {
+                "orders": [
+                    {"item_id": i, "qty": q, "unit_price_cents": p, "total_cents": tot}
+                    for i, q, p, tot in zip(ids, qtys, prices, totals)
+                ],
+                "new_qty": new_qty
+            }
+        except Exception as e:
+            if self.log: self.log.error(route="/checkout", msg="db purchase_many error", err=str(e))
+            return None
+
+    # ---- write-behind order ingestion ----
+    async def insert_orders(self, orders):
+        # same contract as DB.insert_orders
+        try:
+            with self._op("insert_orders"):
+                async with self._connect() as con:
+                    async with con.cursor() as cur:
+                        await cur.execute(SQL_ORDERS_STAGE)
+                        async with cur.copy(SQL_COPY_ORDERS_STAGE) as cp:
+                            for o in orders:
+                                await cp.write_row(tuple(o[c] for c in ORDER_COLS))
+                        await cur.execute(SQL_FLUSH_ORDERS_STAGE)
+                        n = cur.rowcount
+                    await con.commit()
+            return n
+        except Exception as e:
+            if self.log: self.log.error(msg="db insert_orders error", n=len(orders), err=str(e))
+            return None
@@ -0,0 +1,260 @@
+# Async Redis client (redis.asyncio), mirrors core.redis_client.RedisClient
+import os, asyncio, uuid
+import redis
+import redis.asyncio as aioredis
+from core.local_cache import LocalCache
+from core.instrument import OpTimer
+from core.redis_client import (
+    RedisClient, RESERVE_STOCK_LUA, ADJUST_STOCK_LUA, RELEASE_LOCK_LUA,
+    STOCK_INVALIDATE_CHANNEL, REFILL_LEASE_MS, ORDER_STREAM,
+)
+
+class AsyncRedisClient:
+    stock_key = RedisClient.stock_key
+    stock_ttl = staticmethod(RedisClient.stock_ttl)
+
+    def __init__(self, logger, metrics):
+        self.log = logger
+        self.metrics = metrics
+        self._op = OpTimer(metrics, "REDIS_LAT", "REDIS_OPS")
+        host = os.getenv("REDIS_HOST","localhost")
+        port = int(os.getenv("REDIS_PORT","6379"))
+        db   = int(os.getenv("REDIS_DB","0"))
+        self._addr = (host, port, db)
+        self.r = aioredis.Redis(
+            host=host, port=port, db=db, decode_responses=True,
+            socket_connect_timeout=0.2, socket_timeout=0.3,
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "256"))
+        )
+        self._reserve_stock = self.r.register_script(RESERVE_STOCK_LUA)
+        self._adjust_stock = self.r.register_script(ADJUST_STOCK_LUA)
+        self._release_lock = self.r.register_script(RELEASE_LOCK_LUA)
+        self._listener = None
+
+        self.l1 = None
+        self._chan = ""
+        l1_ttl_ms = int(os.getenv("STOCK_L1_TTL_MS", "0"))
+        if l1_ttl_ms > 0:
+            self.l1 = LocalCache(
+                max_items=int(os.getenv("STOCK_L1_MAX_ITEMS", "10000")),
+                ttl_sec=l1_ttl_ms / 1000.0, metrics=metrics
+            )
+            self._chan = STOCK_INVALIDATE_CHANNEL
+
+    async def open(self):
+        # preload scripts (best-effort) and start the L1 invalidation listener inside the loop
+        try:
+            for sc in (self._reserve_stock, self._adjust_stock, self._release_lock):
+                await self.r.script_load(sc.script)
+        except redis.exceptions.RedisError as e:
+            self.log.warn(msg="redis script preload failed", err=str(e))
+        if self.l1 is not None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener:
+            self._listener.cancel()
+        await self.r.aclose()
+
+    async def _listen(self):
+        host, port, db = self._addr
+        sub = aioredis.Redis(host=host, port=port, db=db, decode_responses=True,
+                             socket_connect_timeout=0.2, health_check_interval=30)
+        while True:
+            try:
+                pubsub = sub.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(STOCK_INVALIDATE_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self.l1.invalidate(*str(message["data"]).split())
+            except redis.exceptions.RedisError as e:
+                # we may have missed invalidations while disconnected
+                self.log.warn(msg="redis invalidation listener error", err=str(e))
+                self.l1.clear()
+                await asyncio.sleep(1.0)
+
+    def _invalidate_local(self, *keys):
+        if self.l1:
+            self.l1.invalidate(*keys)
+
+    async def ping(self):
+        try:
+            with self._op("ping"):
+                ok = await self.r.ping()
+            return ok
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/health", msg="redis error", err=str(e))
+            return False
+
+    async def get_stock_cached(self, item_id: str):
+        key = self.stock_key(item_id)
+        if self.l1:
+            v = self.l1.get(key)
+            if v is not None:
+                return v
+        try:
+            with self._op("get_stock"):
+                v = await self.r.get(key)
+            if v is None:
+                return None
+            v = int(v)
+            if self.l1:
+                self.l1.set(key, v)
+            return v
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/enquire", msg="redis get error", item_id=item_id, err=str(e))
+            return None
+
+    async def get_stock_cached_many(self, item_ids):
+        out = {}
+        todo = []
+        for i in item_ids:
+            v = self.l1.get(self.stock_key(i)) if self.l1 else None
+            if v is not None:
+                out[i] = v
+            else:
+                todo.append(i)
+        if not todo:
+            return out
+        try:
+            with self._op("get_stock_many"):
+                vals = await self.r.mget([self.stock_key(i) for i in todo])
+            for i, v in zip(todo, vals):
+                out[i] = int(v) if v is not None else None
+                if self.l1 and v is not None:
+                    self.l1.set(self.stock_key(i), out[i])
+            return out
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/enquire", msg="redis mget error", err=str(e))
+            out.update({i: None for i in todo})
+            return out
+
+    async def set_stock_cached(self, item_id: str, qty: int, ttl_sec: int = None):
+        key = self.stock_key(item_id)
+        ttl_sec = ttl_sec or self.stock_ttl()
+        self._invalidate_local(key)
+        try:
+            with self._op("set_stock"):
+                if self._chan:
+                    async with self.r.pipeline(transaction=False) as pipe:
+                        pipe.set(key, qty, ex=ttl_sec)
+                        pipe.publish(self._chan, key)
+                        await pipe.execute()
+                else:
+                    await self.r.set(key, qty, ex=ttl_sec)
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/enquire", msg="redis set error", item_id=item_id, err=str(e))
+
+    async def set_stock_cached_many(self, qty_by_item: dict, ttl_sec: int = None):
+        if not qty_by_item:
+            return True
+        keys = [self.stock_key(i) for i in qty_by_item]
+        self._invalidate_local(*keys)
+        try:
+            with self._op("set_stock_many"):
+                async with self.r.pipeline(transaction=False) as pipe:
+                    for key, qty in zip(keys, qty_by_item.values()):
+                        pipe.set(key, qty, ex=ttl_sec or self.stock_ttl())
+                    if self._chan:
+                        pipe.publish(self._chan, " ".join(keys))
+                    await pipe.execute()
+            return True
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/enquire", msg="redis set_many error", err=str(e))
+            return False
+
+    async def acquire_refill_lease(self, item_id: str):
+        key = f"refill:{item_id}"
+        token = str(uuid.uuid4())
+        try:
+            with self._op("refill_lease") as op:
+                ok = await self.r.set(key, token, nx=True, px=REFILL_LEASE_MS)
+                if not ok:
+                    op.result = "busy"
+            return (ok is True), (token if ok else None)
+        except redis.exceptions.RedisError:
+            return True, None
+
+    async def release_refill_lease(self, item_id: str, token: str):
+        try:
+            with self._op("refill_release"):
+                await self._release_lock(keys=[f"refill:{item_id}"], args=[token])
+        except redis.exceptions.RedisError:
+            pass
+
+    async def decr_stock_cached(self, item_id: str, by: int = 1):
+        key = self.stock_key(item_id)
+        self._invalidate_local(key)
+        try:
+            with self._op("decr_stock"):
+                await self._adjust_stock(keys=[key], args=[-by, self._chan])
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/checkout", msg="redis decr error", item_id=item_id, err=str(e))
+
+    async def decr_stock_cached_many(self, by_item: dict):
+        keys = {item_id: self.stock_key(item_id) for item_id in by_item}
+        self._invalidate_local(*keys.values())
+        try:
+            with self._op("decr_stock_many"):
+                async with self.r.pipeline(transaction=False) as pipe:
+                    for item_id, by in by_item.items():
+                        await self._adjust_stock(keys=[keys[item_id]], args=[-by, self._chan], client=pipe)
+                    await pipe.execute()
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/checkout", msg="redis decr_many error", err=str(e))
+
+    async def reserve_stock(self, item_id: str, qty: int):
+        # same contract as RedisClient.reserve_stock
+        key = self.stock_key(item_id)
+        self._invalidate_local(key)
+        try:
+            with self._op("reserve_stock"):
+                status, n = await self._reserve_stock(keys=[key], args=[qty, self._chan])
+            if status == 1:
+                return "reserved", int(n)
+            if status == 0:
+                return "oos", int(n)
+            return "miss", None
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/checkout", msg="redis reserve error", item_id=item_id, err=str(e))
+            return "miss", None
+
+    async def release_stock(self, item_id: str, qty: int):
+        key = self.stock_key(item_id)
+        self._invalidate_local(key)
+        try:
+            with self._op("release_stock"):
+                await self._adjust_stock(keys=[key], args=[qty, self._chan])
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/checkout", msg="redis release error", item_id=item_id, err=str(e))
+
+    async def enqueue_orders(self, orders):
+        try:
+            with self._op("enqueue_orders"):
+                async with self.r.pipeline(transaction=False) as pipe:
+                    for o in orders:
+                        pipe.xadd(ORDER_STREAM, {k: str(v) for k, v in o.items()})
+                    await pipe.execute()
+            return True
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/checkout", msg="redis enqueue_orders error", err=str(e))
+            return False
+
+    async def acquire_user_item_lock(self, user_id: str, item_id: str, ttl_sec: int = 5):
+        lock_key = f"lock:{user_id}:{item_id}"
+        token = str(uuid.uuid4())
+        try:
+            with self._op("lock_acquire") as op:
+                ok = await self.r.set(lock_key, token, nx=True, ex=ttl_sec)
+                if not ok:
+                    op.result = "busy"
+            return (ok is True), lock_key, token
+        except redis.exceptions.RedisError:
+            return (False, lock_key, None)
+
+    async def release_lock(self, lock_key: str, token: str):
+        try:
+            with self._op("lock_release"):
+                await self._release_lock(keys=[lock_key], args=[token])
+        except redis.exceptions.RedisError:
+            pass
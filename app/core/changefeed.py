@@ -0,0 +1,126 @@
+# Stock change feed: a trigger on inventory / inventory_shards (see SCHEMA in core/db.py)
+# NOTIFYs the id of every item whose stock changes outside the API - restocks, manual
+# fixes, imports run with CHANGEFEED_SKIP_APP_WRITES=0. StockChangeFeed LISTENs on a
+# dedicated connection, collects ids for up to CHANGEFEED_FLUSH_MS and deletes
+# (CHANGEFEED_MODE=invalidate) or rewrites (=update) their stock:<id> keys in one
+# round trip. Update mode is a compare-and-set against the values seen before reading
+# Postgres, so it never undoes a reservation that lands in between. With it running, STOCK_CACHE_TTL_SEC can be raised well past 300s.
+# Runs in-process (STOCK_CHANGEFEED=inproc, one listener per worker - writes are
+# idempotent) or standalone: python -m core.changefeed
+import os, threading
+import psycopg
+from core.db import CHANGEFEED_CHANNEL
+from core.instrument import now_ns, elapsed
+from core.warmup import warm_stock_cache
+
+STOCK_CHANGEFEED = os.getenv("STOCK_CHANGEFEED", "off")  # off | inproc
+CHANGEFEED_MODE = os.getenv("CHANGEFEED_MODE", "invalidate")  # invalidate | update
+CHANGEFEED_BATCH = int(os.getenv("CHANGEFEED_BATCH", "500"))
+CHANGEFEED_FLUSH_MS = int(os.getenv("CHANGEFEED_FLUSH_MS", "100"))
+CHANGEFEED_RETRY_MS = int(os.getenv("CHANGEFEED_RETRY_MS", "1000"))
+# notifications sent while we were disconnected are lost: rescan the table after a reconnect
+CHANGEFEED_RESYNC = os.getenv("CHANGEFEED_RESYNC", "1") == "1"
+
+class StockChangeFeed:
+    """
+    Applies inventory change notifications to the Redis stock cache. Uses the sync
+    RedisClient and DB (also under the async app, on the shared auxiliary clients).
+    """
+    def __init__(self, logger, metrics, redis_client, db):
+        self.log = logger
+        self.metrics = metrics
+        self.redis = redis_client
+        self.db = db
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name="stock-changefeed", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def run_forever(self):
+        connected_before = False
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(self.db.dsn, autocommit=True) as con:
+                    con.execute(f"LISTEN {CHANGEFEED_CHANNEL}")
+                    self.log.info(msg="stock change feed listening", mode=CHANGEFEED_MODE)
+                    if connected_before and CHANGEFEED_RESYNC:
+                        self.resync()
+                    connected_before = True
+                    while not self._stop.is_set():
+                        self.apply(self._next_batch(con))
+            except psycopg.Error as e:
+                self.metrics.child(self.metrics.CHANGEFEED_EVENTS, "error").inc()
+                self.log.error(msg="stock change feed connection error", err=str(e))
+                self._stop.wait(CHANGEFEED_RETRY_MS / 1000.0)
+
+    def _next_batch(self, con):
+        # block until the window closes or the batch fills; Postgres already folds
+        # duplicate ids within one transaction, the set folds them across transactions
+        ids = set()
+        for n in con.notifies(timeout=CHANGEFEED_FLUSH_MS / 1000.0, stop_after=CHANGEFEED_BATCH):
+            try:
+                ids.add(int(n.payload))
+            except ValueError:
+                continue
+        if ids:
+            self.metrics.child(self.metrics.CHANGEFEED_EVENTS, "received").inc(len(ids))
+        return ids
+
+    def apply(self, ids) -> bool:
+        if not ids:
+            return True
+        t0 = now_ns()
+        gone = set(ids)
+        ok = True
+        if CHANGEFEED_MODE == "update":
+            seen = self.redis.get_stock_cached_many(list(ids))
+            rows = self.db.get_items(ids)
+            if rows is None:
+                # can't read the new totals: drop the keys so readers don't keep the old ones
+                rows = {}
+            fresh = {i: int(r["qty"]) for i, r in rows.items()}
+            gone -= fresh.keys()
+            if fresh:
+                n = self.redis.swap_stock_cached_many(fresh, seen)
+                ok = n is not None
+                if ok:
+                    # keys that moved since the snapshot were dropped instead
+                    self.metrics.child(self.metrics.CHANGEFEED_EVENTS, "updated").inc(n)
+                    self.metrics.child(self.metrics.CHANGEFEED_EVENTS, "invalidated").inc(len(fresh) - n)
+                else:
+                    self.metrics.child(self.metrics.CHANGEFEED_EVENTS, "error").inc(len(fresh))
+        if gone:
+            done = self.redis.delete_stock_cached_many(gone)
+            self.metrics.child(self.metrics.CHANGEFEED_EVENTS, "invalidated" if done else "error").inc(len(gone))
+            ok = ok and done
+        self.metrics.CHANGEFEED_LAG.observe(elapsed(t0))
+        return ok
+
+    def resync(self):
+        self.metrics.child(self.metrics.CHANGEFEED_EVENTS, "resync").inc()
+        warm_stock_cache(self.log, self.redis, self.db, lease=False)
+
+if __name__ == "__main__":
+    # standalone consumer: python -m core.changefeed (metrics on CHANGEFEED_METRICS_PORT)
+    from prometheus_client import start_http_server
+    from core.logging import JsonLogger
+    from core.metrics import Metrics
+    from core.redis_client import RedisClient
+    from core.db import DB
+
+    metrics = Metrics()
+    log = JsonLogger(service="stock-changefeed", metrics=metrics)
+    start_http_server(int(os.getenv("CHANGEFEED_METRICS_PORT", "9102")))
+    feed = StockChangeFeed(log, metrics, RedisClient(logger=log, metrics=metrics, l1=False), DB(logger=log, metrics=metrics))
+    try:
+        feed.run_forever()
+    except KeyboardInterrupt:
+        feed.stop()
@@ -1,7 +1,10 @@
 # Postgres DB adapter
-import os, time, random
+import os, time, random, zlib
+from contextlib import contextmanager
 import psycopg
 from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool, PoolTimeout
+from core.instrument import OpTimer, now_ns, elapsed
 
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS inventory(
@@ -19,134 +22,404 @@ CREATE TABLE IF NOT EXISTS orders(
   total_cents INTEGER NOT NULL,
   created_ts DOUBLE PRECISION NOT NULL
 );
+-- idempotency key for write-behind order ingestion (NULL for rows written inline)
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS order_key TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS orders_order_key ON orders(order_key);
+-- sharded stock (see DB.reshard): with shards > 1 the quantity lives in inventory_shards
+-- and inventory.qty only holds what hasn't been spread out yet (normally 0)
+ALTER TABLE inventory ADD COLUMN IF NOT EXISTS shards INTEGER NOT NULL DEFAULT 1;
+CREATE TABLE IF NOT EXISTS inventory_shards(
+  item_id INTEGER NOT NULL REFERENCES inventory(id),
+  shard INTEGER NOT NULL,
+  qty INTEGER NOT NULL CHECK (qty >= 0),
+  PRIMARY KEY (item_id, shard)
+);
+-- change feed (core/changefeed.py): NOTIFY the id of every item whose stock changes,
+-- unless the writing session set aics.skip_notify (the API does; it fixes the cache itself)
+CREATE OR REPLACE FUNCTION inventory_notify() RETURNS trigger AS $$
+BEGIN
+  IF coalesce(current_setting('aics.skip_notify', true), '') <> 'on' THEN
+    PERFORM pg_notify('inventory_changed', to_jsonb(coalesce(NEW, OLD)) ->> TG_ARGV[0]);
+  END IF;
+  RETURN NULL;
+END $$ LANGUAGE plpgsql;
+DO $$ BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'inventory_changed') THEN
+    CREATE TRIGGER inventory_changed AFTER INSERT OR DELETE OR UPDATE OF qty, shards ON inventory
+      FOR EACH ROW EXECUTE FUNCTION inventory_notify('id');
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'inventory_shards_changed') THEN
+    CREATE TRIGGER inventory_shards_changed AFTER INSERT OR DELETE OR UPDATE OF qty ON inventory_shards
+      FOR EACH ROW EXECUTE FUNCTION inventory_notify('item_id');
+  END IF;
+END $$;
 """
+# every worker (and the flusher/warm-up/changefeed clients) runs SCHEMA at start-up;
+# concurrent CREATE OR REPLACE FUNCTION / CREATE TRIGGER fail with "tuple concurrently
+# updated", so _init takes this transaction-scoped advisory lock first
+SCHEMA_LOCK_ID = 0x41494353  # "AICS"
+SQL_SCHEMA_LOCK = "SELECT pg_advisory_xact_lock(%s)"
+CHANGEFEED_CHANNEL = "inventory_changed"
+# API connections don't notify their own writes (set CHANGEFEED_SKIP_APP_WRITES=0 to notify everything)
+CHANGEFEED_SKIP_APP_WRITES = os.getenv("CHANGEFEED_SKIP_APP_WRITES", "1") == "1"
+
+# how checkout picks the first shard to try: user (hash of the user id) | random
+STOCK_SHARD_PICK = os.getenv("STOCK_SHARD_PICK", "user")
+
+# Server-side prepared statements. Pooled connections live for DB_POOL_MAX_LIFETIME, so
+# the hot statements below (get_item/get_items/get_stock, the purchase path, the order
+# insert) are prepared on their first use per connection (DB_PREPARE=1) and the server
+# skips parse/plan afterwards. Anything else is prepared by psycopg after
+# DB_PREPARE_THRESHOLD executions. Behind a transaction-pooling proxy (pgbouncer < 1.21)
+# set DB_PREPARE=0 and DB_PREPARE_THRESHOLD=none.
+DB_PREPARE = os.getenv("DB_PREPARE", "1") == "1"
+PREPARE_HOT = True if DB_PREPARE else None  # execute(prepare=...): None = threshold decides
+
+# Hot statements, shared by DB and AsyncDB (core/async_db.py)
+# total stock of inventory row i; the shard sum is only looked up for sharded items
+QTY_TOTAL = (
+    "CASE WHEN i.shards > 1 THEN i.qty + COALESCE("
+    "(SELECT sum(s.qty) FROM inventory_shards s WHERE s.item_id = i.id), 0)::int ELSE i.qty END"
+)
+SQL_GET_ITEM = f"SELECT i.id, i.name, i.description, i.price_cents, {QTY_TOTAL} AS qty FROM inventory i WHERE i.id=%s"
+SQL_GET_ITEMS = f"SELECT i.id, i.name, i.description, i.price_cents, {QTY_TOTAL} AS qty FROM inventory i WHERE i.id = ANY(%s)"
+SQL_GET_STOCK = f"SELECT {QTY_TOTAL} AS qty FROM inventory i WHERE i.id=%s"
+SQL_SEED = "COPY inventory(id, name, description, price_cents, qty) FROM STDIN"
+# unsharded fast path; sharded items never match and go through SQL_PURCHASE_SHARD
+SQL_PURCHASE = """
+    UPDATE inventory
+       SET qty = qty - %s
+     WHERE id = %s AND qty >= %s AND shards = 1
+ RETURNING price_cents, qty;
+"""
+SQL_ITEM_META = "SELECT price_cents, shards FROM inventory WHERE id=%s"
+# take qty from the first shard, in order from the picked one, that has enough and
+# isn't locked by another checkout right now; no row back -> SQL_LOCK_* slow path
+SQL_PURCHASE_SHARD = """
+    UPDATE inventory_shards AS s
+       SET qty = s.qty - %s
+     WHERE s.item_id = %s AND s.shard = (
+           SELECT shard FROM inventory_shards
+            WHERE item_id = %s AND qty >= %s
+            ORDER BY mod(shard + %s - %s, %s)
+            LIMIT 1 FOR UPDATE SKIP LOCKED)
+ RETURNING s.shard;
+"""
+SQL_INSERT_ORDER = """
+    INSERT INTO orders(item_id, qty, unit_price_cents, total_cents, created_ts)
+    VALUES (%s,%s,%s,%s,%s)
+"""
+# unsharded fast path with the order row in the same statement (one round trip,
+# pipelined with COMMIT); params: qty, id, qty, qty, qty, created_ts
+SQL_PURCHASE_ORDER = """
+    WITH p AS (
+        UPDATE inventory
+           SET qty = qty - %s
+         WHERE id = %s AND qty >= %s AND shards = 1
+     RETURNING id, price_cents, qty
+    ), o AS (
+        INSERT INTO orders(item_id, qty, unit_price_cents, total_cents, created_ts)
+        SELECT id, %s, price_cents, price_cents * %s, %s FROM p
+    )
+    SELECT price_cents, qty FROM p;
+"""
+SQL_LOCK_ITEMS = "SELECT id, price_cents, qty, shards FROM inventory WHERE id = ANY(%s) ORDER BY id FOR UPDATE"
+# always taken after SQL_LOCK_ITEMS (items, then shards) so lock order is the same everywhere
+SQL_LOCK_SHARDS = (
+    "SELECT item_id, shard, qty FROM inventory_shards WHERE item_id = ANY(%s) ORDER BY item_id, shard FOR UPDATE"
+)
+SQL_PURCHASE_MANY = """
+    UPDATE inventory AS i
+       SET qty = i.qty - u.qty
+      FROM unnest(%s::int[], %s::int[]) AS u(id, qty)
+     WHERE i.id = u.id
+ RETURNING i.id, i.qty;
+"""
+SQL_PURCHASE_SHARDS = """
+    UPDATE inventory_shards AS s
+       SET qty = s.qty - u.qty
+      FROM unnest(%s::int[], %s::int[], %s::int[]) AS u(item_id, shard, qty)
+     WHERE s.item_id = u.item_id AND s.shard = u.shard
+"""
+SQL_DELETE_SHARDS = "DELETE FROM inventory_shards WHERE item_id=%s"
+SQL_INSERT_SHARDS = """
+    INSERT INTO inventory_shards(item_id, shard, qty)
+    SELECT %s, u.shard, u.qty FROM unnest(%s::int[], %s::int[]) AS u(shard, qty)
+"""
+SQL_SET_SHARDS = "UPDATE inventory SET qty=%s, shards=%s WHERE id=%s"
+# transaction-local: this transaction's writes fire the change-feed trigger despite skip_notify
+SQL_NOTIFY_ON = "SELECT set_config('aics.skip_notify', 'off', true)"
+# cache warm-up scan (server-side cursor) and bulk inventory import (COPY into a stage, then upsert)
+SQL_SCAN_STOCK = f"SELECT i.id, {QTY_TOTAL} AS qty FROM inventory i"
+SQL_INVENTORY_STAGE = "CREATE TEMP TABLE inventory_stage (LIKE inventory INCLUDING DEFAULTS) ON COMMIT DROP"
+INVENTORY_COLS = "id, name, description, price_cents, qty"
+SQL_COPY_INVENTORY = f"COPY inventory_stage({INVENTORY_COLS}) FROM STDIN"
+SQL_COPY_INVENTORY_CSV = f"COPY inventory_stage({INVENTORY_COLS}) FROM STDIN WITH (FORMAT csv, HEADER true)"
+SQL_STAGED_SHARDED = (
+    "SELECT i.id, i.shards FROM inventory i WHERE i.shards > 1 AND i.id IN (SELECT id FROM inventory_stage)"
+)
+SQL_UNSHARD_STAGED = "DELETE FROM inventory_shards WHERE item_id IN (SELECT id FROM inventory_stage)"
+SQL_UPSERT_INVENTORY = f"""
+    INSERT INTO inventory({INVENTORY_COLS}, shards)
+    SELECT DISTINCT ON (id) {INVENTORY_COLS}, 1 FROM inventory_stage ORDER BY id
+    ON CONFLICT (id) DO UPDATE
+       SET name = EXCLUDED.name, description = EXCLUDED.description,
+           price_cents = EXCLUDED.price_cents, qty = EXCLUDED.qty, shards = 1
+"""
+SQL_INSERT_ORDERS = """
+    INSERT INTO orders(item_id, qty, unit_price_cents, total_cents, created_ts)
+    SELECT u.item_id, u.qty, u.price, u.total, %s
+      FROM unnest(%s::int[], %s::int[], %s::int[], %s::int[])
+        AS u(item_id, qty, price, total)
+"""
+# write-behind flush: COPY into a per-connection staging table, then dedupe on order_key
+SQL_ORDERS_STAGE = """
+    CREATE TEMP TABLE IF NOT EXISTS orders_stage(
+      order_key TEXT, item_id INTEGER, qty INTEGER,
+      unit_price_cents INTEGER, total_cents INTEGER, created_ts DOUBLE PRECISION
+    ) ON COMMIT DELETE ROWS
+"""
+SQL_COPY_ORDERS_STAGE = (
+    "COPY orders_stage(order_key, item_id, qty, unit_price_cents, total_cents, created_ts) FROM STDIN"
+)
+SQL_FLUSH_ORDERS_STAGE = """
+    INSERT INTO orders(order_key, item_id, qty, unit_price_cents, total_cents, created_ts)
+    SELECT order_key, item_id, qty, unit_price_cents, total_cents, created_ts FROM orders_stage
+    ON CONFLICT (order_key) DO NOTHING
+"""
+ORDER_COLS = ("order_key", "item_id", "qty", "unit_price_cents", "total_cents", "created_ts")
 
 def _env(name, default=None, alt=None):
     return os.getenv(name, os.getenv(alt, default) if alt else default)
 
+def _dsn():
+    user = _env("DB_USER", default="app", alt="POSTGRES_USER")
+    pwd  = _env("DB_PASS", default="app", alt="POSTGRES_PASSWORD")
+    host = _env("DB_HOST", default="postgres")
+    port = _env("DB_PORT", default="5432")
+    name = _env("DB_NAME", default=_env("POSTGRES_DB", default="postgres"))
+    return _env("DB_DSN", f"postgresql://{user}:{pwd}@{host}:{port}/{name}")
+
+def _prepare_threshold():
+    v = _env("DB_PREPARE_THRESHOLD", "5")
+    return None if v.lower() in ("none", "off", "") else int(v)
+
+def _pool_config():
+    # check= pings a connection before handing it out so broken ones get evicted,
+    # max_idle/max_lifetime recycle connections the server or a proxy may have dropped.
+    return dict(
+        min_size=int(_env("DB_POOL_MIN", "1")),
+        max_size=int(_env("DB_POOL_MAX", "5")),
+        timeout=float(_env("DB_POOL_TIMEOUT", "2")),
+        max_idle=float(_env("DB_POOL_MAX_IDLE", "300")),
+        max_lifetime=float(_env("DB_POOL_MAX_LIFETIME", "1800")),
+        kwargs=dict(
+            autocommit=False, row_factory=dict_row, prepare_threshold=_prepare_threshold(),
+            **({"options": "-c aics.skip_notify=on"} if CHANGEFEED_SKIP_APP_WRITES else {})
+        ),
+    )
+
+def _seed_rows():
+    # (id, name, description, price_cents, qty) tuples for SQL_SEED
+    rows = []
+    for i in range(1, 101):
+        rows.append((
+            i,
+            f"Item-{i:03d}",
+            f"Demo item {i} description",
+            random.choice([999,1299,1999,2999,4999,129900]),
+            random.randint(5,50),
+        ))
+    return rows
+
+def _merge_lines(lines):
+    # cart lines -> (sorted ids, {id: total qty}); sorted so row locks are taken in id order
+    want = {}
+    for iid, q in lines:
+        want[iid] = want.get(iid, 0) + q
+    return sorted(want), want
+
+def _first_shard(shards: int, shard_key=None) -> int:
+    if STOCK_SHARD_PICK == "user" and shard_key is not None:
+        return zlib.crc32(str(shard_key).encode()) % shards
+    return random.randrange(shards)
+
+def _plan_take(ids, want, rows, shard_rows):
+    """
+    Locked slow path for carts and fragmented sharded stock: take each item's qty
+    from inventory.qty first, then its shards in order. rows/shard_rows are the
+    SQL_LOCK_ITEMS / SQL_LOCK_SHARDS results. Returns (short_ids, None) or
+    (None, (base_ids, base_qtys, shard_updates, new_qty)); shard_updates is the
+    (item_ids, shards, qtys) triple for SQL_PURCHASE_SHARDS.
+    """
+    by_item = {}
+    for r in shard_rows:
+        by_item.setdefault(r["item_id"], []).append(r)
+    avail = {i: rows[i]["qty"] + sum(r["qty"] for r in by_item.get(i, ())) for i in rows}
+    short = [i for i in ids if i not in rows or avail[i] < want[i]]
+    if short:
+        return short, None
+    base_ids, base_qtys, upd = [], [], ([], [], [])
+    for i in ids:
+        need = want[i]
+        take = min(need, rows[i]["qty"])
+        if take:
+            base_ids.append(i)
+            base_qtys.append(take)
+            need -= take
+        for r in by_item.get(i, ()):
+            if not need:
+                break
+            take = min(need, r["qty"])
+            if take:
+                upd[0].append(i); upd[1].append(r["shard"]); upd[2].append(take)
+                need -= take
+    return None, (base_ids, base_qtys, upd, {i: avail[i] - want[i] for i in ids})
+
+def _split(total: int, shards: int):
+    # even split, remainder on the first shards
+    q, rem = divmod(total, shards)
+    return [q + (1 if n < rem else 0) for n in range(shards)]
+
+def _pool_stats(pool, metrics):
+    if not metrics:
+        return
+    st = pool.get_stats()
+    size = st.get("pool_size", 0)
+    metrics.DB_POOL_SIZE.set(size)
+    metrics.DB_POOL_IN_USE.set(size - st.get("pool_available", 0))
+    metrics.DB_POOL_WAITING.set(st.get("requests_waiting", 0))
+
 class DB:
     def __init__(self, logger=None, metrics=None):
         self.log = logger
         self.metrics = metrics
-        user = _env("DB_USER", default="app", alt="POSTGRES_USER")
-        pwd  = _env("DB_PASS", default="app", alt="POSTGRES_PASSWORD")
-        host = _env("DB_HOST", default="postgres")
-        port = _env("DB_PORT", default="5432")
-        name = _env("DB_NAME", default=_env("POSTGRES_DB", default="postgres"))
-        self.dsn = _env("DB_DSN", f"postgresql://{user}:{pwd}@{host}:{port}/{name}")
+        self._op = OpTimer(metrics, "DB_LAT", "DB_OPS")
+        self._stmt = OpTimer(metrics, "DB_STMT_LAT", "DB_STMT_OPS")
+        self.dsn = _dsn()
+        # One bounded pool per worker process (gunicorn imports the app after fork).
+        self.pool = ConnectionPool(
+            self.dsn, check=ConnectionPool.check_connection,
+            name="api-db", open=True, **_pool_config()
+        )
         self._init()
 
+    @contextmanager
     def _connect(self):
-        return psycopg.connect(self.dsn, autocommit=False, row_factory=dict_row)
+        # borrow a pooled connection; commits on clean exit, rolls back on error
+        t0 = now_ns()
+        try:
+            with self.pool.connection() as con:
+                if self.metrics: self.metrics.DB_POOL_ACQUIRE_LAT.observe(elapsed(t0))
+                self._pool_stats()
+                yield con
+        except PoolTimeout:
+            if self.metrics: self.metrics.DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            self._pool_stats()
+
+    def _pool_stats(self):
+        _pool_stats(self.pool, self.metrics)
+
+    def close(self):
+        self.pool.close()
 
     def _init(self):
         with self._connect() as con:
             with con.cursor() as cur:
+                cur.execute(SQL_SCHEMA_LOCK, (SCHEMA_LOCK_ID,))
                 cur.execute(SCHEMA)
                 cur.execute("SELECT COUNT(*) AS n FROM inventory")
                 n = cur.fetchone()["n"]
                 if n == 0:
-                    rows = []
-                    for i in range(1, 101):
-                        rows.append({
-                            "id": i,
-                            "name": f"Item-{i:03d}",
-                            "description": f"Demo item {i} description",
-                            "price_cents": random.choice([999,1299,1999,2999,4999,129900]),
-                            "qty": random.randint(5,50),
-                        })
-                    cur.executemany(
-                        "INSERT INTO inventory(id,name,description,price_cents,qty) "
-                        "VALUES(%(id)s,%(name)s,%(description)s,%(price_cents)s,%(qty)s)", rows
-                    )
+                    with cur.copy(SQL_SEED) as cp:
+                        for row in _seed_rows():
+                            cp.write_row(row)
             con.commit()
         if self.log: self.log.info(msg="postgres schema ready/seeded")
 
     # ---- health ----
     def health(self):
-        t0 = time.time()
         try:
-            with self._connect() as con:
+            with self._op("health"), self._connect() as con:
                 with con.cursor() as cur:
                     cur.execute("SELECT 1")
                     cur.fetchone()
-            if self.metrics:
-                self.metrics.DB_LAT.labels("health").observe(time.time()-t0)
-                self.metrics.DB_OPS.labels("health","ok").inc()
             return True
         except Exception as e:
-            if self.metrics: self.metrics.DB_OPS.labels("health","error").inc()
             if self.log: self.log.error(route="/health", msg="db error", err=str(e))
             return False
 
     # ---- item retrieval ----
     def get_item(self, item_id: int):
-        t0 = time.time()
         try:
-            with self._connect() as con:
+            with self._op("get_item"), self._connect() as con:
                 with con.cursor() as cur:
-                    cur.execute(
-                        "SELECT id, name, description, price_cents, qty FROM inventory WHERE id=%s",
-                        (item_id,)
-                    )
-                    row = cur.fetchone()
-            if self.metrics:
-                self.metrics.DB_LAT.labels("get_item").observe(time.time()-t0)
-                self.metrics.DB_OPS.labels("get_item","ok").inc()
-            return row  # dict or None
+                    with self._stmt("get_item"):
+                        cur.execute(SQL_GET_ITEM, (item_id,), prepare=PREPARE_HOT)
+                        return cur.fetchone()  # dict or None
         except Exception as e:
-            if self.metrics: self.metrics.DB_OPS.labels("get_item","error").inc()
             if self.log: self.log.error(route="/enquire", msg="db get_item error", err=str(e))
             return None
 
+    def get_items(self, item_ids):
+        # one round trip for a whole listing page; returns {id: row} for ids that exist
+        try:
+            with self._op("get_items"), self._connect() as con:
+                with con.cursor() as cur:
+                    with self._stmt("get_items"):
+                        cur.execute(SQL_GET_ITEMS, (list(item_ids),), prepare=PREPARE_HOT)
+                        rows = cur.fetchall()
+                    return {r["id"]: r for r in rows}
+        except Exception as e:
+            if self.log: self.log.error(route="/enquire", msg="db get_items error", err=str(e))
+            return None
+
     def get_stock_by_id(self, item_id: int):
-        t0 = time.time()
         try:
-            with self._connect() as con:
+            with self._op("get_stock"), self._connect() as con:
                 with con.cursor() as cur:
-                    cur.execute("SELECT qty FROM inventory WHERE id=%s", (item_id,))
-                    row = cur.fetchone()
-                    qty = row["qty"] if row else None
-            if self.metrics:
-                self.metrics.DB_LAT.labels("get_stock").observe(time.time()-t0)
-                self.metrics.DB_OPS.labels("get_stock","ok").inc()
-            return qty
+                    with self._stmt("get_stock"):
+                        cur.execute(SQL_GET_STOCK, (item_id,), prepare=PREPARE_HOT)
+                        row = cur.fetchone()
+                    return row["qty"] if row else None
         except Exception as e:
-            if self.metrics: self.metrics.DB_OPS.labels("get_stock","error").inc()
             if self.log: self.log.error(route="/enquire", msg="db get_stock error", err=str(e))
             return None
 
     # ---- purchase (atomic) ----
-    def purchase(self, item_id: int, qty: int):
-        t0 = time.time()
+    def purchase(self, item_id: int, qty: int, record_order: bool = True, shard_key=None):
+        # shard_key (the user id) picks the first shard to try for sharded items
         try:
-            with self._connect() as con:
+            with self._op("purchase"), self._connect() as con:
                 with con.cursor() as cur:
-                    cur.execute("""
-                        UPDATE inventory
-                           SET qty = qty - %s
-                         WHERE id = %s AND qty >= %s
-                     RETURNING price_cents, qty;
-                    """, (qty, item_id, qty))
-                    row = cur.fetchone()
-                    if not row:
-                        con.rollback()
-                        if self.metrics:
-                            self.metrics.DB_LAT.labels("purchase").observe(time.time()-t0)
-                            self.metrics.DB_OPS.labels("purchase","ok").inc()
-                        return None  # out of stock
-
-                    price_cents, new_qty = int(row["price_cents"]), int(row["qty"])
-                    total = price_cents * qty
-                    cur.execute("""
-                        INSERT INTO orders(item_id, qty, unit_price_cents, total_cents, created_ts)
-                        VALUES (%s,%s,%s,%s,%s)
-                    """, (item_id, qty, price_cents, total, time.time()))
-                con.commit()
-
-            if self.metrics:
-                self.metrics.DB_LAT.labels("purchase").observe(time.time()-t0)
-                self.metrics.DB_OPS.labels("purchase","ok").inc()
+                    # fast path: UPDATE (+ order INSERT) and COMMIT in one pipelined round
+                    # trip; when it matches nothing it changed nothing, so the commit is harmless
+                    # record_order=False: write-behind mode, OrderQueue persists the row later
+                    with self._stmt("purchase"):
+                        with con.pipeline():
+                            if record_order:
+                                cur.execute(SQL_PURCHASE_ORDER, (qty, item_id, qty, qty, qty, time.time()),
+                                            prepare=PREPARE_HOT)
+                            else:
+                                cur.execute(SQL_PURCHASE, (qty, item_id, qty), prepare=PREPARE_HOT)
+                            con.commit()
+                        row = cur.fetchone()
+                    if row:
+                        price_cents, new_qty = int(row["price_cents"]), int(row["qty"])
+                        total = price_cents * qty
+                    else:
+                        price_cents, new_qty = self._purchase_sharded(cur, item_id, qty, shard_key)
+                        if price_cents is None:
+                            con.rollback()
+                            return None  # out of stock
+                        total = price_cents * qty
+                        if record_order:
+                            with self._stmt("insert_order"):
+                                cur.execute(SQL_INSERT_ORDER, (item_id, qty, price_cents, total, time.time()),
+                                            prepare=PREPARE_HOT)
+                        con.commit()
             return {
                 "order": {
                     "item_id": item_id, "qty": qty,
@@ -155,6 +428,182 @@ class DB:
                 "new_qty": new_qty
             }
         except Exception as e:
-            if self.metrics: self.metrics.DB_OPS.labels("purchase","error").inc()
             if self.log: self.log.error(route="/checkout", msg="db purchase error", err=str(e))
             return None
+
+    def _purchase_sharded(self, cur, item_id: int, qty: int, shard_key):
+        # -> (price_cents, new_total_qty), or (None, None) when out of stock
+        cur.execute(SQL_ITEM_META, (item_id,), prepare=PREPARE_HOT)
+        meta = cur.fetchone()
+        if not meta or meta["shards"] <= 1:
+            return None, None
+        n = meta["shards"]
+        with self._stmt("purchase_shard"):
+            cur.execute(SQL_PURCHASE_SHARD, (qty, item_id, item_id, qty, n, _first_shard(n, shard_key), n),
+                        prepare=PREPARE_HOT)
+            took = cur.fetchone()
+        if took is None:
+            # no single free shard has enough: lock the item and take across its shards
+            cur.execute(SQL_LOCK_ITEMS, ([item_id],))
+            rows = {r["id"]: r for r in cur.fetchall()}
+            cur.execute(SQL_LOCK_SHARDS, ([item_id],))
+            short, plan = _plan_take([item_id], {item_id: qty}, rows, cur.fetchall())
+            if short:
+                return None, None
+            self._apply_take(cur, plan)
+        cur.execute(SQL_GET_STOCK, (item_id,), prepare=PREPARE_HOT)
+        return int(meta["price_cents"]), int(cur.fetchone()["qty"])
+
+    @staticmethod
+    def _apply_take(cur, plan):
+        base_ids, base_qtys, shard_updates, _ = plan
+        if base_ids:
+            cur.execute(SQL_PURCHASE_MANY, (base_ids, base_qtys))
+        if shard_updates[0]:
+            cur.execute(SQL_PURCHASE_SHARDS, shard_updates)
+
+    # ---- bulk purchase (all-or-nothing cart) ----
+    def purchase_many(self, lines, record_order: bool = True):
+        """
+        lines: [(item_id, qty), ...]; duplicate ids are merged.
+        Rows are locked in id order (then shard rows of sharded items) so concurrent
+        carts can't deadlock each other.
+        Returns {"orders": [...], "new_qty": {id: qty}}, {"short": [ids]} when any
+        line lacks stock (nothing is written), or None on DB error.
+        """
+        ids, want = _merge_lines(lines)
+        try:
+            with self._op("purchase_many"), self._connect() as con:
+                with con.cursor() as cur:
+                    cur.execute(SQL_LOCK_ITEMS, (ids,))
+                    rows = {r["id"]: r for r in cur.fetchall()}
+                    sharded = [i for i in ids if i in rows and rows[i]["shards"] > 1]
+                    shard_rows = []
+                    if sharded:
+                        cur.execute(SQL_LOCK_SHARDS, (sharded,))
+                        shard_rows = cur.fetchall()
+                    short, plan = _plan_take(ids, want, rows, shard_rows)
+                    if short:
+                        con.rollback()
+                        return {"short": short}
+
+                    self._apply_take(cur, plan)
+                    new_qty = plan[3]
+                    qtys = [want[i] for i in ids]
+                    prices = [int(rows[i]["price_cents"]) for i in ids]
+                    totals = [p * q for p, q in zip(prices, qtys)]
+                    if record_order:
+                        cur.execute(SQL_INSERT_ORDERS, (time.time(), ids, qtys, prices, totals))
+                con.commit()
+            return {
+                "orders": [
+                    {"item_id": i, "qty": q, "unit_price_cents": p, "total_cents": tot}
+                    for i, q, p, tot in zip(ids, qtys, prices, totals)
+                ],
+                "new_qty": new_qty
+            }
+        except Exception as e:
+            if self.log: self.log.error(route="/checkout", msg="db purchase_many error", err=str(e))
+            return None
+
+    # ---- stock sharding (admin, see manage.py) ----
+    def reshard(self, item_id: int, shards: int = None):
+        """
+        Re-split an item's total stock evenly over `shards` buckets online (1 folds
+        it back into inventory.qty; None keeps the current count, i.e. rebalances).
+        Checkouts wait on the row locks for the length of this transaction only.
+        Notifies the change feed even on API connections; imports don't (one NOTIFY per
+        row), manage.py warms the cache after them instead.
+        Returns {"item_id", "shards", "qty", "split"} or None.
+        """
+        try:
+            with self._op("reshard"), self._connect() as con:
+                with con.cursor() as cur:
+                    cur.execute(SQL_NOTIFY_ON)
+                    cur.execute(SQL_LOCK_ITEMS, ([item_id],))
+                    row = cur.fetchone()
+                    if not row:
+                        con.rollback()
+                        return None
+                    n = max(1, int(shards or row["shards"]))
+                    cur.execute(SQL_LOCK_SHARDS, ([item_id],))
+                    total = row["qty"] + sum(r["qty"] for r in cur.fetchall())
+                    split = _split(total, n) if n > 1 else []
+                    cur.execute(SQL_DELETE_SHARDS, (item_id,))
+                    if split:
+                        cur.execute(SQL_INSERT_SHARDS, (item_id, list(range(n)), split))
+                    cur.execute(SQL_SET_SHARDS, (0 if split else total, n, item_id))
+                con.commit()
+            return {"item_id": item_id, "shards": n, "qty": total, "split": split or [total]}
+        except Exception as e:
+            if self.log: self.log.error(msg="db reshard error", item_id=item_id, err=str(e))
+            return None
+
+    # ---- cache warm-up / bulk import (admin, see core/warmup.py and manage.py) ----
+    def iter_stock(self, batch_size: int = 1000):
+        """
+        Streams [(id, total_qty), ...] batches through a server-side cursor, so
+        memory stays flat whatever the table size. Errors propagate to the caller.
+        """
+        with self._connect() as con:
+            with con.cursor(name="stock_scan") as cur:
+                cur.itersize = batch_size
+                cur.execute(SQL_SCAN_STOCK)
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield [(r["id"], int(r["qty"])) for r in rows]
+
+    def import_inventory(self, source, fmt: str = "csv"):
+        """
+        Bulk upsert of inventory rows with COPY. fmt="csv": source is a binary file
+        with a header row and columns id,name,description,price_cents,qty, streamed
+        as-is. fmt="rows": source is an iterable of those 5-tuples. Imported items
+        are reset to unsharded; returns {"rows": n, "sharded": {id: old_shards}}
+        so the caller can reshard them again, or None on error.
+        """
+        try:
+            with self._op("import_inventory"), self._connect() as con:
+                with con.cursor() as cur:
+                    cur.execute(SQL_INVENTORY_STAGE)
+                    if fmt == "csv":
+                        with cur.copy(SQL_COPY_INVENTORY_CSV) as cp:
+                            while chunk := source.read(1 << 20):
+                                cp.write(chunk)
+                    else:
+                        with cur.copy(SQL_COPY_INVENTORY) as cp:
+                            for row in source:
+                                cp.write_row(row)
+                    cur.execute(SQL_STAGED_SHARDED)
+                    sharded = {r["id"]: r["shards"] for r in cur.fetchall()}
+                    cur.execute(SQL_UNSHARD_STAGED)
+                    cur.execute(SQL_UPSERT_INVENTORY)
+                    n = cur.rowcount
+                con.commit()
+            return {"rows": n, "sharded": sharded}
+        except Exception as e:
+            if self.log: self.log.error(msg="db import_inventory error", err=str(e))
+            return None
+
+    # ---- write-behind order ingestion ----
+    def insert_orders(self, orders):
+        """
+        Bulk, idempotent insert of queued orders (dicts with ORDER_COLS).
+        COPY into a staging table then INSERT ... ON CONFLICT (order_key) DO NOTHING,
+        so replays after a crash don't duplicate rows. Returns rows inserted or None.
+        """
+        try:
+            with self._op("insert_orders"), self._connect() as con:
+                with con.cursor() as cur:
+                    cur.execute(SQL_ORDERS_STAGE)
+                    with cur.copy(SQL_COPY_ORDERS_STAGE) as cp:
+                        for o in orders:
+                            cp.write_row(tuple(o[c] for c in ORDER_COLS))
+                    cur.execute(SQL_FLUSH_ORDERS_STAGE)
+                    n = cur.rowcount
+                con.commit()
+            return n
+        except Exception as e:
+            if self.log: self.log.error(msg="db insert_orders error", n=len(orders), err=str(e))
+            return None
@@ -1,16 +1,161 @@
+import asyncio, os, threading, time
+from core import instrument
+from core.instrument import now_ns, elapsed
+
+# Readiness is probed by a background checker every HEALTH_INTERVAL_MS and /health
+# answers from the last result (0 = probe inline on every /health, as before).
+HEALTH_INTERVAL_MS = int(os.getenv("HEALTH_INTERVAL_MS", "2000"))
+# hysteresis: consecutive bad probes before a dependency goes down, good ones before it comes back
+# (background mode only; inline probes report each result as is)
+HEALTH_FAIL_THRESHOLD = int(os.getenv("HEALTH_FAIL_THRESHOLD", "3"))
+HEALTH_RECOVER_THRESHOLD = int(os.getenv("HEALTH_RECOVER_THRESHOLD", "2"))
+# a probe that succeeds but takes longer than this counts as bad
+HEALTH_SLOW_MS = float(os.getenv("HEALTH_SLOW_MS", "1000"))
+# a result older than this means the checker itself is stuck: report not ready
+HEALTH_STALE_MS = int(os.getenv("HEALTH_STALE_MS", str(max(5 * HEALTH_INTERVAL_MS, 10000))))
+
+class _Dep:
+    __slots__ = ("up", "latency_ms", "checked_at", "fails", "oks")
+
+    def __init__(self):
+        self.up = None  # unknown until the first probe
+        self.latency_ms = None
+        self.checked_at = None
+        self.fails = 0
+        self.oks = 0
+
+    def record(self, ok: bool, latency_ms: float, inline: bool = False):
+        if not inline:
+            ok = ok and latency_ms <= HEALTH_SLOW_MS
+        self.latency_ms = round(latency_ms, 3)
+        self.checked_at = time.time()
+        if ok:
+            self.oks, self.fails = self.oks + 1, 0
+        else:
+            self.fails, self.oks = self.fails + 1, 0
+        if inline or self.up is None:
+            self.up = ok
+        elif self.up and self.fails >= HEALTH_FAIL_THRESHOLD:
+            self.up = False
+        elif not self.up and self.oks >= HEALTH_RECOVER_THRESHOLD:
+            self.up = True
+
+    def view(self):
+        return {"up": bool(self.up), "latency_ms": self.latency_ms,
+                "checked_at": self.checked_at, "consecutive_failures": self.fails}
+
 class HealthChecker:
     def __init__(self, logger, metrics, redis_client, db):
         self.log = logger
         self.metrics = metrics
         self.redis = redis_client
         self.db = db
+        self._deps = {"redis": _Dep(), "db": _Dep()}
+        self._snapshot = None
+        self._stop = threading.Event()
+        self._thread = None
 
+    @instrument.route("/live")
     def liveness(self):
         # Right now I think just hitting this would be enough
-        return {"ok": True}
+        return {"ok": True}, 200
+
+    def _probes(self):
+        return (("redis", self.redis.ping), ("db", self.db.health))
+
+    def _publish(self):
+        # build the /health body once per probe round; readers only copy it
+        deps = {name: d.view() for name, d in self._deps.items()}
+        ok = all(d["up"] for d in deps.values())
+        snap = {"ok": ok, "checked_at": time.time(), "deps": deps}
+        snap.update({name: "up" if d["up"] else "down" for name, d in deps.items()})
+        for name, d in deps.items():
+            self.metrics.child(self.metrics.DEP_UP, name).set(1 if d["up"] else 0)
+        self._snapshot = snap
+
+    def refresh(self):
+        for name, probe in self._probes():
+            t0 = now_ns()
+            try:
+                ok = bool(probe())
+            except Exception:
+                ok = False
+            self._deps[name].record(ok, elapsed(t0) * 1000, inline=HEALTH_INTERVAL_MS <= 0)
+        self._publish()
+
+    def start(self):
+        if HEALTH_INTERVAL_MS <= 0:
+            return self
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name="health-checker", daemon=True)
+        self._thread.start()
+        return self
 
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(HEALTH_INTERVAL_MS / 1000.0):
+            try:
+                self.refresh()
+            except Exception as e:
+                self.log.error(msg="health checker error", err=str(e))
+
+    def _view(self):
+        snap = self._snapshot
+        age_ms = (time.time() - snap["checked_at"]) * 1000
+        stale = age_ms > HEALTH_STALE_MS
+        ok = snap["ok"] and not stale
+        return dict(snap, ok=ok, age_ms=round(age_ms, 1), stale=stale), (200 if ok else 503)
+
+    @instrument.route("/health")
     def readiness(self):
-        r_ok = self.redis.ping()
-        d_ok = self.db.health()
-        ok = bool(r_ok and d_ok)
-        return {"ok": ok, "redis": "up" if r_ok else "down", "db": "up" if d_ok else "down"}, (200 if ok else 503)
+        if self._thread is None:
+            self.refresh()
+        return self._view()
+
+class AsyncHealthChecker(HealthChecker):
+    # async serving mode: probe Redis and Postgres concurrently from a loop task
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._task = None
+
+    async def _timed(self, probe):
+        t0 = now_ns()
+        try:
+            ok = bool(await probe())
+        except Exception:
+            ok = False
+        return ok, elapsed(t0) * 1000
+
+    async def refresh(self):
+        probes = self._probes()
+        results = await asyncio.gather(*(self._timed(p) for _, p in probes))
+        for (name, _), (ok, ms) in zip(probes, results):
+            self._deps[name].record(ok, ms, inline=HEALTH_INTERVAL_MS <= 0)
+        self._publish()
+
+    async def start(self):
+        if HEALTH_INTERVAL_MS <= 0:
+            return self
+        await self.refresh()
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(HEALTH_INTERVAL_MS / 1000.0)
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.log.error(msg="health checker error", err=str(e))
+
+    @instrument.route("/health")
+    async def readiness(self):
+        if self._task is None:
+            await self.refresh()
+        return self._view()
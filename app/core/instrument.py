@@ -0,0 +1,103 @@
+# Request / dependency instrumentation, used by the services and the Redis/DB clients.
+# Monotonic perf_counter_ns timing; label children are resolved once through
+# Metrics.child() and reused, so the hot path is a dict lookup + observe/inc.
+import asyncio, functools, time
+
+now_ns = time.perf_counter_ns
+_NS = 1e-9
+
+def elapsed(t0_ns: int) -> float:
+    # seconds since a perf_counter_ns() reading
+    return (now_ns() - t0_ns) * _NS
+
+class _Op:
+    __slots__ = ("_m", "_lat", "_ops", "_op", "_t0", "result")
+
+    def __init__(self, m, lat, ops, op):
+        self._m, self._lat, self._ops, self._op = m, lat, ops, op
+        self.result = "ok"
+
+    def __enter__(self):
+        self._t0 = now_ns()
+        return self
+
+    def __exit__(self, et, e, tb):
+        # latency on success only (as before); exceptions count as error and propagate
+        if et is None:
+            self._m.child(self._lat, self._op).observe(elapsed(self._t0))
+            self._m.child(self._ops, self._op, self.result).inc()
+        else:
+            self._m.child(self._ops, self._op, "error").inc()
+        return False
+
+class _NoOp:
+    __slots__ = ("result",)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, et, e, tb):
+        return False
+
+class OpTimer:
+    """
+    Dependency call timer over a latency histogram / ops counter pair of Metrics,
+    e.g. OpTimer(metrics, "DB_LAT", "DB_OPS"). `with ops("get_item") as op: ...`
+    observes LAT[op] and counts OPS[op, op.result] ("ok" unless the block sets
+    e.g. "busy"), or OPS[op, "error"] if the block raises. No-op without metrics.
+    """
+    def __init__(self, metrics, lat: str, ops: str):
+        self._m = metrics
+        self._lat = getattr(metrics, lat, None)
+        self._ops = getattr(metrics, ops, None)
+
+    def __call__(self, op: str):
+        if self._m is None:
+            return _NoOp()
+        return _Op(self._m, self._lat, self._ops, op)
+
+class Span:
+    # one phase of a request, e.g. ("/checkout", "db"); observed even if the block raises
+    __slots__ = ("_child", "_t0")
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._t0 = now_ns()
+        return self
+
+    def __exit__(self, et, e, tb):
+        self._child.observe(elapsed(self._t0))
+        return False
+
+def route(name: str):
+    """
+    Decorator for service handlers returning (body, code): records LAT[name] and
+    REQS[name, code] once per call, 502 if the handler raises. Works on sync and
+    async methods of objects with a `metrics` attribute.
+    """
+    def deco(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(self, *a, **kw):
+                t0, code = now_ns(), 502
+                try:
+                    res = await fn(self, *a, **kw)
+                    code = res[1]
+                    return res
+                finally:
+                    self.metrics.record_request(name, code, elapsed(t0))
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(self, *a, **kw):
+            t0, code = now_ns(), 502
+            try:
+                res = fn(self, *a, **kw)
+                code = res[1]
+                return res
+            finally:
+                self.metrics.record_request(name, code, elapsed(t0))
+        return wrapper
+    return deco
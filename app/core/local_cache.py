@@ -0,0 +1,57 @@
+import threading, time
+from collections import OrderedDict
+
+class LocalCache:
+    """
+    Per-worker L1 cache: size-bounded LRU with a short TTL.
+    Sits in front of Redis for the hottest stock keys; entries are dropped on
+    expiry, on LRU eviction, or when a writer invalidates them.
+    """
+    def __init__(self, max_items: int = 10000, ttl_sec: float = 1.0, metrics=None):
+        self.max_items = max_items
+        self.ttl = ttl_sec
+        self.metrics = metrics
+        self._d = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def _count(self, result: str, n: int = 1):
+        if self.metrics and n:
+            self.metrics.child(self.metrics.L1_OPS, result).inc(n)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._d.get(key)
+            if hit is not None and hit[0] > now:
+                self._d.move_to_end(key)
+                value = hit[1]
+            else:
+                if hit is not None:
+                    del self._d[key]
+                value = None
+        self._count("hit" if value is not None else "miss")
+        return value
+
+    def set(self, key, value):
+        evicted = 0
+        with self._lock:
+            self._d[key] = (time.monotonic() + self.ttl, value)
+            self._d.move_to_end(key)
+            while len(self._d) > self.max_items:
+                self._d.popitem(last=False)
+                evicted += 1
+        self._count("eviction", evicted)
+
+    def invalidate(self, *keys):
+        n = 0
+        with self._lock:
+            for k in keys:
+                if self._d.pop(k, None) is not None:
+                    n += 1
+        self._count("invalidate", n)
+
+    def clear(self):
+        with self._lock:
+            n = len(self._d)
+            self._d.clear()
+        self._count("invalidate", n)
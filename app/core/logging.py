@@ -1,16 +1,130 @@
-import sys, json, time
+import os, sys, json, time, random, queue, threading, atexit
+
+try:  # optional faster serializer
+    import orjson
+except ImportError:
+    orjson = None
+
+# LOG_MODE=sync writes + flushes inline (default); async hands records to a writer thread
+LOG_MODE = os.getenv("LOG_MODE", "sync")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_QUEUE_POLICY = os.getenv("LOG_QUEUE_POLICY", "drop")  # drop | block
+LOG_BLOCK_MS = int(os.getenv("LOG_BLOCK_MS", "50"))
+LOG_BATCH = int(os.getenv("LOG_BATCH", "256"))
+# per-route/status sampling, first match wins, e.g. "/enquire:200=0.01,/checkout:2xx=0.1"
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")
+
+def _dumps(kv) -> str:
+    if orjson is not None:
+        try:
+            return orjson.dumps(kv, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            pass  # e.g. ints past 64 bits: the stdlib encoder takes anything
+    return json.dumps(kv, ensure_ascii=False, default=str)
+
+def _parse_sampling(spec: str):
+    # "route:status=rate" -> [(route_prefix, status, rate)]; route/status may be "*", status may be "2xx"
+    rules = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        try:
+            target, rate = part.rsplit("=", 1)
+            route, status = target.rsplit(":", 1)
+            rules.append((route, status.lower(), float(rate)))
+        except ValueError:
+            sys.stderr.write(f"ignoring bad LOG_SAMPLE rule: {part}\n")
+    return rules
+
+def _status_match(pattern: str, status) -> bool:
+    s = str(status)
+    if pattern == "*" or pattern == s:
+        return True
+    return len(pattern) == 3 and pattern.endswith("xx") and s[:1] == pattern[0]
+
+_STOP = object()
 
 class JsonLogger:
-    def __init__(self, service="api"):
+    def __init__(self, service="api", metrics=None):
         self.service = service
+        self.metrics = metrics
+        self._rules = _parse_sampling(LOG_SAMPLE)
+        self._q = None
+        if LOG_MODE == "async":
+            self._q = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            self._writer = threading.Thread(target=self._drain, name="log-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
+    def _count(self, result: str, n: int = 1):
+        if self.metrics:
+            self.metrics.child(self.metrics.LOG_EVENTS, result).inc(n)
+
+    def _keep(self, kv) -> bool:
+        # errors and records without route/status are always kept
+        if not self._rules or kv.get("status") is None or kv.get("route") is None:
+            return True
+        route, status = str(kv["route"]), kv["status"]
+        for prefix, pattern, rate in self._rules:
+            if (prefix == "*" or route.startswith(prefix)) and _status_match(pattern, status):
+                return rate >= 1 or random.random() < rate
+        return True
 
     def log(self, level: str, **kv):
+        if level.upper() != "ERROR" and not self._keep(kv):
+            self._count("sampled")
+            return
         kv.setdefault("service", self.service)
         kv.setdefault("level", level.upper())
         kv.setdefault("ts", time.time())
-        line = json.dumps(kv, ensure_ascii=False)
-        sys.stdout.write(line + "\n")
-        sys.stdout.flush()
+        if self._q is None:
+            sys.stdout.write(_dumps(kv) + "\n")
+            sys.stdout.flush()
+            self._count("written")
+            return
+        try:
+            if LOG_QUEUE_POLICY == "block":
+                self._q.put(kv, timeout=LOG_BLOCK_MS / 1000.0)
+            else:
+                self._q.put_nowait(kv)
+        except queue.Full:
+            self._count("dropped")
+
+    def _drain(self):
+        # serialize and write off the request path, one write + flush per batch
+        while True:
+            batch = [self._q.get()]
+            while len(batch) < LOG_BATCH:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(kv is _STOP for kv in batch)
+            lines = []
+            for kv in batch:
+                if kv is _STOP:
+                    continue
+                try:
+                    lines.append(_dumps(kv))
+                except (TypeError, ValueError):
+                    # unserializable record (e.g. circular): drop it, keep the writer alive
+                    self._count("dropped")
+            if lines:
+                try:
+                    sys.stdout.write("\n".join(lines) + "\n")
+                    sys.stdout.flush()
+                    self._count("written", len(lines))
+                except (OSError, ValueError):
+                    self._count("dropped", len(lines))
+            if stop:
+                return
+
+    def close(self, timeout: float = 2.0):
+        # flush what's queued at shutdown
+        if self._q is not None and self._writer.is_alive():
+            try:
+                self._q.put(_STOP, timeout=timeout)
+            except queue.Full:
+                return
+            self._writer.join(timeout)
 
     def info(self, **kv):  self.log("INFO", **kv)
     def warn(self, **kv):  self.log("WARN", **kv)
@@ -1,14 +1,100 @@
-from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+import os, threading, time
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+from core import instrument
+from core.instrument import Span
+
+# Set by serve.sh for gunicorn: each worker writes mmap files here and /metrics
+# aggregates all of them, instead of showing whichever worker took the scrape.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# /metrics bodies are reused for this long; aggregation reads every worker's files
+METRICS_CACHE_MS = int(os.getenv("METRICS_CACHE_MS", "1000"))
+
+def _buckets(name, default):
+    # comma-separated upper bounds in seconds, e.g. METRICS_HTTP_BUCKETS=0.001,0.005,0.01
+    raw = os.getenv(name)
+    return tuple(sorted(float(b) for b in raw.split(",") if b.strip())) if raw else default
+
+# The prometheus defaults start at 5ms; most of our requests finish under 10ms
+HTTP_BUCKETS = _buckets("METRICS_HTTP_BUCKETS",
+                        (0.0005, 0.001, 0.002, 0.003, 0.005, 0.0075, 0.01, 0.015, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+DEP_BUCKETS = _buckets("METRICS_DEP_BUCKETS",
+                       (0.0001, 0.00025, 0.0005, 0.00075, 0.001, 0.002, 0.003, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5))
 
 class Metrics:
     def __init__(self):
+        self._lock = threading.Lock()
+        self._cached = (0.0, b"")
+        self._children = {}
         self.REQS = Counter("http_requests_total","Total HTTP requests",["route","code"])
-        self.LAT  = Histogram("http_request_latency_seconds","Request latency (s)",["route"])
+        self.LAT  = Histogram("http_request_latency_seconds","Request latency (s)",["route"], buckets=HTTP_BUCKETS)
         self.REDIS_OPS = Counter("redis_ops_total","Redis operations",["op","result"])  # ok|timeout|error
-        self.REDIS_LAT = Histogram("redis_op_latency_seconds","Redis op latency (s)",["op"])
+        self.REDIS_LAT = Histogram("redis_op_latency_seconds","Redis op latency (s)",["op"], buckets=DEP_BUCKETS)
         self.DB_OPS = Counter("db_ops_total","DB operations",["op","result"])  # ok|error
-        self.DB_LAT = Histogram("db_op_latency_seconds","DB op latency (s)",["op"])
+        self.DB_LAT = Histogram("db_op_latency_seconds","DB op latency (s)",["op"], buckets=DEP_BUCKETS)
+        # single statements (execute + fetch on a held connection: no pool wait, no commit
+        # unless pipelined with it) - where statement preparation shows up
+        self.DB_STMT_OPS = Counter("db_statement_total","DB statements executed",["stmt","result"])
+        self.DB_STMT_LAT = Histogram("db_statement_latency_seconds","DB statement latency (s)",["stmt"],
+                                     buckets=DEP_BUCKETS)
+        self.DB_POOL_SIZE = Gauge("db_pool_connections","Open connections in the DB pool", multiprocess_mode="livesum")
+        self.DB_POOL_IN_USE = Gauge("db_pool_in_use","DB pool connections checked out", multiprocess_mode="livesum")
+        self.DB_POOL_WAITING = Gauge("db_pool_waiting","Requests waiting for a DB pool connection", multiprocess_mode="livesum")
+        self.DB_POOL_ACQUIRE_LAT = Histogram("db_pool_acquire_seconds","Time to acquire a DB pool connection (s)",
+                                             buckets=DEP_BUCKETS)
+        self.DEP_UP = Gauge("dependency_up","Readiness of a dependency as last seen by the health checker",
+                            ["dep"], multiprocess_mode="livemin")
+        self.PHASE_LAT = Histogram("http_request_phase_seconds","Time spent per request phase (s)",
+                                   ["route","phase"], buckets=HTTP_BUCKETS)  # lock|cache|db|orders|release
+        self.L1_OPS = Counter("stock_l1_cache_total","In-process stock cache events",["result"])  # hit|miss|eviction|invalidate
+        self.CACHE_REFILL = Counter("stock_cache_refill_total","Stock cache miss refills",["result"])  # db|coalesced|waited_hit|waited_timeout
+        self.LOG_EVENTS = Counter("log_records_total","Log records by outcome",["result"])  # written|sampled|dropped
+        self.DB_POOL_TIMEOUTS = Counter("db_pool_timeouts_total","DB pool acquire timeouts")
+        self.ORDER_QUEUE_OPS = Counter("order_queue_ops_total","Write-behind order queue events",["op","result"])
+        self.ORDER_QUEUE_DEPTH = Gauge("order_queue_depth","Orders queued but not yet flushed to Postgres",
+                                       multiprocess_mode="livemostrecent")
+        self.ORDER_FLUSH_BATCH = Histogram("order_flush_batch_size","Orders per flush batch",
+                                           buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+        self.ORDER_FLUSH_LAG = Histogram("order_flush_lag_seconds","Checkout-to-flush lag of the oldest order in a batch (s)",
+                                         buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+        self.CHANGEFEED_EVENTS = Counter("stock_changefeed_total","Inventory change notifications by outcome",
+                                         ["result"])  # received|updated|invalidated|error|resync
+        self.CHANGEFEED_LAG = Histogram("stock_changefeed_apply_seconds","Time to apply one change batch to Redis (s)",
+                                        buckets=DEP_BUCKETS)
+
+    def child(self, metric, *labels):
+        # labels() takes a lock and builds a key on every call; resolve each child once
+        key = (metric, labels)
+        c = self._children.get(key)
+        if c is None:
+            c = self._children.setdefault(key, metric.labels(*labels))
+        return c
+
+    def record_request(self, route: str, code, seconds: float):
+        self.child(self.LAT, route).observe(seconds)
+        self.child(self.REQS, route, str(code)).inc()
+
+    def span(self, route: str, phase: str):
+        return Span(self.child(self.PHASE_LAT, route, phase))
+
+    @property
+    def metrics(self):
+        # expose() is timed by instrument.route like the service handlers
+        return self
+
+    def _render(self):
+        if not MULTIPROC_DIR:
+            return generate_latest()
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
 
-    @staticmethod
-    def expose():
-        return generate_latest(), 200, {"Content-Type": CONTENT_TYPE_LATEST}
+    @instrument.route("/metrics")
+    def expose(self):
+        now = time.monotonic()
+        with self._lock:
+            ts, body = self._cached
+            if not body or now - ts >= METRICS_CACHE_MS / 1000.0:
+                body = self._render()
+                self._cached = (now, body)
+        return body, 200, {"Content-Type": CONTENT_TYPE_LATEST}
@@ -0,0 +1,173 @@
+# Write-behind order ingestion (ORDERS_WRITE_BEHIND=1).
+# Checkout still commits the stock UPDATE synchronously, but the order row goes to a
+# Redis Stream instead of being INSERTed inside the transaction. OrderFlusher drains the
+# stream into `orders` in batches and acks only after commit: at-least-once delivery,
+# deduplicated by order_key. Flusher runs in-process (ORDERS_FLUSHER=inproc, default)
+# or standalone: python -m core.order_queue
+import os, socket, threading, time, uuid
+
+ORDERS_WRITE_BEHIND = os.getenv("ORDERS_WRITE_BEHIND", "0") == "1"
+ORDERS_FLUSHER = os.getenv("ORDERS_FLUSHER", "inproc")  # inproc | off
+ORDERS_FLUSH_BATCH = int(os.getenv("ORDERS_FLUSH_BATCH", "500"))
+ORDERS_FLUSH_MS = int(os.getenv("ORDERS_FLUSH_MS", "200"))
+ORDERS_CLAIM_IDLE_MS = int(os.getenv("ORDERS_CLAIM_IDLE_MS", "30000"))
+
+class OrderLost(RuntimeError):
+    """Neither the stream nor the direct insert took the order; the checkout must fail."""
+
+def _queue_entries(orders):
+    # stamp each order with its idempotency key; the caller's dicts get order_key too
+    now = time.time()
+    entries = []
+    for o in orders:
+        o.setdefault("order_key", uuid.uuid4().hex)
+        entries.append(dict(o, created_ts=now))
+    return entries
+
+class OrderQueue:
+    def __init__(self, logger, metrics, redis_client, db):
+        self.log = logger
+        self.metrics = metrics
+        self.redis = redis_client
+        self.db = db
+
+    def submit(self, orders):
+        entries = _queue_entries(orders)
+        if self.redis.enqueue_orders(entries):
+            self.metrics.child(self.metrics.ORDER_QUEUE_OPS, "enqueue","ok").inc()
+            return
+        # Redis unavailable: stock is already committed, so persist the rows right away
+        n = self.db.insert_orders(entries)
+        self.metrics.child(self.metrics.ORDER_QUEUE_OPS, "enqueue","fallback" if n is not None else "error").inc()
+        if n is None:
+            self.log.error(msg="order lost: queue and db both failed", orders=entries)
+            raise OrderLost(f"{len(entries)} order(s) not recorded")
+
+class AsyncOrderQueue(OrderQueue):
+    # async serving mode: same contract, awaiting AsyncRedisClient / AsyncDB
+    async def submit(self, orders):
+        entries = _queue_entries(orders)
+        if await self.redis.enqueue_orders(entries):
+            self.metrics.child(self.metrics.ORDER_QUEUE_OPS, "enqueue","ok").inc()
+            return
+        n = await self.db.insert_orders(entries)
+        self.metrics.child(self.metrics.ORDER_QUEUE_OPS, "enqueue","fallback" if n is not None else "error").inc()
+        if n is None:
+            self.log.error(msg="order lost: queue and db both failed", orders=entries)
+            raise OrderLost(f"{len(entries)} order(s) not recorded")
+
+def _parse_entry(fields):
+    return {
+        "order_key": fields["order_key"],
+        "item_id": int(fields["item_id"]),
+        "qty": int(fields["qty"]),
+        "unit_price_cents": int(fields["unit_price_cents"]),
+        "total_cents": int(fields["total_cents"]),
+        "created_ts": float(fields["created_ts"]),
+    }
+
+class OrderFlusher:
+    """
+    Background drain of the order stream. Uses the sync RedisClient and DB
+    (also under the async app, on the shared auxiliary clients).
+    """
+    def __init__(self, logger, metrics, redis_client, db):
+        self.log = logger
+        self.metrics = metrics
+        self.redis = redis_client
+        self.db = db
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._stop = threading.Event()
+        self._thread = None
+        self._retry_pending = True  # first pass picks up anything we took before a restart
+        self._last_claim = 0.0
+        self._group_ready = False  # XGROUP CREATE once, then again only after NOGROUP
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name="order-flusher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def run_forever(self):
+        self.log.info(msg="order flusher started", consumer=self.consumer)
+        while not self._stop.is_set():
+            try:
+                n = self.flush_once()
+            except Exception as e:
+                self.metrics.child(self.metrics.ORDER_QUEUE_OPS, "flush","error").inc()
+                self.log.error(msg="order flusher error", err=str(e))
+                n = 0
+            # a full batch means there's backlog: go again straight away
+            if n < ORDERS_FLUSH_BATCH:
+                self._stop.wait(ORDERS_FLUSH_MS / 1000.0)
+        # drain what's left on shutdown, best-effort
+        try:
+            self.flush_once()
+        except Exception:
+            pass
+
+    def _next_batch(self):
+        if not self._group_ready:
+            self.redis.ensure_order_group()
+            self._group_ready = True
+        try:
+            return self._read_batch()
+        except Exception as e:
+            if "NOGROUP" in str(e):
+                # stream or group went away (FLUSHALL, Redis restart without persistence):
+                # recreate it on the next pass
+                self._group_ready = False
+            raise
+
+    def _read_batch(self):
+        if self._retry_pending:
+            entries = self.redis.read_orders(self.consumer, ORDERS_FLUSH_BATCH, pending=True)
+            if entries:
+                return entries
+            self._retry_pending = False
+        now = time.time()
+        if now - self._last_claim > ORDERS_CLAIM_IDLE_MS / 2000.0:
+            self._last_claim = now
+            entries = self.redis.claim_stale_orders(self.consumer, ORDERS_CLAIM_IDLE_MS, ORDERS_FLUSH_BATCH)
+            if entries:
+                return entries
+        return self.redis.read_orders(self.consumer, ORDERS_FLUSH_BATCH)
+
+    def flush_once(self) -> int:
+        entries = self._next_batch()
+        if entries:
+            orders = [_parse_entry(f) for _, f in entries]
+            n = self.db.insert_orders(orders)
+            if n is None:
+                # not acked: re-read from our pending list on the next pass
+                self._retry_pending = True
+                self.metrics.child(self.metrics.ORDER_QUEUE_OPS, "flush","error").inc()
+                return 0
+            self.redis.ack_orders([eid for eid, _ in entries])
+            self.metrics.child(self.metrics.ORDER_QUEUE_OPS, "flush","ok").inc()
+            self.metrics.ORDER_FLUSH_BATCH.observe(len(orders))
+            self.metrics.ORDER_FLUSH_LAG.observe(time.time() - min(o["created_ts"] for o in orders))
+        self.metrics.ORDER_QUEUE_DEPTH.set(self.redis.order_queue_depth())
+        return len(entries)
+
+if __name__ == "__main__":
+    # standalone flusher: python -m core.order_queue (metrics on ORDERS_FLUSHER_METRICS_PORT)
+    from prometheus_client import start_http_server
+    from core.logging import JsonLogger
+    from core.metrics import Metrics
+    from core.redis_client import RedisClient
+    from core.db import DB
+
+    metrics = Metrics()
+    log = JsonLogger(service="order-flusher", metrics=metrics)
+    start_http_server(int(os.getenv("ORDERS_FLUSHER_METRICS_PORT", "9101")))
+    flusher = OrderFlusher(log, metrics, RedisClient(logger=log, metrics=metrics, l1=False), DB(logger=log, metrics=metrics))
+    try:
+        flusher.run_forever()
+    except KeyboardInterrupt:
+        flusher.stop()
@@ -1,10 +1,78 @@
-import os, redis, time, uuid
-import time as t
+import os, redis, time, uuid, random
+from core.local_cache import LocalCache
+from core.instrument import OpTimer
+
+# base TTL for stock:<id> plus +/- jitter fraction so keys filled together don't expire together
+STOCK_CACHE_TTL_SEC = int(os.getenv("STOCK_CACHE_TTL_SEC", "300"))
+STOCK_TTL_JITTER = float(os.getenv("STOCK_TTL_JITTER", "0.1"))
+# short lease electing one refiller per key across workers on a cache miss
+REFILL_LEASE_MS = int(os.getenv("REFILL_LEASE_MS", "500"))
+
+# write-behind order stream and its consumer group (see core/order_queue.py)
+ORDER_STREAM = os.getenv("ORDER_STREAM", "orders:stream")
+ORDER_GROUP = os.getenv("ORDER_GROUP", "orders-flusher")
+
+# writers publish changed stock keys here so every worker can drop its L1 copy
+STOCK_INVALIDATE_CHANNEL = os.getenv("STOCK_INVALIDATE_CHANNEL", "stock:invalidate")
+
+# Server-side stock scripts. They run atomically, so check + decrement can't interleave
+# with a concurrent set_stock_cached from /enquire.
+
+# ARGV[2] is the invalidation channel ('' = L1 disabled, don't publish).
+
+# KEYS[1]=stock key, ARGV[1]=qty -> {1, new_qty} reserved | {0, cur_qty} not enough | {-1, 0} not cached
+RESERVE_STOCK_LUA = """
+local v = redis.call('GET', KEYS[1])
+if not v then return {-1, 0} end
+local cur = tonumber(v)
+local want = tonumber(ARGV[1])
+if cur < want then return {0, cur} end
+local n = redis.call('DECRBY', KEYS[1], want)
+if ARGV[2] ~= '' then redis.call('PUBLISH', ARGV[2], KEYS[1]) end
+return {1, n}
+"""
+
+# KEYS[1]=stock key, ARGV[1]=signed delta -> new qty, or nil if not cached (DB is source of truth)
+ADJUST_STOCK_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  local n = redis.call('INCRBY', KEYS[1], ARGV[1])
+  if ARGV[2] ~= '' then redis.call('PUBLISH', ARGV[2], KEYS[1]) end
+  return n
+end
+return nil
+"""
+
+# Change-feed update (see core/changefeed.py): KEYS=stock keys, ARGV[1]=channel, then per key
+# (value seen before reading Postgres, '' = missing; new qty; ttl) -> keys written.
+# A key that moved in between (a checkout's DECRBY) is dropped rather than overwritten.
+SWAP_STOCK_LUA = """
+local n = 0
+for i, key in ipairs(KEYS) do
+  local a = 2 + (i - 1) * 3
+  if (redis.call('GET', key) or '') == ARGV[a] then
+    redis.call('SET', key, ARGV[a + 1], 'EX', ARGV[a + 2])
+    n = n + 1
+  else
+    redis.call('DEL', key)
+  end
+end
+if ARGV[1] ~= '' then redis.call('PUBLISH', ARGV[1], table.concat(KEYS, ' ')) end
+return n
+"""
+
+# KEYS[1]=lock key, ARGV[1]=token -> 1 deleted | 0 not ours (expired or taken over)
+RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
 
 class RedisClient:
-    def __init__(self, logger, metrics):
+    def __init__(self, logger, metrics, l1: bool = True):
         self.log = logger
         self.metrics = metrics
+        self._op = OpTimer(metrics, "REDIS_LAT", "REDIS_OPS")
         host = os.getenv("REDIS_HOST","localhost")
         port = int(os.getenv("REDIS_PORT","6379"))
         db   = int(os.getenv("REDIS_DB","0"))
@@ -12,56 +80,332 @@ class RedisClient:
             host=host, port=port, db=db, decode_responses=True,
             socket_connect_timeout=0.2, socket_timeout=0.3
         )
+        # Script objects run EVALSHA and reload on NOSCRIPT (e.g. after a Redis restart)
+        self._reserve_stock = self.r.register_script(RESERVE_STOCK_LUA)
+        self._adjust_stock = self.r.register_script(ADJUST_STOCK_LUA)
+        self._release_lock = self.r.register_script(RELEASE_LOCK_LUA)
+        self._swap_stock = self.r.register_script(SWAP_STOCK_LUA)
+        self._load_scripts()
+
+        # Optional per-worker L1 in front of get_stock_cached (STOCK_L1_TTL_MS=0 disables).
+        # l1=False is for auxiliary write-side clients (flusher, warm-up, change feed): they
+        # still publish invalidations for the workers' L1s but keep no cache or listener.
+        self.l1 = None
+        self._chan = ""
+        l1_ttl_ms = int(os.getenv("STOCK_L1_TTL_MS", "0"))
+        if l1_ttl_ms > 0 and not l1:
+            self._chan = STOCK_INVALIDATE_CHANNEL
+        elif l1_ttl_ms > 0:
+            self.l1 = LocalCache(
+                max_items=int(os.getenv("STOCK_L1_MAX_ITEMS", "10000")),
+                ttl_sec=l1_ttl_ms / 1000.0, metrics=metrics
+            )
+            self._chan = STOCK_INVALIDATE_CHANNEL
+            self._start_invalidation_listener(host, port, db)
+
+    def _load_scripts(self):
+        # preload so the first checkout doesn't pay the NOSCRIPT round trip; best-effort
+        try:
+            for sc in (self._reserve_stock, self._adjust_stock, self._release_lock):
+                self.r.script_load(sc.script)
+        except redis.exceptions.RedisError as e:
+            self.log.warn(msg="redis script preload failed", err=str(e))
+
+    def _start_invalidation_listener(self, host, port, db):
+        # dedicated connection without socket_timeout: the listener blocks between messages
+        try:
+            sub = redis.Redis(host=host, port=port, db=db, decode_responses=True,
+                              socket_connect_timeout=0.2, health_check_interval=30)
+            self._pubsub = sub.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.subscribe(**{STOCK_INVALIDATE_CHANNEL: self._on_invalidate})
+            self._pubsub.run_in_thread(sleep_time=1.0, daemon=True, exception_handler=self._on_pubsub_error)
+        except redis.exceptions.RedisError as e:
+            # L1 still expires on its own TTL; we just lose cross-worker invalidation
+            self.log.warn(msg="redis invalidation listener not started", err=str(e))
+
+    def _on_invalidate(self, message):
+        self.l1.invalidate(*str(message["data"]).split())
+
+    def _on_pubsub_error(self, e, pubsub, thread):
+        # we may have missed invalidations while disconnected
+        self.log.warn(msg="redis invalidation listener error", err=str(e))
+        self.l1.clear()
+        time.sleep(1.0)
+
+    def _invalidate_local(self, *keys):
+        if self.l1:
+            self.l1.invalidate(*keys)
 
     def ping(self):
-        t0 = t.time()
         try:
-            ok = self.r.ping()
-            self.metrics.REDIS_LAT.labels("ping").observe(t.time()-t0)
-            self.metrics.REDIS_OPS.labels("ping","ok").inc()
+            with self._op("ping"):
+                ok = self.r.ping()
             return ok
         except redis.exceptions.RedisError as e:
-            self.metrics.REDIS_OPS.labels("ping","error").inc()
             self.log.error(route="/health", msg="redis error", err=str(e))
             return False
 
     def stock_key(self, item_id: str) -> str:
         return f"stock:{item_id}"
 
+    @staticmethod
+    def stock_ttl() -> int:
+        j = STOCK_CACHE_TTL_SEC * STOCK_TTL_JITTER
+        return max(1, int(STOCK_CACHE_TTL_SEC + random.uniform(-j, j)))
+
     def get_stock_cached(self, item_id: str):
-        t0 = t.time()
+        key = self.stock_key(item_id)
+        if self.l1:
+            v = self.l1.get(key)
+            if v is not None:
+                return v
         try:
-            v = self.r.get(self.stock_key(item_id))
-            self.metrics.REDIS_LAT.labels("get_stock").observe(t.time()-t0)
-            self.metrics.REDIS_OPS.labels("get_stock","ok").inc()
-            return int(v) if v is not None else None
+            with self._op("get_stock"):
+                v = self.r.get(key)
+            if v is None:
+                return None
+            v = int(v)
+            if self.l1:
+                self.l1.set(key, v)
+            return v
         except redis.exceptions.RedisError as e:
-            self.metrics.REDIS_OPS.labels("get_stock","error").inc()
             self.log.error(route="/enquire", msg="redis get error", item_id=item_id, err=str(e))
             return None
 
-    def set_stock_cached(self, item_id: str, qty: int, ttl_sec: int = 300):
-        t0 = t.time()
+    def get_stock_cached_many(self, item_ids):
+        # single MGET; returns {id: qty or None}. On Redis errors everything is a miss.
+        out = {}
+        todo = []
+        for i in item_ids:
+            v = self.l1.get(self.stock_key(i)) if self.l1 else None
+            if v is not None:
+                out[i] = v
+            else:
+                todo.append(i)
+        if not todo:
+            return out
         try:
-            self.r.set(self.stock_key(item_id), qty, ex=ttl_sec)
-            self.metrics.REDIS_LAT.labels("set_stock").observe(t.time()-t0)
-            self.metrics.REDIS_OPS.labels("set_stock","ok").inc()
+            with self._op("get_stock_many"):
+                vals = self.r.mget([self.stock_key(i) for i in todo])
+            for i, v in zip(todo, vals):
+                out[i] = int(v) if v is not None else None
+                if self.l1 and v is not None:
+                    self.l1.set(self.stock_key(i), out[i])
+            return out
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/enquire", msg="redis mget error", err=str(e))
+            out.update({i: None for i in todo})
+            return out
+
+    def set_stock_cached(self, item_id: str, qty: int, ttl_sec: int = None):
+        key = self.stock_key(item_id)
+        ttl_sec = ttl_sec or self.stock_ttl()
+        self._invalidate_local(key)
+        try:
+            with self._op("set_stock"):
+                if self._chan:
+                    pipe = self.r.pipeline(transaction=False)
+                    pipe.set(key, qty, ex=ttl_sec)
+                    pipe.publish(self._chan, key)
+                    pipe.execute()
+                else:
+                    self.r.set(key, qty, ex=ttl_sec)
         except redis.exceptions.RedisError as e:
-            self.metrics.REDIS_OPS.labels("set_stock","error").inc()
             self.log.error(route="/enquire", msg="redis set error", item_id=item_id, err=str(e))
 
+    def set_stock_cached_many(self, qty_by_item: dict, ttl_sec: int = None):
+        # backfill a batch of misses in one pipelined round trip; each key gets its own jittered TTL
+        if not qty_by_item:
+            return True
+        keys = [self.stock_key(i) for i in qty_by_item]
+        self._invalidate_local(*keys)
+        try:
+            with self._op("set_stock_many"):
+                pipe = self.r.pipeline(transaction=False)
+                for key, qty in zip(keys, qty_by_item.values()):
+                    pipe.set(key, qty, ex=ttl_sec or self.stock_ttl())
+                if self._chan:
+                    pipe.publish(self._chan, " ".join(keys))
+                pipe.execute()
+            return True
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/enquire", msg="redis set_many error", err=str(e))
+            return False
+
+    def swap_stock_cached_many(self, qty_by_item: dict, seen: dict):
+        """
+        Compare-and-set for the change feed: writes qty_by_item[id] only where stock:<id>
+        still holds seen[id] (None = not cached), deletes it otherwise. Returns the number
+        of keys written, or None on Redis errors.
+        """
+        if not qty_by_item:
+            return 0
+        keys = [self.stock_key(i) for i in qty_by_item]
+        args = [self._chan]
+        for i, qty in qty_by_item.items():
+            v = seen.get(i)
+            args += ["" if v is None else str(v), qty, self.stock_ttl()]
+        self._invalidate_local(*keys)
+        try:
+            with self._op("swap_stock_many"):
+                return int(self._swap_stock(keys=keys, args=args))
+        except redis.exceptions.RedisError as e:
+            self.log.error(msg="redis swap_many error", err=str(e))
+            return None
+
+    def delete_stock_cached_many(self, item_ids):
+        # drop a batch of stock keys (next enquiry refills from Postgres)
+        if not item_ids:
+            return True
+        keys = [self.stock_key(i) for i in item_ids]
+        self._invalidate_local(*keys)
+        try:
+            with self._op("del_stock_many"):
+                pipe = self.r.pipeline(transaction=False)
+                pipe.delete(*keys)
+                if self._chan:
+                    pipe.publish(self._chan, " ".join(keys))
+                pipe.execute()
+            return True
+        except redis.exceptions.RedisError as e:
+            self.log.error(msg="redis del_many error", err=str(e))
+            return False
+
+    def acquire_refill_lease(self, item_id: str):
+        """
+        Elect one cache refiller per key across workers.
+        Returns (leader, token): leader=False means someone else is refilling.
+        If Redis errors we act as leader so the miss still gets served from the DB.
+        """
+        key = f"refill:{item_id}"
+        token = str(uuid.uuid4())
+        try:
+            with self._op("refill_lease") as op:
+                ok = self.r.set(key, token, nx=True, px=REFILL_LEASE_MS)
+                if not ok:
+                    op.result = "busy"
+            return (ok is True), (token if ok else None)
+        except redis.exceptions.RedisError:
+            return True, None
+
+    def acquire_lease(self, key: str, ttl_ms: int):
+        # generic SET NX PX lease; returns its token, or None if held elsewhere or Redis errors.
+        # Release with release_lock(key, token).
+        token = str(uuid.uuid4())
+        try:
+            with self._op("lease") as op:
+                ok = self.r.set(key, token, nx=True, px=ttl_ms)
+                if not ok:
+                    op.result = "busy"
+            return token if ok else None
+        except redis.exceptions.RedisError:
+            return None
+
+    def release_refill_lease(self, item_id: str, token: str):
+        try:
+            with self._op("refill_release"):
+                self._release_lock(keys=[f"refill:{item_id}"], args=[token])
+        except redis.exceptions.RedisError:
+            pass
+
     def decr_stock_cached(self, item_id: str, by: int = 1):
-        t0 = t.time()
+        key = self.stock_key(item_id)
+        self._invalidate_local(key)
         try:
-            # if key missing, do nothing; DB is source of truth
-            if self.r.exists(self.stock_key(item_id)):
-                self.r.decrby(self.stock_key(item_id), by)
-            self.metrics.REDIS_LAT.labels("decr_stock").observe(t.time()-t0)
-            self.metrics.REDIS_OPS.labels("decr_stock","ok").inc()
+            with self._op("decr_stock"):
+                # if key missing, do nothing; DB is source of truth
+                self._adjust_stock(keys=[key], args=[-by, self._chan])
         except redis.exceptions.RedisError as e:
-            self.metrics.REDIS_OPS.labels("decr_stock","error").inc()
             self.log.error(route="/checkout", msg="redis decr error", item_id=item_id, err=str(e))
 
+    def decr_stock_cached_many(self, by_item: dict):
+        # one pipelined round trip for a whole cart; missing keys are left alone
+        keys = {item_id: self.stock_key(item_id) for item_id in by_item}
+        self._invalidate_local(*keys.values())
+        try:
+            with self._op("decr_stock_many"):
+                pipe = self.r.pipeline(transaction=False)
+                for item_id, by in by_item.items():
+                    self._adjust_stock(keys=[keys[item_id]], args=[-by, self._chan], client=pipe)
+                pipe.execute()
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/checkout", msg="redis decr_many error", err=str(e))
+
+    def reserve_stock(self, item_id: str, qty: int):
+        """
+        Atomically take qty from the cached stock in one round trip.
+        Returns ("reserved", new_qty), ("oos", cached_qty) or ("miss", None) when
+        the item isn't cached or Redis is unavailable (caller falls back to the DB).
+        """
+        key = self.stock_key(item_id)
+        self._invalidate_local(key)
+        try:
+            with self._op("reserve_stock"):
+                status, n = self._reserve_stock(keys=[key], args=[qty, self._chan])
+            if status == 1:
+                return "reserved", int(n)
+            if status == 0:
+                return "oos", int(n)
+            return "miss", None
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/checkout", msg="redis reserve error", item_id=item_id, err=str(e))
+            return "miss", None
+
+    def release_stock(self, item_id: str, qty: int):
+        # compensate a reservation when the DB purchase didn't go through
+        key = self.stock_key(item_id)
+        self._invalidate_local(key)
+        try:
+            with self._op("release_stock"):
+                self._adjust_stock(keys=[key], args=[qty, self._chan])
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/checkout", msg="redis release error", item_id=item_id, err=str(e))
+
+    # ---- write-behind order stream ----
+    def enqueue_orders(self, orders):
+        # one pipelined XADD per order; False tells the caller to write the rows itself
+        try:
+            with self._op("enqueue_orders"):
+                pipe = self.r.pipeline(transaction=False)
+                for o in orders:
+                    pipe.xadd(ORDER_STREAM, {k: str(v) for k, v in o.items()})
+                pipe.execute()
+            return True
+        except redis.exceptions.RedisError as e:
+            self.log.error(route="/checkout", msg="redis enqueue_orders error", err=str(e))
+            return False
+
+    # flusher side: errors propagate, OrderFlusher retries on its own schedule
+    def ensure_order_group(self):
+        try:
+            self.r.xgroup_create(ORDER_STREAM, ORDER_GROUP, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def read_orders(self, consumer: str, count: int, pending: bool = False):
+        # pending=True re-reads entries this consumer already took but never acked
+        with self._op("read_orders"):
+            resp = self.r.xreadgroup(ORDER_GROUP, consumer, {ORDER_STREAM: "0" if pending else ">"}, count=count)
+        return [(eid, f) for eid, f in (resp[0][1] if resp else []) if f]
+
+    def claim_stale_orders(self, consumer: str, min_idle_ms: int, count: int):
+        # take over entries a dead consumer read but never acked
+        with self._op("claim_orders"):
+            resp = self.r.xautoclaim(ORDER_STREAM, ORDER_GROUP, consumer, min_idle_ms, start_id="0-0", count=count)
+        return [(eid, f) for eid, f in resp[1] if f]
+
+    def ack_orders(self, ids):
+        with self._op("ack_orders"):
+            pipe = self.r.pipeline(transaction=False)
+            pipe.xack(ORDER_STREAM, ORDER_GROUP, *ids)
+            pipe.xdel(ORDER_STREAM, *ids)
+            pipe.execute()
+
+    def order_queue_depth(self) -> int:
+        with self._op("queue_depth"):
+            return self.r.xlen(ORDER_STREAM)
+
     '''
     * This is done to avoid single user over buying mechanism.
     * simple per-user per-item lock (rate-limit / duplicate prevention) ----------
@@ -72,26 +416,19 @@ class RedisClient:
         lock_key = f"lock:{user_id}:{item_id}"
         token = str(uuid.uuid4())
         try:
-            ok = self.r.set(lock_key, token, nx=True, ex=ttl_sec)
+            with self._op("lock_acquire") as op:
+                ok = self.r.set(lock_key, token, nx=True, ex=ttl_sec)
+                if not ok:
+                    op.result = "busy"
             return (ok is True), lock_key, token
         except redis.exceptions.RedisError:
             return (False, lock_key, None)
 
     def release_lock(self, lock_key: str, token: str):
-        # best-effort release; compare token to avoid releasing other caller's lock
-        try:
-            pipe = self.r.pipeline()
-            while True:
-                try:
-                    pipe.watch(lock_key)
-                    cur = pipe.get(lock_key)
-                    if cur == token:
-                        pipe.multi()
-                        pipe.delete(lock_key)
-                        pipe.execute()
-                    pipe.unwatch()
-                    break
-                except redis.exceptions.WatchError:
-                    continue
+        # best-effort release; compare-and-delete in one round trip so we never drop
+        # a lock that expired and was taken by another caller
+        try:
+            with self._op("lock_release"):
+                self._release_lock(keys=[lock_key], args=[token])
         except redis.exceptions.RedisError:
             pass
@@ -0,0 +1,69 @@
+import asyncio, threading
+
+class _Call:
+    __slots__ = ("done", "result", "err")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.err = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key inside one process:
+    the first caller runs fn, everyone else arriving meanwhile waits and
+    shares its result (or its exception).
+    """
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if self.metrics: self.metrics.child(self.metrics.CACHE_REFILL, "coalesced").inc()
+            call.done.wait()
+            if call.err is not None:
+                raise call.err
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.err = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+class AsyncSingleFlight:
+    """
+    asyncio flavour of SingleFlight for the async serving mode: fn is a
+    zero-arg callable returning a coroutine, run once per key at a time.
+    The load runs in its own task, so a caller that is cancelled (client
+    disconnect) only stops waiting; the others still get the result.
+    """
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self._calls = {}
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is not None:
+            if self.metrics: self.metrics.child(self.metrics.CACHE_REFILL, "coalesced").inc()
+        else:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even when every caller has gone away
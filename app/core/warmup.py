@@ -0,0 +1,58 @@
+# Stock cache warm-up: stream `inventory` through a server-side cursor and fill the
+# stock:<id> keys in pipelined batches (jittered TTLs, see RedisClient.stock_ttl), so
+# a fresh deploy or a Redis restart doesn't send every first enquiry to Postgres.
+# STOCK_WARMUP=1 runs it in the background at startup; a Redis lease keeps it to one
+# worker per deploy. Also available as `python manage.py warm-cache`.
+import os, threading
+from core.instrument import now_ns, elapsed
+
+STOCK_WARMUP = os.getenv("STOCK_WARMUP", "0") == "1"
+STOCK_WARMUP_BATCH = int(os.getenv("STOCK_WARMUP_BATCH", "1000"))
+STOCK_WARMUP_LEASE_SEC = int(os.getenv("STOCK_WARMUP_LEASE_SEC", "300"))
+STOCK_WARMUP_PROGRESS_SEC = float(os.getenv("STOCK_WARMUP_PROGRESS_SEC", "5"))
+WARMUP_LEASE_KEY = "warmup:stock"
+
+def warm_stock_cache(log, redis_client, db, batch_size: int = STOCK_WARMUP_BATCH, lease: bool = True):
+    """
+    Returns {"items", "failed", "seconds", "items_per_s"}, or None when another
+    worker holds the lease or the scan failed.
+    """
+    token = None
+    if lease:
+        token = redis_client.acquire_lease(WARMUP_LEASE_KEY, STOCK_WARMUP_LEASE_SEC * 1000)
+        if token is None:
+            log.info(msg="stock warm-up skipped, lease held elsewhere")
+            return None
+    t0 = last = now_ns()
+    items = failed = 0
+    try:
+        for rows in db.iter_stock(batch_size):
+            if not redis_client.set_stock_cached_many(dict(rows)):
+                failed += len(rows)
+            items += len(rows)
+            if elapsed(last) >= STOCK_WARMUP_PROGRESS_SEC:
+                last = now_ns()
+                log.info(msg="stock warm-up progress", items=items, failed=failed, seconds=round(elapsed(t0), 1))
+    except Exception as e:
+        log.error(msg="stock warm-up failed", items=items, err=str(e))
+        if token:
+            redis_client.release_lock(WARMUP_LEASE_KEY, token)  # let another worker retry
+        return None
+    secs = elapsed(t0)
+    result = {"items": items, "failed": failed, "seconds": round(secs, 3),
+              "items_per_s": round(items / secs) if secs else None}
+    # the lease is left to expire so workers starting right after us don't warm again
+    log.info(msg="stock warm-up done", **result)
+    return result
+
+def start_warmup(log, redis_client, db, on_done=None):
+    # background thread so worker boot and /live aren't held up by the scan
+    def run():
+        try:
+            warm_stock_cache(log, redis_client, db)
+        finally:
+            if on_done:
+                on_done()
+    t = threading.Thread(target=run, name="stock-warmup", daemon=True)
+    t.start()
+    return t
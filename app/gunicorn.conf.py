@@ -0,0 +1,15 @@
+# Gunicorn hooks for prometheus multiprocess mode (see core/metrics.py and serve.sh)
+import os, shutil
+
+def on_starting(server):
+    # stale .db files from a previous master would be summed into live counters
+    d = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if d:
+        shutil.rmtree(d, ignore_errors=True)
+        os.makedirs(d, exist_ok=True)
+
+def child_exit(server, worker):
+    # drop a dead worker's live* gauges; its counters/histograms keep counting in the total
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,107 @@
+# Admin commands against the same Postgres/Redis config as the API (run from app/):
+#   python manage.py reshard I001 8     # spread I001's stock over 8 shards (1 = unshard)
+#   python manage.py rebalance I001     # re-split evenly, keeping the shard count
+#   python manage.py warm-cache         # fill stock:<id> for every item
+#   python manage.py import items.csv   # bulk upsert via COPY (csv with header, or .jsonl), then warm
+#   python manage.py changefeed         # apply inventory change notifications to the cache (foreground)
+import argparse, json, os, sys
+from core.logging import JsonLogger
+from core.metrics import Metrics
+from core.db import DB
+from core.warmup import warm_stock_cache
+from services.checkoutService import CheckoutService
+
+def cmd_reshard(ctx, args):
+    return ctx.db.reshard(CheckoutService._parse_item_id(args.item_id), args.shards)
+
+def cmd_rebalance(ctx, args):
+    return ctx.db.reshard(CheckoutService._parse_item_id(args.item_id))
+
+def cmd_warm_cache(ctx, args):
+    return warm_stock_cache(ctx.log, ctx.redis(), ctx.db, batch_size=args.batch, lease=False)
+
+def _jsonl_rows(f):
+    for line in f:
+        if line.strip():
+            o = json.loads(line)
+            yield (CheckoutService._parse_item_id(o.get("id", o.get("item_id"))), o["name"],
+                   o.get("description", ""), int(o["price_cents"]), int(o["qty"]))
+
+def cmd_import(ctx, args):
+    fmt = args.format or ("jsonl" if args.path.endswith((".jsonl", ".ndjson")) else "csv")
+    if fmt == "csv":
+        with open(args.path, "rb") as f:
+            result = ctx.db.import_inventory(f, fmt="csv")
+    else:
+        with open(args.path, encoding="utf-8") as f:
+            result = ctx.db.import_inventory(_jsonl_rows(f), fmt="rows")
+    if result is None:
+        return None
+    # the import folds stock back into inventory.qty; spread previously sharded items again
+    resharded = {}
+    for iid, n in result.pop("sharded").items():
+        r = ctx.db.reshard(iid, n)
+        resharded[iid] = r["shards"] if r else None
+    result["resharded"] = resharded
+    if not args.no_warm:
+        result["warm"] = warm_stock_cache(ctx.log, ctx.redis(), ctx.db, batch_size=args.batch, lease=False)
+    return result
+
+def cmd_changefeed(ctx, args):
+    from core.changefeed import StockChangeFeed
+    feed = StockChangeFeed(ctx.log, ctx.metrics, ctx.redis(), ctx.db)
+    try:
+        feed.run_forever()
+    except KeyboardInterrupt:
+        feed.stop()
+    return {"stopped": True}
+
+class _Ctx:
+    def __init__(self):
+        self.log = JsonLogger(service="manage")
+        self.metrics = Metrics()
+        self.db = DB(logger=self.log, metrics=self.metrics)
+        self._redis = None
+
+    def redis(self):
+        if self._redis is None:
+            from core.redis_client import RedisClient
+            self._redis = RedisClient(logger=self.log, metrics=self.metrics, l1=False)
+        return self._redis
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="AICS admin commands")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("reshard", help="change an item's stock shard count online")
+    p.add_argument("item_id")
+    p.add_argument("shards", type=int)
+    p.set_defaults(fn=cmd_reshard)
+    p = sub.add_parser("rebalance", help="even out an item's shards")
+    p.add_argument("item_id")
+    p.set_defaults(fn=cmd_rebalance)
+    p = sub.add_parser("warm-cache", help="stream inventory into the Redis stock cache")
+    p.add_argument("--batch", type=int, default=int(os.getenv("STOCK_WARMUP_BATCH", "1000")))
+    p.set_defaults(fn=cmd_warm_cache)
+    p = sub.add_parser("import", help="bulk upsert inventory from CSV or JSONL via COPY")
+    p.add_argument("path")
+    p.add_argument("--format", choices=["csv", "jsonl"], default=None, help="default: from the file extension")
+    p.add_argument("--no-warm", action="store_true", help="skip the cache warm-up afterwards")
+    p.add_argument("--batch", type=int, default=int(os.getenv("STOCK_WARMUP_BATCH", "1000")))
+    p.set_defaults(fn=cmd_import)
+    p = sub.add_parser("changefeed", help="listen for inventory changes and refresh the stock cache")
+    p.set_defaults(fn=cmd_changefeed)
+    args = ap.parse_args(argv)
+
+    ctx = _Ctx()
+    try:
+        result = args.fn(ctx, args)
+    finally:
+        ctx.db.close()
+    if result is None:
+        print(f"{args.cmd} failed (see log)", file=sys.stderr)
+        return 1
+    print(json.dumps(result))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,12 @@
-import os, json, requests
+import os, sys, json, requests, threading, time
 import ollama 
 import re
 from prompt import SYSTEM_PROMPT
 from runbook import RUNBOOKS
+from promparse import MetricHistory
+from matcher import SignalMatcher
+from plancache import PlanCache, runbook_version, signature
+from retrieval import RunbookIndex, compact_logs, compact_runbook, estimate_tokens
 
 SERVER = os.getenv("MCP_SERVER", "http://127.0.0.1:8055")
 
@@ -26,43 +30,91 @@ SERVER = os.getenv("MCP_SERVER", "http://127.0.0.1:8055")
 
 ALLOWED_TOOLS = {"restart_service", "scale_service", "patch_env", "get_logs"}
 
-def scrape_metrics(url: str) -> dict[str, float]:
-    """Fetch /metrics from a service and parse into {metric: value}."""
+# rolling metric history per service; rates and quantiles need at least two scrapes
+METRICS_WINDOW_SEC = float(os.getenv("METRICS_WINDOW_SEC", "300"))
+METRICS_SAMPLE_SEC = float(os.getenv("METRICS_SAMPLE_SEC", "5"))  # gap between the two scrapes of a one-shot run
+SIGNAL_ERROR_RATIO = float(os.getenv("SIGNAL_ERROR_RATIO", "0.05"))
+SIGNAL_P95_SEC = float(os.getenv("SIGNAL_P95_SEC", "0.5"))
+SIGNAL_MAX_ROUTES = int(os.getenv("SIGNAL_MAX_ROUTES", "5"))
+_HISTORY: dict[str, MetricHistory] = {}
+
+# one keep-alive session for scrapes and tool calls (shared by the controller's threads)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+_http = requests.Session()
+_http.mount("http://", requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE))
+
+def history(service: str) -> MetricHistory:
+    return _HISTORY.setdefault(service, MetricHistory(METRICS_WINDOW_SEC))
+
+def scrape_metrics(url: str, history: MetricHistory) -> bool:
+    """Stream /metrics from a service into `history`. False if the scrape failed."""
     try:
-        r = requests.get(url, timeout=5)
-        r.raise_for_status()
-        metrics = {}
-        for line in r.text.splitlines():
-            if line.startswith("#"): 
-                continue
-            parts = line.split()
-            if len(parts) == 2:
-                name, val = parts
-                try:
-                    metrics[name] = float(val)
-                except ValueError:
-                    pass
-        return metrics
+        with _http.get(url, timeout=5, stream=True) as r:
+            r.raise_for_status()
+            history.ingest(r.iter_lines(decode_unicode=True))
+        return True
     except Exception as e:
         print("metrics scrape error:", e)
-        return {}
+        return False
+
+def _fmt(v: float) -> str:
+    return f"{v:.3g}"
+
+_DEP_NAMES = {"db": "postgres", "redis": "redis"}
+
+def derive_signals(h: MetricHistory) -> list[str]:
+    """
+    Compact planner input from the metric history: request/error rates and
+    p95/p99 latency per busy route, dependency error rates and readiness.
+    Worded so runbook signals (e.g. "redis error", "postgres") can match.
+    """
+    summary, alerts = signals(h)
+    return alerts + summary  # alerts first: the prompt's log budget keeps the head
+
+def signals(h: MetricHistory):
+    # (summary lines, alert lines); alerts are what the controller acts on
+    out, alerts = [], []
+    reqs = h.rate_by("http_requests_total", ("route", "code"))
+    by_route = {}
+    for (route, code), rps in reqs.items():
+        tot, err = by_route.get(route, (0.0, 0.0))
+        by_route[route] = (tot + rps, err + (rps if code.startswith("5") else 0.0))
+    busiest = sorted(by_route.items(), key=lambda kv: kv[1][0], reverse=True)[:SIGNAL_MAX_ROUTES]
+    for route, (rps, err) in busiest:
+        if rps <= 0:
+            continue
+        ratio = err / rps
+        p95 = h.histogram_quantile(0.95, "http_request_latency_seconds", route=route)
+        p99 = h.histogram_quantile(0.99, "http_request_latency_seconds", route=route)
+        line = f"http route={route} rps={_fmt(rps)} error_ratio={_fmt(ratio)}"
+        if p95 is not None:
+            line += f" p95={_fmt(p95)}s p99={_fmt(p99)}s"
+        out.append(line)
+        if ratio >= SIGNAL_ERROR_RATIO:
+            alerts.append(f"high 5xx error ratio {_fmt(ratio)} on {route}")
+        if p95 is not None and p95 >= SIGNAL_P95_SEC:
+            alerts.append(f"high latency p95={_fmt(p95)}s on {route}")
+
+    for metric, hint in (("redis_ops_total", "redis error"), ("db_ops_total", "postgres db error")):
+        for (op, result), rps in h.rate_by(metric, ("op", "result")).items():
+            if result not in ("ok", "busy") and rps > 0:  # busy = lost a lease race, not a fault
+                alerts.append(f"{hint} rate={_fmt(rps)}/s op={op} result={result}")
+    for key, v in h.latest("dependency_up").items():
+        if v == 0:
+            dep = dict(key).get("dep", "?")
+            alerts.append(f"dependency down: {_DEP_NAMES.get(dep, dep)}")
+    return out, alerts
 
 def collect_logs_from_metrics(service: str, port: int = 80) -> list[str]:
     url = f"http://{service}:{port}/metrics"
-    
-    metrics = scrape_metrics(url)
-    logs = []
-    
-    # Add lightweight hints for the LLM
-    for k, v in metrics.items():
-        if "http_requests_total" in k and v > 0:
-            logs.append(f"metric:{k} value={int(v)}")
-        if "redis_ops_total" in k and v > 0:
-            logs.append(f"metric:{k} value={int(v)}")
-        if "db_ops_total" in k and v > 0:
-            logs.append(f"metric:{k} value={int(v)}")
-    
-    return logs
+    h = history(service)
+    if not scrape_metrics(url, h):
+        return []
+    if h.scrapes < 2:
+        # first look at this service: take a second sample so there are rates to report
+        time.sleep(METRICS_SAMPLE_SEC)
+        scrape_metrics(url, h)
+    return derive_signals(h)
 
 
 def _extract_json(text: str) -> dict | None:
@@ -75,19 +127,51 @@ def _extract_json(text: str) -> dict | None:
     except Exception:
         return None
 
+# prompt size: only the top-k runbooks for these logs, compact JSON, logs cut to a budget
+RUNBOOK_TOP_K = int(os.getenv("RUNBOOK_TOP_K", "3"))
+LLM_LOG_TOKENS = int(os.getenv("LLM_LOG_TOKENS", "200"))
+LLM_NUM_CTX = int(os.getenv("LLM_NUM_CTX", "512"))
+_INDEX = RunbookIndex(RUNBOOKS)
+_LLM_STATS = {"calls": 0, "prompt_tokens": 0, "eval_tokens": 0, "seconds": 0.0}
+_LLM_STATS_LOCK = threading.Lock()  # updated from the controller's planner threads
+
+def llm_stats() -> dict:
+    with _LLM_STATS_LOCK:
+        s = dict(_LLM_STATS)
+    s["avg_ms"] = round(s["seconds"] / s["calls"] * 1000) if s["calls"] else None
+    return s
+
 def llm_choose_action(service: str, logs: list[str]) -> dict:
-    payload = {"service": service, "logs": logs, "runbooks": RUNBOOKS}
+    payload = {
+        "service": service,
+        "logs": compact_logs(logs, LLM_LOG_TOKENS),
+        "runbooks": [compact_runbook(rb) for rb in _INDEX.top_k(logs, RUNBOOK_TOP_K)],
+    }
+    content = json.dumps(payload, separators=(",", ":"))
 
     def _ask(prompt_suffix: str = "") -> dict | None:
+        t0 = time.perf_counter()
         resp = ollama.chat(
             model=os.getenv("OLLAMA_MODEL", "qwen2.5:1.5b-instruct"),
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT + prompt_suffix},
-                {"role": "user", "content": json.dumps(payload, indent=2)},
+                {"role": "user", "content": content},
             ],
             # keep memory small; force json-only output
-            options={"temperature": 0, "num_ctx": 512, "num_predict": 128, "format": "json"},
+            options={"temperature": 0, "num_ctx": LLM_NUM_CTX, "num_predict": 128, "format": "json"},
         )
+        secs = time.perf_counter() - t0
+        # prompt_eval_count is the model's own count; the estimate shows what we sent
+        prompt_tokens = resp.get("prompt_eval_count") or 0
+        with _LLM_STATS_LOCK:
+            _LLM_STATS["calls"] += 1
+            _LLM_STATS["prompt_tokens"] += prompt_tokens
+            _LLM_STATS["eval_tokens"] += resp.get("eval_count") or 0
+            _LLM_STATS["seconds"] += secs
+        print(json.dumps({"event": "llm call", "service": service, "prompt_tokens": prompt_tokens,
+                          "est_prompt_tokens": estimate_tokens(SYSTEM_PROMPT + prompt_suffix + content),
+                          "eval_tokens": resp.get("eval_count"), "runbooks": len(payload["runbooks"]),
+                          "latency_ms": round(secs * 1000)}), flush=True)
         text = resp["message"]["content"].strip()
         # First try direct JSON
         try:
@@ -129,10 +213,64 @@ def llm_choose_action(service: str, logs: list[str]) -> dict:
 
     return plan
 
+# deterministic fast path: runbook signals matched against the logs, LLM only when
+# nothing matches well enough or two runbooks tie (RULES=0 always asks the LLM)
+RULES = os.getenv("RULES", "1") == "1"
+RULES_MIN_COVERAGE = float(os.getenv("RULES_MIN_COVERAGE", "0.5"))
+_MATCHER = SignalMatcher(RUNBOOKS, min_coverage=RULES_MIN_COVERAGE)
+
+def rule_action(service: str, logs: list[str]) -> tuple[dict | None, dict]:
+    if not RULES:
+        return None, {"why": "disabled", "ms": 0.0}
+    plan, info = _MATCHER.decide(service, logs)
+    if plan and plan["tool"] not in ALLOWED_TOOLS:
+        return None, dict(info, why="tool not allowed")
+    return plan, info
+
+# LLM decisions memoized per incident signature (see plancache.py); PLAN_CACHE=0 disables
+PLAN_CACHE = os.getenv("PLAN_CACHE", "1") == "1"
+_RUNBOOK_VERSION = runbook_version(RUNBOOKS)
+_PLANS = PlanCache(
+    max_entries=int(os.getenv("PLAN_CACHE_MAX", "1024")),
+    ttl_sec=float(os.getenv("PLAN_CACHE_TTL_SEC", "600")),
+    path=os.getenv("PLAN_CACHE_PATH") or None,
+    redis_url=os.getenv("PLAN_CACHE_REDIS_URL") or None,
+) if PLAN_CACHE else None
+
+def cached_plan(service: str, logs: list[str]) -> dict | None:
+    if _PLANS is None:
+        return None
+    return _PLANS.get(signature(service, logs, _RUNBOOK_VERSION))
+
+def remember_plan(service: str, logs: list[str], plan: dict):
+    # fallbacks mean the model gave us nothing usable: ask again next time
+    if _PLANS is None or str(plan.get("runbook_id", "")).startswith("fallback."):
+        return
+    _PLANS.put(signature(service, logs, _RUNBOOK_VERSION), plan)
+
+def plan_cache_stats() -> dict | None:
+    return _PLANS.stats() if _PLANS else None
+
+def choose_action(service: str, logs: list[str]) -> dict:
+    """
+    Rules first, then the plan cache, then the LLM. The plan records which path
+    decided it (rules|cache|llm) and how long that took.
+    """
+    plan, info = rule_action(service, logs)
+    if plan:
+        return dict(plan, decided_by="rules", decide_ms=info["ms"])
+    t0 = time.perf_counter()
+    plan = cached_plan(service, logs)
+    if plan:
+        return dict(plan, decided_by="cache", decide_ms=round((time.perf_counter() - t0) * 1000, 3))
+    plan = llm_choose_action(service, logs)
+    remember_plan(service, logs, plan)
+    return dict(plan, decided_by="llm", decide_ms=round((time.perf_counter() - t0) * 1000, 3), rules=info["why"])
+
 def call_tool(tool: str, params: dict, logs: list[str]):
     body = dict(params)
     body["logs"] = logs
-    r = requests.post(f"{SERVER}/tool/{tool}", json=body, timeout=10)
+    r = _http.post(f"{SERVER}/tool/{tool}", json=body, timeout=10)
     r.raise_for_status()
     return r.json()
 
@@ -150,11 +288,18 @@ def main():
     echo = call_tool("get_logs", {"service": service}, logs)
     print("== get_logs:", echo)
 
-    plan = llm_choose_action(service, logs)
+    plan = choose_action(service, logs)
     print("== plan:", plan)
 
     result = call_tool(plan["tool"], plan["params"], logs)
     print("== exec:", result)
 
 if __name__ == "__main__":
-    main()
+    # --watch (or CONTROLLER=1): long-running multi-service loop, see controller.py.
+    # Exec it rather than import it: controller does `import client`, which under
+    # `python client.py` would load a second copy of this module next to __main__.
+    if "--watch" in sys.argv or os.getenv("CONTROLLER") == "1":
+        controller = os.path.join(os.path.dirname(os.path.abspath(__file__)), "controller.py")
+        os.execv(sys.executable, [sys.executable, "-u", controller])
+    else:
+        main()
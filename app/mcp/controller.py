@@ -0,0 +1,173 @@
+# Long-running remediation loop: `python controller.py` (`client.py --watch` execs this).
+# Every CONTROLLER_INTERVAL_SEC all SERVICES are scraped in parallel over the client's
+# keep-alive session. Alerts that the runbook matcher or the plan cache resolve are
+# acted on at once; the rest go to one shared planner queue (LLM_CONCURRENCY workers; Ollama on CPU does
+# one inference at a time anyway), and their action runs on the I/O pool. Each service has its own cooldown and the
+# runbooks' guardrails.max_actions are enforced per service per GUARDRAIL_WINDOW_SEC.
+import os, json, time, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import client
+from runbook import RUNBOOKS
+
+# "api,checkout-canary:8080" - port defaults to 80
+SERVICES = os.getenv("SERVICES", os.getenv("SERVICE", "api"))
+CONTROLLER_INTERVAL_SEC = float(os.getenv("CONTROLLER_INTERVAL_SEC", "15"))
+CONTROLLER_IO_WORKERS = int(os.getenv("CONTROLLER_IO_WORKERS", "16"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "1"))
+ACTION_COOLDOWN_SEC = float(os.getenv("ACTION_COOLDOWN_SEC", "120"))
+GUARDRAIL_WINDOW_SEC = float(os.getenv("GUARDRAIL_WINDOW_SEC", "900"))
+PLAN_CACHE_STATS_TICKS = int(os.getenv("PLAN_CACHE_STATS_TICKS", "20"))  # log plan cache / LLM stats every N ticks
+
+_RUNBOOKS = {rb["id"]: rb for rb in RUNBOOKS}
+
+def _emit(**kw):
+    print(json.dumps(kw), flush=True)
+
+def parse_services(spec: str):
+    out = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, port = item.partition(":")
+        out.append(ServiceState(name, int(port or 80)))
+    return out
+
+class ServiceState:
+    __slots__ = ("name", "port", "busy", "last_action", "actions")
+
+    def __init__(self, name: str, port: int = 80):
+        self.name = name
+        self.port = port
+        self.busy = False        # a decision for this service is queued or running
+        self.last_action = 0.0   # monotonic time of the last non-get_logs action
+        self.actions = {}        # runbook id -> deque of action times in the guardrail window
+
+    def cooling_down(self, now: float) -> bool:
+        return now - self.last_action < ACTION_COOLDOWN_SEC
+
+    def allowed(self, runbook_id: str, now: float) -> bool:
+        limit = (_RUNBOOKS.get(runbook_id, {}).get("guardrails") or {}).get("max_actions")
+        if limit is None:
+            return True
+        times = self.actions.setdefault(runbook_id, deque())
+        while times and now - times[0] > GUARDRAIL_WINDOW_SEC:
+            times.popleft()
+        return len(times) < limit
+
+    def record(self, runbook_id: str, now: float):
+        self.last_action = now
+        self.actions.setdefault(runbook_id, deque()).append(now)
+
+class Controller:
+    def __init__(self, services):
+        self.services = services
+        self.io = ThreadPoolExecutor(max_workers=CONTROLLER_IO_WORKERS, thread_name_prefix="io")
+        self.planner = ThreadPoolExecutor(max_workers=LLM_CONCURRENCY, thread_name_prefix="planner")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._ticks = 0
+
+    def run_forever(self):
+        _emit(event="controller started", services=[s.name for s in self.services],
+              interval_s=CONTROLLER_INTERVAL_SEC)
+        while not self._stop.is_set():
+            t0 = time.monotonic()
+            self.tick()
+            self._stop.wait(max(0.0, CONTROLLER_INTERVAL_SEC - (time.monotonic() - t0)))
+
+    def stop(self):
+        self._stop.set()
+        self.planner.shutdown(wait=False, cancel_futures=True)
+        self.io.shutdown(wait=False, cancel_futures=True)
+
+    def tick(self):
+        # scrapes are bounded by their HTTP timeout; planning carries over into later ticks
+        for svc, f in [(s, self.io.submit(self._check, s)) for s in self.services]:
+            try:
+                f.result()
+            except Exception as e:
+                # one service's scrape/signal failure must not stop the loop for the others
+                _emit(event="check error", service=svc.name, err=str(e))
+        self._ticks += 1
+        if PLAN_CACHE_STATS_TICKS and self._ticks % PLAN_CACHE_STATS_TICKS == 0:
+            stats = client.plan_cache_stats()
+            if stats:
+                _emit(event="plan cache", **stats)
+            _emit(event="llm", **client.llm_stats())
+
+    def _check(self, svc: ServiceState):
+        h = client.history(svc.name)
+        if not client.scrape_metrics(f"http://{svc.name}:{svc.port}/metrics", h):
+            return
+        summary, alerts = client.signals(h)
+        if not alerts:
+            return
+        detected = time.monotonic()
+        with self._lock:
+            if svc.busy or svc.cooling_down(detected):
+                return
+            svc.busy = True
+        try:
+            logs = alerts + summary
+            # a clear rule match is acted on right here; only the rest waits for the LLM
+            plan, info = client.rule_action(svc.name, logs)
+            if plan:
+                self._act(svc, dict(plan, decided_by="rules", decide_ms=info["ms"]), logs, detected, 0.0)
+                return
+            # so is an incident we've already planned for
+            t0 = time.monotonic()
+            plan = client.cached_plan(svc.name, logs)
+            if plan:
+                plan = dict(plan, decided_by="cache", decide_ms=round((time.monotonic() - t0) * 1000, 3))
+                self._act(svc, plan, logs, detected, 0.0)
+            else:
+                self.planner.submit(self._plan, svc, logs, detected)
+        except Exception as e:
+            _emit(event="check error", service=svc.name, err=str(e))
+            svc.busy = False
+
+    def _plan(self, svc: ServiceState, logs, detected: float):
+        try:
+            started = time.monotonic()
+            plan = client.llm_choose_action(svc.name, logs)
+            client.remember_plan(svc.name, logs, plan)
+            plan = dict(plan, decided_by="llm", decide_ms=round((time.monotonic() - started) * 1000, 3))
+            self.io.submit(self._act, svc, plan, logs, detected, started - detected)
+        except Exception as e:
+            _emit(event="plan error", service=svc.name, err=str(e))
+            svc.busy = False
+
+    def _act(self, svc: ServiceState, plan: dict, logs, detected: float, queued_s: float):
+        tool, rb_id = plan["tool"], plan.get("runbook_id")
+        outcome = "ok"
+        try:
+            now = time.monotonic()
+            if tool != "get_logs":
+                with self._lock:
+                    if svc.cooling_down(now):
+                        outcome = "cooldown"
+                    elif not svc.allowed(rb_id, now):
+                        outcome = "guardrail"
+                    else:
+                        svc.record(rb_id, now)
+            if outcome == "ok":
+                client.call_tool(tool, plan["params"], logs)
+        except Exception as e:
+            outcome = f"error: {e}"
+        finally:
+            svc.busy = False
+        _emit(event="action", service=svc.name, runbook=rb_id, tool=tool, outcome=outcome,
+              decided_by=plan.get("decided_by"), decide_ms=plan.get("decide_ms"),
+              queued_ms=round(queued_s * 1000), detect_to_action_ms=round((time.monotonic() - detected) * 1000))
+
+def main():
+    ctl = Controller(parse_services(SERVICES))
+    try:
+        ctl.run_forever()
+    except KeyboardInterrupt:
+        ctl.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# Async Kubernetes action executor for the MCP server.
+# Actions on one deployment are serialized and coalesced: everything that arrives within
+# COALESCE_WINDOW_MS of the first pending action (plus anything queued while an earlier
+# patch for the same deployment is in flight) becomes ONE strategic-merge patch, so env
+# updates from several callers are merged, a restart is done once, and a scale rides along
+# without its own round trip. The blocking kubernetes client runs in worker threads.
+# With a deployment cache (informer.py) the batch is first checked against the current
+# state: env values already set, a scale to the current replica count, and a restart
+# within RESTART_MIN_INTERVAL_SEC of one this server issued are dropped. Rollout state is
+# not a reason to skip: a crash-looping or stalled rollout never completes, and restarting
+# it is what the runbooks ask for.
+import asyncio, datetime, os
+from informer import RESTART_ANNOTATION, RESTARTED_BY_MCP_ANNOTATION, own_restart_at
+
+COALESCE_WINDOW_MS = int(os.getenv("COALESCE_WINDOW_MS", "500"))
+RESTART_MIN_INTERVAL_SEC = float(os.getenv("RESTART_MIN_INTERVAL_SEC", "60"))
+
+class _Batch:
+    __slots__ = ("env", "restart", "reasons", "replicas", "waiters")
+
+    def __init__(self):
+        self.env = {}
+        self.restart = False
+        self.reasons = []
+        self.replicas = None
+        self.waiters = []
+
+    def merge(self, env=None, restart=False, reason=None, replicas=None):
+        if env:
+            self.env.update({k: str(v) for k, v in env.items()})  # later callers win per key
+        if restart:
+            self.restart = True
+            if reason and reason not in self.reasons:
+                self.reasons.append(reason)
+        if replicas is not None:
+            self.replicas = int(replicas)
+
+class ActionExecutor:
+    """
+    await executor.submit(deploy, env=..., restart=..., reason=..., replicas=...)
+    -> {"deployment", "coalesced", "env", "restarted_at", "reasons", "replicas", "skipped"}
+    describing the combined patch the action went out in (shared by every coalesced
+    caller); env/restarted_at/replicas only list what was actually changed.
+    """
+    def __init__(self, apps_api, namespace: str, window_ms: int = COALESCE_WINDOW_MS, state=None):
+        self.api = apps_api
+        self.namespace = namespace
+        self.window = window_ms / 1000.0
+        self.state = state  # DeploymentInformer or None (then every action is applied as asked)
+        self._pending = {}  # deployment -> _Batch not yet sent
+        self._locks = {}    # deployment -> asyncio.Lock, one patch in flight per deployment
+        self._tasks = set()  # keep flush tasks referenced until they finish
+
+    async def submit(self, deploy: str, env=None, restart: bool = False, reason: str = None, replicas=None):
+        batch = self._pending.get(deploy)
+        if batch is None:
+            batch = self._pending[deploy] = _Batch()
+            task = asyncio.create_task(self._flush_later(deploy, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        batch.merge(env=env, restart=restart, reason=reason, replicas=replicas)
+        fut = asyncio.get_running_loop().create_future()
+        batch.waiters.append(fut)
+        return await fut
+
+    async def _flush_later(self, deploy: str, batch: _Batch):
+        await asyncio.sleep(self.window)
+        lock = self._locks.setdefault(deploy, asyncio.Lock())
+        async with lock:
+            # from here on new actions start the next batch
+            if self._pending.get(deploy) is batch:
+                del self._pending[deploy]
+            try:
+                result = await self._apply(deploy, batch)
+            except Exception as e:
+                for f in batch.waiters:
+                    if not f.done():
+                        f.set_exception(e)
+                return
+            for f in batch.waiters:
+                if not f.done():
+                    f.set_result(result)
+
+    async def _deployment(self, deploy: str):
+        dep = self.state.get(deploy) if self.state else None
+        if dep is None:
+            dep = await asyncio.to_thread(self.api.read_namespaced_deployment, name=deploy, namespace=self.namespace)
+        if not dep.spec.template.spec.containers:
+            raise RuntimeError("Deployment has no containers")
+        return dep
+
+    def _prune(self, dep, env: dict, restart: bool, replicas):
+        # -> (env, restart, replicas, skipped) without the parts that wouldn't change anything
+        skipped = []
+        current = {e.name: e.value for e in dep.spec.template.spec.containers[0].env or []}
+        same = [k for k, v in env.items() if current.get(k) == v]
+        if same:
+            env = {k: v for k, v in env.items() if k not in same}
+            skipped.append(f"env already set: {','.join(same)}")
+        if replicas is not None and dep.spec.replicas == replicas:
+            skipped.append(f"already at {replicas} replicas")
+            replicas = None
+        if restart and not env:
+            last = own_restart_at(dep)
+            age = (datetime.datetime.now(datetime.timezone.utc) - last).total_seconds() if last else None
+            if age is not None and age < RESTART_MIN_INTERVAL_SEC:
+                skipped.append(f"restarted {int(age)}s ago")
+                restart = False
+        return env, restart, replicas, skipped
+
+    async def _apply(self, deploy: str, b: _Batch):
+        spec, template = {}, {}
+        ts = None
+        env, restart, replicas, skipped = dict(b.env), b.restart, b.replicas, []
+        dep = await self._deployment(deploy) if (env or self.state) else None
+        if dep is not None and self.state:
+            env, restart, replicas, skipped = self._prune(dep, env, restart, replicas)
+        if env:
+            # strategic merge: containers and env entries merge by name, no read-modify-write
+            template["spec"] = {"containers": [{"name": dep.spec.template.spec.containers[0].name,
+                                                "env": [{"name": k, "value": v} for k, v in env.items()]}]}
+        if restart or env:
+            # env changes roll the pods anyway; the annotation makes the restart explicit
+            ts = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            template["metadata"] = {"annotations": {RESTART_ANNOTATION: ts, RESTARTED_BY_MCP_ANNOTATION: ts}}
+        if template:
+            spec["template"] = template
+        if replicas is not None:
+            spec["replicas"] = replicas
+        if spec:
+            patched = await asyncio.to_thread(self.api.patch_namespaced_deployment,
+                                              name=deploy, namespace=self.namespace, body={"spec": spec})
+            if self.state and patched is not None:
+                self.state.observe(patched)
+        return {"deployment": deploy, "coalesced": len(b.waiters), "env": env,
+                "restarted_at": ts, "reasons": list(b.reasons), "replicas": replicas, "skipped": skipped}
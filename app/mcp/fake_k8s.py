@@ -0,0 +1,129 @@
+# In-memory stand-in for the AppsV1Api calls the MCP server makes, so the tools can be
+# exercised without a cluster (K8S_FAKE=1). Objects mimic the attribute shape of the
+# kubernetes client models; patches apply the strategic-merge subset we send (replicas,
+# template annotations, container env merged by name). Every template change counts
+# as a rollout, which is what coalescing is meant to keep down. Watch stands in for
+# kubernetes.watch.Watch over list_namespaced_deployment(watch=True) and follows the
+# resourceVersion protocol closely enough for informer.py, including 410 Gone for
+# versions older than the retained event history.
+import copy, threading, time
+from collections import deque
+from types import SimpleNamespace as NS
+
+class ApiException(Exception):
+    def __init__(self, status: int, reason: str = ""):
+        super().__init__(f"({status}) {reason}")
+        self.status = status
+        self.reason = reason
+
+def _deployment(name: str, namespace: str, container: str, replicas: int, env=None):
+    return NS(
+        metadata=NS(name=name, namespace=namespace, resource_version="1", generation=1, annotations={}),
+        spec=NS(replicas=replicas, template=NS(
+            metadata=NS(annotations={}),
+            spec=NS(containers=[NS(name=container, env=[NS(name=k, value=str(v)) for k, v in (env or {}).items()])]),
+        )),
+        status=NS(replicas=replicas, ready_replicas=replicas, updated_replicas=replicas,
+                  available_replicas=replicas, observed_generation=1),
+    )
+
+class FakeAppsV1Api:
+    def __init__(self, namespace: str = "ops", deployments=None):
+        # deployments: {name: {"container": str, "replicas": int, "env": {...}}}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._rv = 1
+        self._items = {}
+        self._events = deque(maxlen=256)  # (rv, type, object) for watchers
+        self.patches = []   # (name, body) in call order
+        self.rollouts = {}  # name -> template changes
+        self.reads = 0
+        self.lists = 0
+        for name, d in (deployments or {"api": {}}).items():
+            self._items[(namespace, name)] = _deployment(name, namespace, d.get("container", name),
+                                                         d.get("replicas", 1), d.get("env"))
+
+    def _get(self, name, namespace):
+        dep = self._items.get((namespace, name))
+        if dep is None:
+            raise ApiException(404, f"deployments.apps \"{name}\" not found")
+        return dep
+
+    def read_namespaced_deployment(self, name: str, namespace: str):
+        with self._lock:
+            self.reads += 1
+            return copy.deepcopy(self._get(name, namespace))
+
+    def patch_namespaced_deployment(self, name: str, namespace: str, body: dict):
+        with self._lock:
+            dep = self._get(name, namespace)
+            spec = body.get("spec") or {}
+            if "replicas" in spec:
+                dep.spec.replicas = int(spec["replicas"])
+                dep.status.replicas = dep.status.ready_replicas = dep.spec.replicas
+                dep.status.available_replicas = dep.status.updated_replicas = dep.spec.replicas
+            tpl = spec.get("template") or {}
+            if tpl:
+                ann = (tpl.get("metadata") or {}).get("annotations") or {}
+                dep.spec.template.metadata.annotations.update(ann)
+                for c in (tpl.get("spec") or {}).get("containers") or []:
+                    target = next((x for x in dep.spec.template.spec.containers if x.name == c["name"]), None)
+                    if target is None:
+                        raise ApiException(422, f"unknown container {c['name']}")
+                    cur = {e.name: e for e in target.env or []}
+                    for e in c.get("env") or []:
+                        cur[e["name"]] = NS(name=e["name"], value=e.get("value"))
+                    target.env = list(cur.values())
+                dep.metadata.generation += 1
+                dep.status.observed_generation = dep.metadata.generation
+                self.rollouts[name] = self.rollouts.get(name, 0) + 1
+            self._rv += 1
+            dep.metadata.resource_version = str(self._rv)
+            self.patches.append((name, copy.deepcopy(body)))
+            self._events.append((self._rv, "MODIFIED", copy.deepcopy(dep)))
+            self._changed.notify_all()
+            return copy.deepcopy(dep)
+
+    def list_namespaced_deployment(self, namespace: str, watch: bool = False, resource_version: str = None,
+                                   timeout_seconds: int = None, _stop=None, **_):
+        if watch:
+            return self._watch(namespace, resource_version, timeout_seconds or 300, _stop or threading.Event())
+        with self._lock:
+            self.lists += 1
+            items = [copy.deepcopy(d) for (ns, _n), d in sorted(self._items.items()) if ns == namespace]
+            return NS(metadata=NS(resource_version=str(self._rv)), items=items)
+
+    def _watch(self, namespace, resource_version, timeout_seconds, stop):
+        # {"type", "object"} events after resource_version until timeout_seconds pass or stop is set
+        rv = int(resource_version or self._rv)
+        deadline = time.monotonic() + timeout_seconds
+        while not stop.is_set():
+            with self._lock:
+                if self._events and rv < self._events[0][0] - 1:
+                    raise ApiException(410, "too old resource version")
+                pending = [e for e in self._events if e[0] > rv and e[2].metadata.namespace == namespace]
+                if not pending:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        return
+                    self._changed.wait(left)
+                    continue
+            for ev_rv, typ, obj in pending:
+                rv = ev_rv
+                yield {"type": typ, "object": copy.deepcopy(obj)}
+
+class Watch:
+    """kubernetes.watch.Watch for FakeAppsV1Api: stream(api.list_namespaced_deployment, **kw)."""
+    def __init__(self):
+        self._stop = threading.Event()
+        self._api = None
+
+    def stop(self):
+        self._stop.set()
+        if self._api is not None:
+            with self._api._lock:
+                self._api._changed.notify_all()  # wake a stream waiting for events
+
+    def stream(self, func, *args, **kwargs):
+        self._api = func.__self__
+        return func(*args, watch=True, _stop=self._stop, **kwargs)
@@ -0,0 +1,168 @@
+# Watch-based cache of the deployments in one namespace for the MCP server.
+# List once, then watch from the list's resourceVersion and apply ADDED/MODIFIED/DELETED
+# events; bookmarks advance the version, and a 410 Gone (version compacted away) or a
+# broken stream relists. Tools read from here instead of a GET per action, which is
+# what lets them skip no-op scales/restarts and keeps API-server load flat as clients grow.
+import copy, datetime, os, threading
+
+INFORMER_WATCH_TIMEOUT_SEC = int(os.getenv("INFORMER_WATCH_TIMEOUT_SEC", "300"))
+INFORMER_RETRY_SEC = float(os.getenv("INFORMER_RETRY_SEC", "2"))
+RESTART_ANNOTATION = "kubectl.kubernetes.io/restartedAt"
+# the executor copies its restartedAt value here, so its own restarts can be told apart
+# from `kubectl rollout restart` and other tools writing the same annotation
+RESTARTED_BY_MCP_ANNOTATION = "aics.mcp/restartedAt"
+
+def _status(e):
+    return getattr(e, "status", None)
+
+def _annotations(dep) -> dict:
+    return (dep.spec.template.metadata.annotations or {}) if dep.spec.template.metadata else {}
+
+def _parse_ts(ts):
+    if not ts:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(ts.rstrip("Z")).replace(tzinfo=datetime.timezone.utc)
+    except ValueError:
+        return None
+
+def _older(dep, than) -> bool:
+    # resourceVersions are opaque strings; compare them only when both are integers (they
+    # are on etcd-backed servers) and otherwise treat the incoming object as current
+    a, b = dep.metadata.resource_version, than.metadata.resource_version
+    return bool(a and b and a.isdigit() and b.isdigit() and int(a) < int(b))
+
+def restarted_at(dep):
+    # datetime of the last rollout restart, or None
+    return _parse_ts(_annotations(dep).get(RESTART_ANNOTATION))
+
+def own_restart_at(dep):
+    # datetime of the last restart if the MCP server issued it, else None
+    ann = _annotations(dep)
+    ts = ann.get(RESTART_ANNOTATION)
+    return _parse_ts(ts) if ts and ann.get(RESTARTED_BY_MCP_ANNOTATION) == ts else None
+
+def rollout_state(dep) -> dict:
+    # the same conditions `kubectl rollout status` waits on
+    st = dep.status
+    desired = dep.spec.replicas if dep.spec.replicas is not None else 1
+    updated = st.updated_replicas or 0
+    available = st.available_replicas or 0
+    if (st.observed_generation or 0) < (dep.metadata.generation or 0):
+        state = "progressing"  # controller hasn't seen the latest spec yet
+    elif updated < desired or (st.replicas or 0) > updated or available < updated:
+        state = "progressing"
+    else:
+        state = "complete"
+    ts = restarted_at(dep)
+    return {
+        "name": dep.metadata.name, "state": state, "replicas": desired,
+        "updated": updated, "ready": st.ready_replicas or 0, "available": available,
+        "generation": dep.metadata.generation, "observed_generation": st.observed_generation,
+        "restarted_at": ts.isoformat() if ts else None,
+        "resource_version": dep.metadata.resource_version,
+    }
+
+class DeploymentInformer:
+    def __init__(self, apps_api, namespace: str, watch_cls):
+        # watch_cls: kubernetes.watch.Watch (fake_k8s.Watch with the fake API)
+        self.api = apps_api
+        self.namespace = namespace
+        self.watch_cls = watch_cls
+        self.synced = threading.Event()  # set after the first successful list
+        self.resource_version = None
+        self.stats = {"lists": 0, "events": 0, "relists_410": 0, "errors": 0}
+        self._items = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watch = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="deploy-informer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._watch is not None:
+            self._watch.stop()
+
+    # ---- reads ----
+    def get(self, name: str):
+        # cached deployment (a copy, callers may not mutate the cache) or None
+        with self._lock:
+            dep = self._items.get(name)
+        return copy.deepcopy(dep) if dep is not None else None
+
+    def rollout(self, name: str):
+        with self._lock:
+            dep = self._items.get(name)
+            return rollout_state(dep) if dep is not None else None
+
+    def rollouts(self):
+        with self._lock:
+            return [rollout_state(d) for _, d in sorted(self._items.items())]
+
+    def observe(self, dep):
+        # fold in an object we just wrote (the executor's patch response) ahead of its
+        # watch event, so the next read doesn't see the state from before our own write
+        with self._lock:
+            cur = self._items.get(dep.metadata.name)
+            if cur is None or not _older(dep, cur):
+                self._items[dep.metadata.name] = dep
+
+    # ---- list + watch ----
+    def _list(self):
+        res = self.api.list_namespaced_deployment(namespace=self.namespace)
+        with self._lock:
+            self._items = {d.metadata.name: d for d in res.items}
+        self.stats["lists"] += 1
+        self.synced.set()
+        return res.metadata.resource_version
+
+    def _stream(self, rv: str):
+        kw = dict(namespace=self.namespace, resource_version=rv,
+                  timeout_seconds=INFORMER_WATCH_TIMEOUT_SEC, allow_watch_bookmarks=True)
+        self._watch = self.watch_cls()
+        return self._watch.stream(self.api.list_namespaced_deployment, **kw)
+
+    def _run(self):
+        rv = None
+        while not self._stop.is_set():
+            try:
+                if rv is None:
+                    rv = self._list()
+                self.resource_version = rv
+                for ev in self._stream(rv):
+                    if self._stop.is_set():
+                        return
+                    typ, obj = ev["type"], ev["object"]
+                    if typ == "ERROR":
+                        code = getattr(obj, "code", None) or (ev.get("raw_object") or {}).get("code")
+                        if code == 410:
+                            self.stats["relists_410"] += 1
+                            rv = None
+                            break
+                        raise RuntimeError(f"watch error event: {code}")
+                    rv = self.resource_version = obj.metadata.resource_version
+                    if typ == "BOOKMARK":
+                        continue
+                    self.stats["events"] += 1
+                    with self._lock:
+                        cur = self._items.get(obj.metadata.name)
+                        if typ == "DELETED":
+                            self._items.pop(obj.metadata.name, None)
+                        elif cur is None or not _older(obj, cur):
+                            # an event older than what observe() stored predates our own write
+                            self._items[obj.metadata.name] = obj
+                # stream timed out cleanly: resume from the last version seen
+            except Exception as e:
+                if _status(e) == 410:
+                    self.stats["relists_410"] += 1
+                    rv = None
+                    continue
+                self.stats["errors"] += 1
+                print("informer error:", e)
+                rv = None  # we may have missed events: relist after the backoff
+                self._stop.wait(INFORMER_RETRY_SEC)
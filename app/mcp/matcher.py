@@ -0,0 +1,108 @@
+# Deterministic runbook matcher, consulted before the LLM planner.
+# Every runbook signal pattern (logs.contains_any entries and k8s.reason) goes into one
+# regex, built as a character trie (so each position costs the depth of the trie,
+# not the number of patterns), and one scan over the joined, lowercased log lines finds
+# the hits of every runbook at once. The trie sits in a lookahead so the scan reports a
+# match at every position (overlapping hits included), longest pattern first; shorter
+# patterns that are a prefix of a hit are credited from a precomputed table.
+import re, time
+
+def _trie_regex(pats) -> str:
+    trie = {}
+    for p in pats:
+        node = trie
+        for ch in p:
+            node = node.setdefault(ch, {})
+        node[""] = {}  # end of a pattern
+    def build(node):
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        # a pattern ends here: the longer continuation is optional (greedy, so longest first)
+        return "(?:" + body + ")?" if "" in node else body
+    return build(trie)
+
+def _signal_patterns(rb: dict):
+    # -> [(signal name, [lowercased patterns])]
+    out = []
+    for name, spec in (rb.get("signals") or {}).items():
+        pats = spec if isinstance(spec, (list, tuple)) else [spec]
+        pats = [str(p).lower() for p in pats if str(p).strip()]
+        if pats:
+            out.append((name, pats))
+    return out
+
+class SignalMatcher:
+    """
+    SignalMatcher(RUNBOOKS).decide(service, logs) -> (plan or None, info).
+    A runbook's coverage is the share of its signals with at least one hit; the
+    best runbook wins when its coverage reaches min_coverage and it beats the
+    runner-up on (coverage, distinct hits). Otherwise the caller asks the LLM.
+    """
+    def __init__(self, runbooks, min_coverage: float = 0.5):
+        self.runbooks = {rb["id"]: rb for rb in runbooks}
+        self.min_coverage = min_coverage
+        self._signals = {}  # runbook id -> [(signal name, set of patterns)]
+        owners = {}         # pattern -> {(runbook id, signal name)}
+        for rb_id, rb in self.runbooks.items():
+            sigs = _signal_patterns(rb)
+            self._signals[rb_id] = [(name, set(pats)) for name, pats in sigs]
+            for name, pats in sigs:
+                for p in pats:
+                    owners.setdefault(p, set()).add((rb_id, name))
+        self._owners = owners
+        pats = list(owners)
+        # a hit on "redis error" at some position is also a hit on "redis" there
+        self._prefixes = {p: [p[:k] for k in range(1, len(p)) if p[:k] in owners] for p in pats}
+        self._re = re.compile("(?=(" + _trie_regex(pats) + "))") if pats else None
+
+    def hits(self, text: str) -> set:
+        # distinct patterns found in text (already lowercased)
+        found = set()
+        if self._re is None:
+            return found
+        for m in self._re.finditer(text):
+            p = m.group(1)
+            if p not in found:
+                found.add(p)
+                found.update(self._prefixes[p])
+        return found
+
+    def score(self, logs, reasons=()):
+        # -> [(runbook id, coverage, distinct hits)], best first; runbooks without hits are left out
+        text = "\n".join(list(logs) + list(reasons)).lower()
+        found = self.hits(text)
+        per_rb = {}
+        for p in found:
+            for rb_id, name in self._owners[p]:
+                per_rb.setdefault(rb_id, {}).setdefault(name, set()).add(p)
+        ranked = []
+        for rb_id, by_signal in per_rb.items():
+            coverage = len(by_signal) / len(self._signals[rb_id])
+            ranked.append((rb_id, coverage, sum(len(v) for v in by_signal.values())))
+        ranked.sort(key=lambda r: (r[1], r[2]), reverse=True)
+        return ranked
+
+    def decide(self, service: str, logs, reasons=()):
+        t0 = time.perf_counter()
+        ranked = self.score(logs, reasons)
+        info = {"candidates": ranked[:3]}
+        plan = None
+        if not ranked or ranked[0][1] < self.min_coverage:
+            info["why"] = "no match"
+        elif len(ranked) > 1 and ranked[0][1:] == ranked[1][1:]:
+            info["why"] = "ambiguous"
+        else:
+            rb = self.runbooks[ranked[0][0]]
+            steps = rb.get("steps") or []
+            if steps:
+                step = steps[0]
+                params = dict(step.get("params") or {})
+                params["service"] = service
+                plan = {"runbook_id": rb["id"], "tool": step.get("action"), "params": params}
+                info["why"] = "matched"
+            else:
+                info["why"] = "runbook has no steps"
+        info["ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        return plan, info
@@ -0,0 +1,126 @@
+# Memoized planner decisions. The LLM runs at temperature 0, so the same incident gives
+# the same plan: key it on a normalized signature (service + sorted, deduplicated signal
+# lines with the numbers masked + a hash of the runbooks) and reuse it for PLAN_CACHE_TTL_SEC.
+# LRU-bounded in memory; optionally persisted to a JSON file and/or Redis so a restarted
+# client starts warm.
+import hashlib, json, os, re, tempfile, threading, time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # optional: only needed with PLAN_CACHE_REDIS_URL
+    redis = None
+
+_NUM = re.compile(r"\d+(?:\.\d+)?(?:e[-+]?\d+)?")
+
+def runbook_version(runbooks) -> str:
+    return hashlib.sha256(json.dumps(runbooks, sort_keys=True).encode()).hexdigest()[:12]
+
+def signature(service: str, signals, version: str) -> str:
+    # rates and latencies move every scrape; the shape of the incident is what matters
+    norm = sorted({_NUM.sub("#", s.strip().lower()) for s in signals if s.strip()})
+    raw = json.dumps([service, norm, version], separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+class PlanCache:
+    def __init__(self, max_entries: int = 1024, ttl_sec: float = 600, path: str = None, redis_url: str = None):
+        self.max_entries = max_entries
+        self.ttl = ttl_sec
+        self.path = path
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # signature -> (expires_at wall clock, plan)
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "remote_hits": 0}
+        self._r = None
+        if redis_url:
+            if redis is None:
+                print("plan cache: redis package not installed, PLAN_CACHE_REDIS_URL ignored")
+            else:
+                self._r = redis.Redis.from_url(redis_url, socket_timeout=0.5, decode_responses=True)
+        if path:
+            self._load()
+
+    def get(self, sig: str):
+        now = time.time()
+        with self._lock:
+            hit = self._items.get(sig)
+            if hit is not None:
+                if hit[0] > now:
+                    self._items.move_to_end(sig)
+                    self._stats["hits"] += 1
+                    return dict(hit[1])
+                del self._items[sig]
+                self._stats["expired"] += 1
+        plan = self._remote_get(sig)
+        with self._lock:
+            if plan is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._stats["remote_hits"] += 1
+        self._put_local(sig, plan, now + self.ttl)
+        return dict(plan)
+
+    def put(self, sig: str, plan: dict):
+        self._put_local(sig, plan, time.time() + self.ttl)
+        if self._r is not None:
+            try:
+                self._r.set(f"plancache:{sig}", json.dumps(plan), ex=max(1, int(self.ttl)))
+            except redis.exceptions.RedisError as e:
+                print("plan cache redis error:", e)
+        if self.path:
+            self._save()
+
+    def _put_local(self, sig, plan, expires):
+        with self._lock:
+            self._items[sig] = (expires, dict(plan))
+            self._items.move_to_end(sig)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _remote_get(self, sig):
+        if self._r is None:
+            return None
+        try:
+            raw = self._r.get(f"plancache:{sig}")
+        except redis.exceptions.RedisError as e:
+            print("plan cache redis error:", e)
+            return None
+        return json.loads(raw) if raw else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats, size=len(self._items))
+        lookups = s["hits"] + s["misses"]
+        s["hit_ratio"] = round(s["hits"] / lookups, 3) if lookups else None
+        return s
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print("plan cache load error:", e)
+            return
+        now = time.time()
+        with self._lock:
+            for sig, expires, plan in entries:
+                if expires > now:
+                    self._items[sig] = (expires, plan)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def _save(self):
+        # write-then-rename so a crash mid-write never leaves a torn file
+        with self._lock:
+            entries = [[sig, exp, plan] for sig, (exp, plan) in self._items.items()]
+        try:
+            d = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp = tempfile.mkstemp(dir=d, prefix=".plancache")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entries, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print("plan cache save error:", e)
@@ -0,0 +1,214 @@
+# Prometheus text exposition (0.0.4) parser plus a short rolling history per series,
+# so the client can work with rates and latency quantiles instead of raw counters.
+#   h = MetricHistory(window_sec=300)
+#   h.ingest(lines)                                   # one scrape
+#   h.rate("http_requests_total", code="500")         # per second, summed over series
+#   h.histogram_quantile(0.95, "http_request_latency_seconds", route="/checkout")
+import math, time
+from collections import deque
+
+def _labels(line: str, i: int):
+    # parse `{a="x",b="y\"z"}` starting at line[i] == "{"; returns (labels, index after "}")
+    labels = {}
+    n = len(line)
+    i += 1
+    while True:
+        while i < n and line[i] in " \t,":
+            i += 1
+        if i >= n:
+            raise ValueError("unterminated label set")
+        if line[i] == "}":
+            return labels, i + 1
+        eq = line.index("=", i)
+        key = line[i:eq].strip()
+        i = line.index('"', eq) + 1
+        buf = []
+        while True:
+            c = line[i]
+            if c == "\\":
+                nxt = line[i + 1]
+                buf.append("\n" if nxt == "n" else nxt)
+                i += 2
+            elif c == '"':
+                i += 1
+                break
+            else:
+                j = i
+                while j < n and line[j] not in '\\"':
+                    j += 1
+                buf.append(line[i:j])
+                i = j
+        labels[key] = "".join(buf)
+
+def parse(lines):
+    """
+    Streams samples from exposition text (a str or any iterable of lines) as
+    (name, labels, value, timestamp_ms or None). Also yields ("# TYPE", name,
+    type, None) for TYPE comments. Malformed lines are skipped.
+    """
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", "replace")
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] == "#":
+            parts = line.split(None, 3)
+            if len(parts) >= 4 and parts[1] == "TYPE":
+                yield "# TYPE", parts[2], parts[3].strip(), None
+            continue
+        try:
+            brace = line.find("{")
+            space = line.find(" ")
+            if brace != -1 and (space == -1 or brace < space):
+                name = line[:brace].strip()
+                labels, i = _labels(line, brace)
+                rest = line[i:].split()
+            else:
+                name, *rest = line.split()
+                labels = {}
+            value = float(rest[0])  # also takes NaN / +Inf / -Inf
+            ts = int(rest[1]) if len(rest) > 1 else None
+        except (ValueError, IndexError):
+            continue
+        yield name, labels, value, ts
+
+def _key(labels: dict):
+    return tuple(sorted(labels.items()))
+
+def _matches(key, match: dict) -> bool:
+    if not match:
+        return True
+    d = dict(key)
+    return all(d.get(k) == v for k, v in match.items())
+
+class MetricHistory:
+    """
+    Time-windowed samples per (name, labels). Histograms and summaries are kept
+    as their flat _bucket/_sum/_count series; `types` maps family -> TYPE.
+    """
+    def __init__(self, window_sec: float = 300):
+        self.window = window_sec
+        self.types = {}
+        self.scrapes = 0
+        self.last_scrape = None
+        self._series = {}  # name -> {labels key: deque[(t, value)]}
+
+    def ingest(self, lines, now: float = None) -> int:
+        # one scrape; samples carrying their own timestamp use it
+        now = time.time() if now is None else now
+        n = 0
+        for name, labels, value, ts in parse(lines):
+            if name == "# TYPE":
+                self.types[labels] = value
+                continue
+            by_labels = self._series.setdefault(name, {})
+            pts = by_labels.get(_key(labels))
+            if pts is None:
+                pts = by_labels[_key(labels)] = deque()
+            pts.append((ts / 1000.0 if ts is not None else now, value))
+            n += 1
+        self.scrapes += 1
+        self.last_scrape = now
+        self._trim(now)
+        return n
+
+    def _trim(self, now: float):
+        cutoff = now - self.window
+        for name in list(self._series):
+            by_labels = self._series[name]
+            for key in list(by_labels):
+                pts = by_labels[key]
+                while pts and pts[0][0] < cutoff:
+                    pts.popleft()
+                if not pts:
+                    del by_labels[key]
+            if not by_labels:
+                del self._series[name]
+
+    def names(self):
+        return list(self._series)
+
+    def series(self, name: str, **match):
+        # (labels dict, [(t, value), ...]) for every series of `name` matching the labels
+        for key, pts in self._series.get(name, {}).items():
+            if _matches(key, match):
+                yield dict(key), list(pts)
+
+    def latest(self, name: str, **match):
+        # {labels key: last value}
+        return {key: pts[-1][1] for key, pts in self._series.get(name, {}).items()
+                if pts and _matches(key, match)}
+
+    def _increase(self, pts, since: float):
+        # counter increase over the window, counting a drop as a reset (like PromQL increase())
+        pts = [p for p in pts if p[0] >= since]
+        if len(pts) < 2:
+            return None, 0.0
+        inc = 0.0
+        for (_, a), (_, b) in zip(pts, pts[1:]):
+            inc += b - a if b >= a else b
+        return inc, pts[-1][0] - pts[0][0]
+
+    def increase_by(self, name: str, by=(), window: float = None, **match):
+        """
+        Counter increase and covered seconds per group of `by` labels:
+        {(label values...): (increase, seconds)}. Series with a single point are left out.
+        """
+        since = (self.last_scrape or time.time()) - (window or self.window)
+        out = {}
+        for key, pts in self._series.get(name, {}).items():
+            if not _matches(key, match):
+                continue
+            inc, secs = self._increase(pts, since)
+            if inc is None:
+                continue
+            d = dict(key)
+            g = tuple(d.get(b, "") for b in by)
+            prev_inc, prev_secs = out.get(g, (0.0, 0.0))
+            out[g] = (prev_inc + inc, max(prev_secs, secs))
+        return out
+
+    def rate_by(self, name: str, by=(), window: float = None, **match):
+        # per-second rate per group; groups without enough history are omitted
+        return {g: inc / secs for g, (inc, secs) in self.increase_by(name, by, window, **match).items() if secs > 0}
+
+    def rate(self, name: str, window: float = None, **match):
+        rates = self.rate_by(name, (), window, **match)
+        return rates.get((), None)
+
+    def histogram_quantile(self, q: float, name: str, window: float = None, **match):
+        """
+        q-quantile (0..1) of histogram `name` from its bucket increases over the
+        window, interpolated linearly inside the bucket as PromQL does. None
+        without enough history or observations.
+        """
+        by_le = {}
+        for (le,), (inc, _) in self.increase_by(name + "_bucket", ("le",), window, **match).items():
+            try:
+                by_le[float(le)] = by_le.get(float(le), 0.0) + inc
+            except ValueError:
+                continue
+        return _quantile(q, by_le)
+
+def _quantile(q: float, by_le: dict):
+    if not by_le or math.inf not in by_le:
+        return None
+    bounds = sorted(by_le)
+    total = by_le[math.inf]
+    if total <= 0:
+        return None
+    rank = q * total
+    prev_bound, prev_count = 0.0, 0.0
+    for b in bounds:
+        count = by_le[b]
+        if count >= rank:
+            if b == math.inf:
+                return prev_bound  # above the highest finite bucket: best we can say
+            if count == prev_count:
+                return b
+            return prev_bound + (b - prev_bound) * (rank - prev_count) / (count - prev_count)
+        prev_bound, prev_count = b, count
+    return prev_bound
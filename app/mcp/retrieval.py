@@ -0,0 +1,99 @@
+# Prompt compaction for the LLM planner: only the runbooks relevant to the incident
+# (BM25 over id/title/signals/actions, local and dependency-free) go into the prompt,
+# in a compact form, and the log lines are deduplicated and cut to a token budget.
+import math, re
+from collections import Counter
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_NUM = re.compile(r"\d+(?:\.\d+)?(?:e[-+]?\d+)?")
+
+def tokens(text: str) -> list[str]:
+    return _TOKEN.findall(text.lower())
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English/JSON is close enough for budgeting
+    return (len(text) + 3) // 4
+
+def _runbook_text(rb: dict) -> str:
+    parts = [rb.get("id", ""), rb.get("title", "")]
+    for spec in (rb.get("signals") or {}).values():
+        parts.extend(spec if isinstance(spec, (list, tuple)) else [str(spec)])
+    for step in rb.get("steps") or []:
+        parts.append(step.get("action", ""))
+    return " ".join(parts)
+
+class RunbookIndex:
+    """BM25 index over runbooks; top_k(lines, k) returns the k best runbooks for a set of log lines."""
+    def __init__(self, runbooks, k1: float = 1.2, b: float = 0.75):
+        self.runbooks = list(runbooks)
+        self.k1, self.b = k1, b
+        self._tf = [Counter(tokens(_runbook_text(rb))) for rb in self.runbooks]
+        self._len = [sum(tf.values()) for tf in self._tf]
+        self._avg = (sum(self._len) / len(self._len)) if self._len else 0.0
+        df = Counter(t for tf in self._tf for t in tf)
+        n = len(self.runbooks)
+        self._idf = {t: math.log(1 + (n - d + 0.5) / (d + 0.5)) for t, d in df.items()}
+        self._postings = {}
+        for i, tf in enumerate(self._tf):
+            for t in tf:
+                self._postings.setdefault(t, []).append(i)
+
+    def scores(self, lines) -> dict:
+        # {runbook index: score}; each query term counts once, so repeated lines don't dominate
+        q = {t for line in lines for t in tokens(line) if t in self._idf}
+        out = {}
+        for t in q:
+            idf = self._idf[t]
+            for i in self._postings[t]:
+                f = self._tf[i][t]
+                norm = self.k1 * (1 - self.b + self.b * self._len[i] / (self._avg or 1))
+                out[i] = out.get(i, 0.0) + idf * f * (self.k1 + 1) / (f + norm)
+        return out
+
+    def top_k(self, lines, k: int = 3) -> list[dict]:
+        ranked = sorted(self.scores(lines).items(), key=lambda kv: kv[1], reverse=True)[:k]
+        if not ranked:
+            return self.runbooks[:k]  # nothing in common: let the model pick among the first few
+        return [self.runbooks[i] for i, _ in ranked]
+
+def compact_runbook(rb: dict) -> dict:
+    # what the planner needs to choose: no titles, verify steps or nested guardrails
+    signals = []
+    for spec in (rb.get("signals") or {}).values():
+        signals.extend(spec if isinstance(spec, (list, tuple)) else [spec])
+    out = {"id": rb.get("id"), "signals": signals,
+           "steps": [{"action": s.get("action"), **({"params": s["params"]} if s.get("params") else {})}
+                     for s in rb.get("steps") or []]}
+    max_actions = (rb.get("guardrails") or {}).get("max_actions")
+    if max_actions is not None:
+        out["max_actions"] = max_actions
+    return out
+
+def compact_logs(lines, budget_tokens: int = 200, max_line_chars: int = 200) -> list[str]:
+    """
+    Keeps the first occurrence of each line shape (numbers masked) with a repeat
+    count, each cut to max_line_chars, in order, until budget_tokens is used up.
+    """
+    seen = {}
+    order = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        key = _NUM.sub("#", line.lower())
+        if key in seen:
+            seen[key][1] += 1
+        else:
+            seen[key] = [line[:max_line_chars], 1]
+            order.append(key)
+    out, used = [], 0
+    for key in order:
+        text, n = seen[key]
+        if n > 1:
+            text = f"{text} (x{n})"
+        cost = estimate_tokens(text) + 1
+        if used + cost > budget_tokens:
+            break
+        out.append(text)
+        used += cost
+    return out
@@ -1,21 +1,46 @@
 from typing import List, Optional, Dict, Any
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-import uvicorn, os, time, datetime
+import uvicorn, os
 from kubernetes import client, config
+from kubernetes.watch import Watch
 from kubernetes.client import AppsV1Api, CoreV1Api
+from executor import ActionExecutor
+from informer import DeploymentInformer
 
-# Try in-cluster, fall back to local kubeconfig for dev
-try:
-    config.load_incluster_config()
-except Exception:
-    config.load_kube_config()
-
-apps_api: AppsV1Api = client.AppsV1Api()
-core_api: CoreV1Api = client.CoreV1Api()
 NAMESPACE = os.getenv("NAMESPACE", "ops")
 
-app = FastAPI(title="MCP Demo Tools (K8s-enabled)")
+# K8S_FAKE=1: in-memory deployments instead of a cluster (local runs / demos)
+if os.getenv("K8S_FAKE", "0") == "1":
+    from fake_k8s import FakeAppsV1Api, Watch
+    apps_api = FakeAppsV1Api(namespace=NAMESPACE)
+    core_api = None
+else:
+    # Try in-cluster, fall back to local kubeconfig for dev
+    try:
+        config.load_incluster_config()
+    except Exception:
+        config.load_kube_config()
+
+    apps_api: AppsV1Api = client.AppsV1Api()
+    core_api: CoreV1Api = client.CoreV1Api()
+
+# deployments in NAMESPACE, kept current by a watch (INFORMER=0: read on demand instead)
+informer = DeploymentInformer(apps_api, NAMESPACE, Watch) if os.getenv("INFORMER", "1") == "1" else None
+# all deployment changes go through here: serialized and coalesced per deployment,
+# and checked against the informer's state so no-op actions are skipped
+executor = ActionExecutor(apps_api, NAMESPACE, state=informer)
+
+@asynccontextmanager
+async def lifespan(app):
+    if informer:
+        informer.start()
+    yield
+    if informer:
+        informer.stop()
+
+app = FastAPI(title="MCP Demo Tools (K8s-enabled)", lifespan=lifespan)
 
 # ---------- Request/Response Models ----------
 class GetLogsReq(BaseModel):
@@ -43,67 +68,8 @@ class ToolResult(BaseModel):
     detail: str
     meta: Dict[str, Any] = {}
 
-# ---------- Helpers ----------
-def _restart_deployment(deploy: str):
-    # Rollout restart = patch an annotation with a fresh timestamp
-    ts = datetime.datetime.utcnow().isoformat() + "Z"
-    patch = {
-        "spec": {
-            "template": {
-                "metadata": {
-                    "annotations": {
-                        "kubectl.kubernetes.io/restartedAt": ts
-                    }
-                }
-            }
-        }
-    }
-    apps_api.patch_namespaced_deployment(
-        name=deploy, namespace=NAMESPACE, body=patch
-    )
-    return ts
-
-def _scale_deployment(deploy: str, replicas: int):
-    patch = {"spec": {"replicas": int(replicas)}}
-    apps_api.patch_namespaced_deployment(
-        name=deploy, namespace=NAMESPACE, body=patch
-    )
-
-def _patch_env_on_deployment(deploy: str, env: Dict[str, Any]):
-    # Merge/replace env on the FIRST container in the pod template
-    # (keep this simple; your deployments have a single container)
-    # Build env array [{name:..., value:...}, ...]
-    env_list = [{"name": k, "value": str(v)} for k, v in env.items()]
-
-    # We need to preserve existing env vars and merge keys; read current spec
-    dep = apps_api.read_namespaced_deployment(name=deploy, namespace=NAMESPACE)
-    containers = dep.spec.template.spec.containers
-    if not containers:
-        raise RuntimeError("Deployment has no containers")
-    current = containers[0].env or []
-    cur_map = {e.name: e.value for e in current}
-
-    # merge
-    cur_map.update({e["name"]: e["value"] for e in env_list})
-    merged_env = [{"name": k, "value": v} for k, v in cur_map.items()]
-
-    patch = {
-        "spec": {
-            "template": {
-                "spec": {
-                    "containers": [
-                        {
-                            "name": containers[0].name,
-                            "env": merged_env
-                        }
-                    ]
-                }
-            }
-        }
-    }
-    apps_api.patch_namespaced_deployment(
-        name=deploy, namespace=NAMESPACE, body=patch
-    )
+def _detail(done: str, res: dict) -> str:
+    return f"{done} ({'; '.join(res['skipped'])})" if res["skipped"] else done
 
 # ---------- Tools (now with real actions) ----------
 
@@ -117,41 +83,70 @@ def get_logs(req: GetLogsReq):
     )
 
 @app.post("/tool/restart_service", response_model=ToolResult)
-def restart_service(req: RestartServiceReq):
+async def restart_service(req: RestartServiceReq):
     # service name == deployment name
-    ts = _restart_deployment(req.service)
+    res = await executor.submit(req.service, restart=True, reason=req.reason or "unspecified")
+    ts = res["restarted_at"]
+    done = f"rollout restarted service={req.service} at {ts}" if ts else f"no restart for service={req.service}"
     return ToolResult(
         ok=True,
         tool="restart_service",
-        detail=f"rollout restarted service={req.service} at {ts}",
-        meta={"service": req.service, "reason": req.reason or "unspecified", "timestamp": ts},
+        detail=_detail(done, res),
+        meta={"service": req.service, "reason": req.reason or "unspecified", "timestamp": ts,
+              "coalesced": res["coalesced"], "skipped": res["skipped"]},
     )
 
 @app.post("/tool/scale_service", response_model=ToolResult)
-def scale_service(req: ScaleReq):
-    _scale_deployment(req.service, req.replicas)
+async def scale_service(req: ScaleReq):
+    res = await executor.submit(req.service, replicas=req.replicas)
+    done = (f"scaled service={req.service} to replicas={res['replicas']}" if res["replicas"] is not None
+            else f"no scale for service={req.service}")
     return ToolResult(
         ok=True,
         tool="scale_service",
-        detail=f"scaled service={req.service} to replicas={req.replicas}",
-        meta={"service": req.service, "replicas": req.replicas},
+        detail=_detail(done, res),
+        meta={"service": req.service, "replicas": req.replicas, "coalesced": res["coalesced"],
+              "skipped": res["skipped"]},
     )
 
 @app.post("/tool/patch_env", response_model=ToolResult)
-def patch_env(req: PatchEnvReq):
-    _patch_env_on_deployment(req.service, req.env)
-    # Best practice: restart so new env is picked up
-    ts = _restart_deployment(req.service)
+async def patch_env(req: PatchEnvReq):
+    # changed env and the restart annotation go out as one patch: a single rollout picks
+    # up the new env; values that are already set cause no rollout at all
+    res = await executor.submit(req.service, env=req.env)
+    done = (f"patched env and restarted service={req.service}" if res["env"]
+            else f"env unchanged for service={req.service}")
     return ToolResult(
         ok=True,
         tool="patch_env",
-        detail=f"patched env and restarted service={req.service}",
-        meta={"service": req.service, "env": req.env, "timestamp": ts},
+        detail=_detail(done, res),
+        meta={"service": req.service, "env": res["env"], "timestamp": res["restarted_at"],
+              "coalesced": res["coalesced"], "skipped": res["skipped"]},
     )
 
+# ---------- Deployment state (from the informer cache) ----------
+
+def _informer():
+    if informer is None or not informer.synced.is_set():
+        raise HTTPException(status_code=503, detail="deployment cache not synced")
+    return informer
+
+@app.get("/deployments")
+def deployments():
+    inf = _informer()
+    return {"namespace": NAMESPACE, "resource_version": inf.resource_version, "deployments": inf.rollouts()}
+
+@app.get("/deployments/{name}/rollout")
+def deployment_rollout(name: str):
+    state = _informer().rollout(name)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"deployment {name} not found in {NAMESPACE}")
+    return state
+
 @app.get("/healthz")
 def healthz():
-    return {"ok": True, "ns": NAMESPACE}
+    return {"ok": True, "ns": NAMESPACE,
+            "informer": None if informer is None else dict(informer.stats, synced=informer.synced.is_set())}
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8055)
@@ -0,0 +1,5 @@
+# The MCP modules import each other by bare name (they run from app/mcp in the images),
+# so put that directory on sys.path for the tests.
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("requests")  # controller imports client, which needs both at module level
+pytest.importorskip("ollama")
+import controller
+from controller import ServiceState, parse_services
+
+def test_parse_services():
+    svcs = parse_services("api, checkout-canary:8080,,")
+    assert [(s.name, s.port) for s in svcs] == [("api", 80), ("checkout-canary", 8080)]
+
+def test_cooldown_follows_the_last_action(monkeypatch):
+    monkeypatch.setattr(controller, "ACTION_COOLDOWN_SEC", 120.0)
+    s = ServiceState("api")
+    s.record("rb.crashloop", 1000.0)
+    assert s.cooling_down(1000.0 + 119)
+    assert not s.cooling_down(1000.0 + 120)
+
+def test_guardrail_limits_actions_per_window(monkeypatch):
+    monkeypatch.setattr(controller, "GUARDRAIL_WINDOW_SEC", 900.0)
+    monkeypatch.setitem(controller._RUNBOOKS, "rb.test", {"id": "rb.test", "guardrails": {"max_actions": 2}})
+    s = ServiceState("api")
+    assert s.allowed("rb.test", 0.0)
+    s.record("rb.test", 0.0)
+    s.record("rb.test", 100.0)
+    assert not s.allowed("rb.test", 200.0)
+    assert s.allowed("rb.test", 901.0)  # the first action left the window
+    # limits are per runbook and per service
+    assert ServiceState("api").allowed("rb.test", 200.0)
+    assert s.allowed("rb.unknown", 200.0)
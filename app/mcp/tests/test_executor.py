@@ -0,0 +1,160 @@
+import asyncio, datetime, threading, time
+import pytest
+from executor import ActionExecutor
+from fake_k8s import ApiException, FakeAppsV1Api, Watch
+from informer import RESTART_ANNOTATION, DeploymentInformer, own_restart_at, rollout_state
+
+NS = "ops"
+
+def _api(**deployments):
+    return FakeAppsV1Api(NS, deployments or {"api": {"env": {"MODE": "a"}, "replicas": 2}})
+
+def test_concurrent_actions_merge_into_one_patch():
+    api = _api()
+    ex = ActionExecutor(api, NS, window_ms=20)
+
+    async def run():
+        return await asyncio.gather(
+            ex.submit("api", env={"A": 1}),
+            ex.submit("api", env={"B": "2", "A": "3"}),
+            ex.submit("api", replicas=4),
+            ex.submit("api", restart=True, reason="crashloop"),
+        )
+
+    results = asyncio.run(run())
+    assert len(api.patches) == 1
+    assert api.rollouts == {"api": 1}
+    name, body = api.patches[0]
+    assert name == "api"
+    spec = body["spec"]
+    assert spec["replicas"] == 4
+    env = spec["template"]["spec"]["containers"][0]["env"]
+    assert {e["name"]: e["value"] for e in env} == {"A": "3", "B": "2"}  # later caller wins per key
+    assert spec["template"]["metadata"]["annotations"]["kubectl.kubernetes.io/restartedAt"]
+    # every caller gets the result of the shared patch
+    assert all(r == results[0] for r in results)
+    assert results[0]["coalesced"] == 4
+    assert results[0]["reasons"] == ["crashloop"]
+
+def test_deployments_are_batched_separately():
+    api = _api(api={}, worker={})
+    ex = ActionExecutor(api, NS, window_ms=10)
+
+    async def run():
+        return await asyncio.gather(ex.submit("api", replicas=3), ex.submit("worker", replicas=5))
+
+    a, w = asyncio.run(run())
+    assert sorted(n for n, _ in api.patches) == ["api", "worker"]
+    assert (a["deployment"], a["replicas"], w["deployment"], w["replicas"]) == ("api", 3, "worker", 5)
+
+def test_errors_fan_out_to_every_caller():
+    api = _api()
+    ex = ActionExecutor(api, NS, window_ms=10)
+
+    async def run():
+        return await asyncio.gather(ex.submit("missing", env={"A": "1"}),
+                                    ex.submit("missing", restart=True), return_exceptions=True)
+
+    errs = asyncio.run(run())
+    assert all(isinstance(e, ApiException) and e.status == 404 for e in errs)
+    assert api.patches == []
+
+class _SlowApi(FakeAppsV1Api):
+    # holds each patch for a while and records how many run at once
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self.in_flight = self.max_in_flight = 0
+        self._count = threading.Lock()
+
+    def patch_namespaced_deployment(self, **kw):
+        with self._count:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.1)
+        try:
+            return super().patch_namespaced_deployment(**kw)
+        finally:
+            with self._count:
+                self.in_flight -= 1
+
+def test_batches_for_one_deployment_run_one_after_another():
+    api = _SlowApi(NS, {"api": {}})
+    ex = ActionExecutor(api, NS, window_ms=10)
+
+    async def run():
+        first = asyncio.create_task(ex.submit("api", env={"A": "1"}))
+        await asyncio.sleep(0.05)  # first patch is in flight now
+        second = [asyncio.create_task(ex.submit("api", env={"B": "2"})),
+                  asyncio.create_task(ex.submit("api", replicas=3))]
+        return await first, await asyncio.gather(*second)
+
+    first, (b, c) = asyncio.run(run())
+    assert api.max_in_flight == 1
+    assert len(api.patches) == 2
+    assert first["coalesced"] == 1 and b == c and b["coalesced"] == 2
+    assert [list(body["spec"]) for _, body in api.patches] == [["template"], ["template", "replicas"]]
+
+@pytest.mark.parametrize("env", [None, {}])
+def test_nothing_to_do_sends_no_patch(env):
+    api = _api()
+    ex = ActionExecutor(api, NS, window_ms=0)
+    res = asyncio.run(ex.submit("api", env=env))
+    assert api.patches == [] and res["restarted_at"] is None
+
+class _State:
+    # the informer's get()/observe() over the live objects; these tests set them up by hand
+    def __init__(self, api):
+        self.api = api
+
+    def get(self, name):
+        return self.api.read_namespaced_deployment(name=name, namespace=NS)
+
+    def observe(self, dep):
+        pass
+
+def _crashlooping(api, name="api"):
+    dep = api._items[(NS, name)]
+    dep.status.available_replicas = dep.status.ready_replicas = 0
+    return dep
+
+def _restart(api):
+    ex = ActionExecutor(api, NS, window_ms=0, state=_State(api))
+    return asyncio.run(ex.submit("api", restart=True, reason="crashloop"))
+
+def test_crashlooping_rollout_is_restarted():
+    api = FakeAppsV1Api(NS, {"api": {"replicas": 2}})
+    dep = _crashlooping(api)
+    assert rollout_state(dep)["state"] != "complete"
+    res = _restart(api)
+    assert res["restarted_at"] and res["skipped"] == []
+    assert api.rollouts == {"api": 1}
+
+def test_own_recent_restart_is_not_repeated():
+    api = FakeAppsV1Api(NS, {"api": {}})
+    assert _restart(api)["restarted_at"]
+    assert own_restart_at(api.read_namespaced_deployment(name="api", namespace=NS)) is not None
+    res = _restart(api)
+    assert res["restarted_at"] is None and res["skipped"][0].startswith("restarted ")
+    assert api.rollouts == {"api": 1}
+
+def test_restart_by_someone_else_does_not_block():
+    api = FakeAppsV1Api(NS, {"api": {}})
+    now = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    # what `kubectl rollout restart` leaves behind
+    api._items[(NS, "api")].spec.template.metadata.annotations[RESTART_ANNOTATION] = now
+    assert own_restart_at(api.read_namespaced_deployment(name="api", namespace=NS)) is None
+    assert _restart(api)["restarted_at"]
+
+def test_own_patch_is_seen_before_its_watch_event():
+    # listed but not watching: the cache only moves through the executor's observe()
+    api = FakeAppsV1Api(NS, {"api": {"replicas": 2}})
+    inf = DeploymentInformer(api, NS, Watch)
+    inf._list()
+    ex = ActionExecutor(api, NS, window_ms=0, state=inf)
+    assert asyncio.run(ex.submit("api", replicas=3))["replicas"] == 3
+    assert asyncio.run(ex.submit("api", replicas=3))["skipped"] == ["already at 3 replicas"]
+    assert asyncio.run(ex.submit("api", restart=True))["restarted_at"]
+    assert asyncio.run(ex.submit("api", restart=True))["restarted_at"] is None
+    assert len(api.patches) == 2 and api.rollouts == {"api": 1}
+    assert inf.get("api").metadata.resource_version == api.read_namespaced_deployment(
+        name="api", namespace=NS).metadata.resource_version
@@ -0,0 +1,59 @@
+import time
+import pytest
+from fake_k8s import ApiException, FakeAppsV1Api, Watch
+from informer import DeploymentInformer
+
+NS = "ops"
+
+def _until(cond, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.01)
+    return False
+
+@pytest.fixture
+def api():
+    return FakeAppsV1Api(NS, {"api": {"replicas": 2}, "worker": {}})
+
+@pytest.fixture
+def informer(api):
+    inf = DeploymentInformer(api, NS, Watch).start()
+    assert inf.synced.wait(2)
+    yield inf
+    inf.stop()
+
+def test_lists_then_follows_the_watch(api, informer):
+    assert [r["name"] for r in informer.rollouts()] == ["api", "worker"]
+    api.patch_namespaced_deployment(name="api", namespace=NS, body={"spec": {"replicas": 5}})
+    assert _until(lambda: informer.get("api").spec.replicas == 5)
+    assert informer.resource_version == api.list_namespaced_deployment(NS).metadata.resource_version
+    assert informer.stats["lists"] == 1 and informer.stats["events"] == 1
+
+def test_get_returns_a_copy(informer):
+    informer.get("api").spec.replicas = 99
+    assert informer.get("api").spec.replicas == 2
+
+def test_observe_keeps_the_newest_version(api):
+    inf = DeploymentInformer(api, NS, Watch)
+    inf._list()
+    before = inf.get("api")
+    patched = api.patch_namespaced_deployment(name="api", namespace=NS, body={"spec": {"replicas": 4}})
+    inf.observe(patched)
+    inf.observe(before)  # e.g. a late watch event from before the patch
+    assert inf.get("api").spec.replicas == 4
+    assert inf.get("api").metadata.resource_version == patched.metadata.resource_version
+
+def test_stop_ends_a_waiting_stream(informer):
+    thread = informer._thread
+    informer.stop()
+    thread.join(2)
+    assert not thread.is_alive()
+
+def test_watch_from_a_compacted_version_is_gone(api):
+    for n in range(300):
+        api.patch_namespaced_deployment(name="worker", namespace=NS, body={"spec": {"replicas": n % 3 + 1}})
+    with pytest.raises(ApiException) as e:
+        next(iter(Watch().stream(api.list_namespaced_deployment, namespace=NS, resource_version="1")))
+    assert e.value.status == 410
@@ -0,0 +1,44 @@
+from matcher import SignalMatcher
+from runbook import RUNBOOKS
+
+def _rb(rb_id, signals, action="restart_service", params=None):
+    return {"id": rb_id, "signals": signals, "steps": [{"action": action, "params": params or {}}]}
+
+def test_crashloop_logs_pick_the_crashloop_runbook():
+    m = SignalMatcher(RUNBOOKS)
+    plan, info = m.decide("api", ["Back-off restarting failed container", "pod api-1 CrashLoopBackOff"])
+    assert info["why"] == "matched"
+    assert plan == {"runbook_id": "rb.crashloop", "tool": "restart_service",
+                    "params": {"reason": "crashloop", "service": "api"}}
+
+def test_reasons_count_as_signals():
+    m = SignalMatcher(RUNBOOKS)
+    plan, _ = m.decide("api", ["ModuleNotFoundError: No module named 'core'"], reasons=["CrashLoopBackOff"])
+    assert plan["runbook_id"] == "rb.crashloop"
+
+def test_shared_signal_alone_is_ambiguous():
+    # "timeout" belongs to both the redis and the postgres runbooks
+    plan, info = SignalMatcher(RUNBOOKS).decide("api", ["request timeout"])
+    assert plan is None and info["why"] == "ambiguous"
+
+def test_no_match():
+    plan, info = SignalMatcher(RUNBOOKS).decide("api", ["all good"])
+    assert plan is None and info["why"] == "no match" and info["candidates"] == []
+
+def test_overlapping_and_prefix_patterns_are_all_found():
+    m = SignalMatcher([_rb("a", {"x": ["redis", "redis error"]}), _rb("b", {"y": ["error rate"]})])
+    assert m.hits("redis error rate") == {"redis", "redis error", "error rate"}
+
+def test_coverage_decides_between_runbooks():
+    m = SignalMatcher([
+        _rb("one", {"logs": ["disk full"], "k8s": "Evicted"}),
+        _rb("two", {"logs": ["disk full"], "k8s": "OOMKilled"}, action="scale_service", params={"replicas": 2}),
+    ])
+    plan, info = m.decide("worker", ["disk full"], reasons=["OOMKilled"])
+    assert plan["runbook_id"] == "two" and plan["params"] == {"replicas": 2, "service": "worker"}
+    assert [c[0] for c in info["candidates"]] == ["two", "one"]
+
+def test_below_min_coverage_is_left_to_the_llm():
+    m = SignalMatcher([_rb("a", {"s1": ["alpha"], "s2": ["beta"], "s3": ["gamma"]})], min_coverage=0.5)
+    assert m.decide("api", ["alpha"])[1]["why"] == "no match"
+    assert m.decide("api", ["alpha beta"])[0]["runbook_id"] == "a"
@@ -0,0 +1,47 @@
+import time
+from plancache import PlanCache, runbook_version, signature
+
+PLAN = {"runbook_id": "rb.redis.down", "tool": "patch_env", "params": {"service": "api"}}
+
+def test_signature_ignores_numbers_order_and_duplicates():
+    v = runbook_version([{"id": "rb"}])
+    a = signature("api", ["error ratio 0.12 on /checkout", "p95 1.4s", "p95 1.4s"], v)
+    b = signature("api", ["P95 2.9s ", "error ratio 0.31 on /checkout"], v)
+    assert a == b
+    assert signature("worker", ["p95 1.4s"], v) != signature("api", ["p95 1.4s"], v)
+    assert signature("api", ["p95 1.4s"], runbook_version([{"id": "rb2"}])) != signature("api", ["p95 1.4s"], v)
+
+def test_hit_returns_a_copy():
+    c = PlanCache()
+    c.put("s", PLAN)
+    got = c.get("s")
+    got["tool"] = "restart_service"
+    assert c.get("s") == PLAN
+    assert c.get("other") is None
+    assert c.stats()["hits"] == 2 and c.stats()["misses"] == 1
+
+def test_lru_eviction():
+    c = PlanCache(max_entries=2)
+    c.put("a", PLAN)
+    c.put("b", PLAN)
+    c.get("a")  # b is now least recently used
+    c.put("c", PLAN)
+    assert c.get("b") is None and c.get("a") and c.get("c")
+    assert c.stats()["evictions"] == 1
+
+def test_entries_expire():
+    c = PlanCache(ttl_sec=0.01)
+    c.put("s", PLAN)
+    time.sleep(0.02)
+    assert c.get("s") is None
+    assert c.stats()["expired"] == 1
+
+def test_file_persistence_survives_a_restart(tmp_path):
+    path = str(tmp_path / "plans.json")
+    PlanCache(path=path).put("s", PLAN)
+    assert PlanCache(path=path).get("s") == PLAN
+
+def test_corrupt_file_starts_empty(tmp_path):
+    path = tmp_path / "plans.json"
+    path.write_text("{not json")
+    assert PlanCache(path=str(path)).get("s") is None
@@ -0,0 +1,77 @@
+import math
+import pytest
+from promparse import MetricHistory, parse
+
+TEXT = """\
+# HELP http_requests_total Requests.
+# TYPE http_requests_total counter
+http_requests_total{route="/checkout",code="200"} 10
+http_requests_total{route="/checkout",code="500"} 1 1700000000000
+http_requests_total{route="/enquire",code="200"} 5
+weird{msg="a \\"quoted\\" \\\\ value\\nnext",empty=""} +Inf
+no_labels 3.5e2
+broken{route="/x" 1
+not_a_number nope
+"""
+
+def test_parse_samples_and_types():
+    out = list(parse(TEXT))
+    assert ("# TYPE", "http_requests_total", "counter", None) in out
+    samples = [s for s in out if s[0] != "# TYPE"]
+    assert samples[1] == ("http_requests_total", {"route": "/checkout", "code": "500"}, 1.0, 1700000000000)
+    name, labels, value, _ = samples[3]
+    assert name == "weird" and labels == {"msg": 'a "quoted" \\ value\nnext', "empty": ""}
+    assert value == math.inf
+    assert samples[4] == ("no_labels", {}, 350.0, None)
+    assert len(samples) == 5  # malformed lines are skipped
+
+def test_parse_accepts_bytes_lines():
+    assert list(parse([b"up 1"])) == [("up", {}, 1.0, None)]
+
+def _scrape(h, now, ok, err, buckets=None):
+    lines = [f'http_requests_total{{route="/checkout",code="200"}} {ok}',
+             f'http_requests_total{{route="/checkout",code="500"}} {err}']
+    for le, n in (buckets or {}).items():
+        lines.append(f'lat_seconds_bucket{{route="/checkout",le="{le}"}} {n}')
+    h.ingest(lines, now=now)
+
+def test_rates_by_label_and_counter_resets():
+    h = MetricHistory(window_sec=300)
+    _scrape(h, 1000, 100, 10)
+    _scrape(h, 1010, 200, 20)
+    assert h.rate("http_requests_total", code="200") == pytest.approx(10.0)
+    assert h.rate_by("http_requests_total", by=("code",)) == {("200",): pytest.approx(10.0),
+                                                              ("500",): pytest.approx(1.0)}
+    # worker restart: the counter drops and counts up again from zero
+    _scrape(h, 1020, 50, 25)
+    inc, secs = h.increase_by("http_requests_total", code="200")[()]
+    assert (inc, secs) == (150.0, 20)
+
+def test_single_scrape_has_no_rate():
+    h = MetricHistory()
+    _scrape(h, 1000, 1, 1)
+    assert h.rate("http_requests_total") is None
+    assert h.latest("http_requests_total", code="500") == {(("code", "500"), ("route", "/checkout")): 1.0}
+
+def test_window_trims_old_points():
+    h = MetricHistory(window_sec=30)
+    _scrape(h, 1000, 0, 0)
+    _scrape(h, 1020, 10, 0)
+    _scrape(h, 1060, 50, 0)
+    # only 1060 is inside the window now
+    assert h.rate("http_requests_total", code="200") is None
+
+def test_histogram_quantile_interpolates_inside_the_bucket():
+    h = MetricHistory()
+    _scrape(h, 1000, 0, 0, {"0.1": 0, "0.5": 0, "1": 0, "+Inf": 0})
+    _scrape(h, 1010, 0, 0, {"0.1": 50, "0.5": 90, "1": 100, "+Inf": 100})
+    assert h.histogram_quantile(0.5, "lat_seconds", route="/checkout") == pytest.approx(0.1)
+    assert h.histogram_quantile(0.7, "lat_seconds") == pytest.approx(0.1 + 0.4 * 20 / 40)
+    assert h.histogram_quantile(0.95, "lat_seconds") == pytest.approx(0.5 + 0.5 * 5 / 10)
+    assert h.histogram_quantile(0.95, "lat_seconds", route="/other") is None
+
+def test_histogram_quantile_above_the_last_finite_bucket():
+    h = MetricHistory()
+    _scrape(h, 1000, 0, 0, {"0.1": 0, "+Inf": 0})
+    _scrape(h, 1010, 0, 0, {"0.1": 1, "+Inf": 10})
+    assert h.histogram_quantile(0.99, "lat_seconds") == 0.1
@@ -0,0 +1,32 @@
+from retrieval import RunbookIndex, compact_logs, compact_runbook, estimate_tokens
+from runbook import RUNBOOKS
+
+def test_top_k_ranks_the_relevant_runbook_first():
+    idx = RunbookIndex(RUNBOOKS)
+    assert idx.top_k(["postgres connection refused"], k=1)[0]["id"] == "rb.db.latency"
+    assert idx.top_k(["redis error: ConnectionError"], k=1)[0]["id"] == "rb.redis.down"
+
+def test_repeated_lines_do_not_change_the_ranking():
+    idx = RunbookIndex(RUNBOOKS)
+    once = idx.scores(["redis timeout"])
+    assert idx.scores(["redis timeout"] * 50) == once
+
+def test_unrelated_logs_fall_back_to_the_first_runbooks():
+    assert RunbookIndex(RUNBOOKS).top_k(["all quiet"], k=2) == RUNBOOKS[:2]
+
+def test_compact_runbook_keeps_what_the_planner_needs():
+    c = compact_runbook(RUNBOOKS[0])
+    assert c == {"id": "rb.crashloop",
+                 "signals": ["CrashLoopBackOff", "ModuleNotFoundError", "back-off restarting failed container"],
+                 "steps": [{"action": "restart_service", "params": {"reason": "crashloop"}}],
+                 "max_actions": 1}
+
+def test_compact_logs_folds_repeats_and_respects_the_budget():
+    lines = [f"GET /checkout 502 in {n}ms" for n in range(20)] + ["", "redis error: timeout"]
+    out = compact_logs(lines, budget_tokens=100)
+    assert out == ["GET /checkout 502 in 0ms (x20)", "redis error: timeout"]
+    assert compact_logs(lines, budget_tokens=10) == ["GET /checkout 502 in 0ms (x20)"]
+    assert all(len(l) <= 50 for l in compact_logs(["x" * 500], budget_tokens=100, max_line_chars=50))
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0 and estimate_tokens("abcd") == 1 and estimate_tokens("abcde") == 2
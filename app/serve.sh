@@ -0,0 +1,14 @@
+#!/bin/sh
+# SERVER_MODE=sync  -> Flask app (app:app) on gthread workers (default)
+# SERVER_MODE=async -> ASGI app (app_async:app) on uvicorn workers
+# METRICS_MULTIPROC=1 (default) aggregates /metrics across workers via PROMETHEUS_MULTIPROC_DIR
+set -e
+WORKERS="${WEB_WORKERS:-2}"
+if [ "${METRICS_MULTIPROC:-1}" = "1" ]; then
+  export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prom-metrics}"
+  mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+if [ "${SERVER_MODE:-sync}" = "async" ]; then
+  exec gunicorn -c gunicorn.conf.py -w "$WORKERS" -k uvicorn.workers.UvicornWorker -b "0.0.0.0:${PORT:-8000}" app_async:app
+fi
+exec gunicorn -c gunicorn.conf.py -w "$WORKERS" -k gthread -b "0.0.0.0:${PORT:-8000}" app:app
@@ -0,0 +1,173 @@
+# asyncio twin of CheckoutService for the ASGI serving mode (app_async.py); parsing,
+# validation and responses come from _CheckoutBase, only the awaits differ
+import asyncio, time
+from core.singleflight import AsyncSingleFlight
+from core import instrument
+from services.checkoutService import _CheckoutBase, REFILL_WAIT_MS, REFILL_POLL_MS
+
+class AsyncCheckoutService(_CheckoutBase):
+    _singleflight = AsyncSingleFlight
+
+    @instrument.route("/enquire")
+    async def enquire(self, item_id: str):
+        try:
+            iid = self._parse_item_id(item_id)
+
+            # 1) try Redis cache
+            with self.metrics.span("/enquire", "cache"):
+                cached = await self.redis.get_stock_cached(iid)
+            if cached is not None:
+                return self._cached_stock(item_id, cached)
+
+            # 2) fallback to DB (one refill per key at a time; also sets the cache)
+            with self.metrics.span("/enquire", "db"):
+                item, cached = await self._refills.do(iid, lambda: self._refill(iid))
+            if cached is not None:
+                return self._cached_stock(item_id, cached)
+            return self._db_stock(item_id, item)
+        except Exception as e:
+            return self._dependency_error(f"/enquire/{item_id}", e)
+
+    async def _refill(self, iid: int):
+        # see CheckoutService._refill; coalesced per key by AsyncSingleFlight
+        leader, token = await self.redis.acquire_refill_lease(iid)
+        if not leader:
+            deadline = time.monotonic() + REFILL_WAIT_MS / 1000.0
+            while time.monotonic() < deadline:
+                await asyncio.sleep(REFILL_POLL_MS / 1000.0)
+                cached = await self.redis.get_stock_cached(iid)
+                if cached is not None:
+                    self.metrics.child(self.metrics.CACHE_REFILL, "waited_hit").inc()
+                    return None, cached
+            self.metrics.child(self.metrics.CACHE_REFILL, "waited_timeout").inc()
+        try:
+            item = await self.db.get_item(iid)
+            self.metrics.child(self.metrics.CACHE_REFILL, "db").inc()
+            if item:
+                # set cache (best-effort), jittered TTL
+                await self.redis.set_stock_cached(iid, int(item["qty"]))
+            return item, None
+        finally:
+            if token:
+                await self.redis.release_refill_lease(iid, token)
+
+    @instrument.route("/enquire_batch")
+    async def enquire_many(self, item_ids):
+        parsed, bad = self._parse_batch(item_ids)
+        if bad:
+            return bad
+        try:
+            iids = {iid for iid in parsed.values() if iid is not None}
+
+            # 1) one MGET for the whole batch
+            with self.metrics.span("/enquire_batch", "cache"):
+                cached = await self.redis.get_stock_cached_many(iids)
+            misses = [iid for iid in iids if cached.get(iid) is None]
+
+            # 2) one query for every miss, 3) one pipelined backfill
+            rows = {}
+            if misses:
+                with self.metrics.span("/enquire_batch", "db"):
+                    rows = await self.db.get_items(misses)
+                if rows is None:
+                    raise RuntimeError("db get_items failed")
+                with self.metrics.span("/enquire_batch", "cache_fill"):
+                    await self.redis.set_stock_cached_many({iid: int(r["qty"]) for iid, r in rows.items()})
+
+            return self._batch_stock(parsed, cached, rows, misses)
+        except Exception as e:
+            return self._dependency_error("/enquire", e)
+
+    @instrument.route("/checkout")
+    async def checkout(self, user_id: str, item_id: str, qty: int):
+        route = self._checkout_route(item_id, qty)
+        if qty is None or qty <= 0 or not user_id:
+            return self._bad_request(route, user_id)
+
+        iid = self._parse_item_id(item_id)
+
+        # Per-user per-item lock (5s)
+        with self.metrics.span("/checkout", "lock"):
+            locked, lock_key, token = await self.redis.acquire_user_item_lock(user_id, item_id, ttl_sec=5)
+        if not locked:
+            return self._rate_limited(route, user_id)
+
+        reserved = committed = False
+        try:
+            # reserve in Redis first: obvious OOS is rejected without touching Postgres
+            with self.metrics.span("/checkout", "cache"):
+                status, cached = await self.redis.reserve_stock(iid, qty)
+            if status == "oos":
+                return self._out_of_stock(route, user_id, "cache", {"stock": cached}, stock_cached=cached)
+            reserved = status == "reserved"
+
+            # DB purchase (atomic)
+            with self.metrics.span("/checkout", "db"):
+                result = await self.db.purchase(iid, qty, record_order=self.orders is None, shard_key=user_id)
+            if not result:
+                if reserved:
+                    reserved = False
+                    await self.redis.release_stock(iid, qty)
+                return self._out_of_stock(route, user_id, "db")
+            committed = True  # stock is taken in Postgres: the reservation stands from here on
+
+            # Not cached at reserve time: keep any cache filled meanwhile in step (best-effort)
+            if not reserved:
+                with self.metrics.span("/checkout", "cache"):
+                    await self.redis.decr_stock_cached(iid, by=qty)
+
+            if self.orders:
+                with self.metrics.span("/checkout", "orders"):
+                    await self.orders.submit([result["order"]])
+
+            return self._purchased(route, user_id, result)
+
+        except Exception as e:
+            # an order that couldn't be queued or stored (OrderLost) fails the request, but
+            # the stock is already gone in Postgres, so the cache keeps its reservation too
+            if reserved and not committed:
+                await self.redis.release_stock(iid, qty)
+            return self._dependency_error(route, e, user=user_id)
+        finally:
+            if token:
+                with self.metrics.span("/checkout", "release"):
+                    await self.redis.release_lock(lock_key, token)
+
+    @instrument.route("/checkout_cart")
+    async def checkout_many(self, user_id: str, items):
+        route = "/checkout"
+        lines = self._parse_cart(items)
+        if not lines or not user_id:
+            return self._bad_request(route, user_id)
+
+        # one lock per user cart instead of one per line
+        with self.metrics.span("/checkout_cart", "lock"):
+            locked, lock_key, token = await self.redis.acquire_user_item_lock(user_id, "cart", ttl_sec=5)
+        if not locked:
+            return self._rate_limited(route, user_id)
+
+        try:
+            # DB purchase: single transaction for the whole cart
+            with self.metrics.span("/checkout_cart", "db"):
+                result = await self.db.purchase_many(lines, record_order=self.orders is None)
+            if result is None:
+                raise RuntimeError("db purchase_many failed")
+            if "short" in result:
+                return self._out_of_stock(route, user_id, "db", {"items": result["short"]}, items=result["short"])
+
+            # Update cache for every line in one pipeline (best-effort)
+            with self.metrics.span("/checkout_cart", "cache"):
+                await self.redis.decr_stock_cached_many({o["item_id"]: o["qty"] for o in result["orders"]})
+
+            if self.orders:
+                with self.metrics.span("/checkout_cart", "orders"):
+                    await self.orders.submit(result["orders"])
+
+            return self._cart_purchased(route, user_id, result)
+
+        except Exception as e:
+            return self._dependency_error(route, e, user=user_id)
+        finally:
+            if token:
+                with self.metrics.span("/checkout_cart", "release"):
+                    await self.redis.release_lock(lock_key, token)
@@ -1,12 +1,28 @@
-import time
+import os, time
 import re
+from core.singleflight import SingleFlight
+from core import instrument
 
-class CheckoutService:
-    def __init__(self, logger, metrics, redis_client, db):
+# how long a non-leader waits for another worker's refill before reading the DB itself
+REFILL_WAIT_MS = int(os.getenv("REFILL_WAIT_MS", "200"))
+REFILL_POLL_MS = int(os.getenv("REFILL_POLL_MS", "20"))
+CART_MAX_LINES = int(os.getenv("CART_MAX_LINES", "100"))
+ENQUIRE_BATCH_MAX = int(os.getenv("ENQUIRE_BATCH_MAX", "200"))
+
+class _CheckoutBase:
+    """
+    Request parsing, validation and response shaping shared by CheckoutService and
+    AsyncCheckoutService (services/asyncCheckoutService.py); subclasses only do the I/O.
+    """
+    _singleflight = SingleFlight
+
+    def __init__(self, logger, metrics, redis_client, db, orders=None):
         self.log = logger
         self.metrics = metrics
         self.redis = redis_client
         self.db = db
+        self.orders = orders  # write-behind OrderQueue, or None to insert orders inline
+        self._refills = self._singleflight(metrics=metrics)
 
     @staticmethod
     def _parse_item_id(item_id: str) -> int:
@@ -19,98 +35,295 @@ class CheckoutService:
         s = s.lstrip("0") or "0"
         return int(s)
 
+    @staticmethod
+    def _parse_cart(items):
+        """
+        Accepts [{"item_id": "I001", "qty": 2}, ...] or [["I001", 2], ...].
+        Returns [(iid, qty), ...] or None if anything is malformed.
+        """
+        if not isinstance(items, list) or not items or len(items) > CART_MAX_LINES:
+            return None
+        lines = []
+        for it in items:
+            try:
+                if isinstance(it, dict):
+                    item_id, qty = it["item_id"], int(it.get("qty", 1))
+                else:
+                    item_id, qty = it[0], int(it[1])
+                iid = _CheckoutBase._parse_item_id(item_id)
+            except (KeyError, IndexError, TypeError, ValueError):
+                return None
+            if qty <= 0:
+                return None
+            lines.append((iid, qty))
+        return lines
+
+    def _dependency_error(self, route, e, **kw):
+        self.log.error(route=route, status=502, msg="dependency error", **kw, err=str(e))
+        return {"ok": False, "error": "dependency error"}, 502
+
+    # ---- enquire ----
+    def _cached_stock(self, item_id, stock: int):
+        self.log.info(route=f"/enquire/{item_id}", status=200, msg="cache", stock=stock)
+        return {"item_id": item_id, "in_stock": stock > 0, "stock": stock, "source": "cache"}, 200
+
+    def _db_stock(self, item_id, item):
+        if not item:
+            return {"error": "item not found"}, 404
+
+        stock = int(item["qty"])
+
+        self.log.info(route=f"/enquire/{item_id}", status=200, msg="db", stock=stock)
+        return {
+            "item_id": item_id,
+            "in_stock": stock > 0,
+            "stock": stock,
+            "source": "db",
+            "name": item["name"],
+            "price_cents": int(item["price_cents"])
+        }, 200
+
+    def _parse_batch(self, item_ids):
+        """
+        Returns ({raw id: parsed id or None}, None), or (None, error response)
+        when the batch itself is malformed.
+        """
+        if not isinstance(item_ids, list) or not item_ids or len(item_ids) > ENQUIRE_BATCH_MAX:
+            self.log.warn(route="/enquire", status=400, msg="bad batch", n=len(item_ids) if isinstance(item_ids, list) else None)
+            return None, ({"error": f"ids must be a list of 1..{ENQUIRE_BATCH_MAX} item ids"}, 400)
+        parsed = {}
+        for raw in item_ids:
+            if not isinstance(raw, (str, int)):
+                raw = str(raw)
+            try:
+                parsed[raw] = self._parse_item_id(raw)
+            except (TypeError, ValueError):
+                parsed[raw] = None
+        return parsed, None
+
+    def _batch_stock(self, parsed, cached, rows, misses):
+        # per-item answers in request order; cache hits first, then DB rows, else not found
+        items, hits = [], 0
+        for raw, iid in parsed.items():
+            if iid is not None and cached.get(iid) is not None:
+                hits += 1
+                stock = cached[iid]
+                items.append({"item_id": raw, "in_stock": stock > 0, "stock": stock, "source": "cache"})
+            elif iid in rows:
+                row = rows[iid]
+                stock = int(row["qty"])
+                items.append({
+                    "item_id": raw, "in_stock": stock > 0, "stock": stock, "source": "db",
+                    "name": row["name"], "price_cents": int(row["price_cents"])
+                })
+            else:
+                items.append({"item_id": raw, "error": "item not found"})
+
+        self.log.info(route="/enquire", status=200, msg="batch", n=len(items), hits=hits, misses=len(misses))
+        return {"items": items, "hits": hits, "misses": len(misses)}, 200
+
+    # ---- checkout ----
+    @staticmethod
+    def _checkout_route(item_id, qty):
+        return f"/checkout/{item_id}/{qty if qty is not None else ''}".rstrip("/")
+
+    def _bad_request(self, route, user_id):
+        self.log.warn(route=route, status=400, msg="bad request", user=user_id)
+        return {"error":"bad request"}, 400
+
+    def _rate_limited(self, route, user_id):
+        self.log.warn(route=route, status=429, msg="rate limited", user=user_id)
+        return {"error":"rate limited, try again in a few seconds"}, 429
+
+    def _out_of_stock(self, route, user_id, where: str, logged=None, **body):
+        self.log.warn(route=route, status=409, msg=f"out of stock ({where})", user=user_id, **(logged or {}))
+        return {"ok": False, "error":"out of stock", **body}, 409
+
+    def _purchased(self, route, user_id, result):
+        self.log.info(route=route, status=200, msg="purchase ok", user=user_id, order=result["order"])
+        return {"ok": True, "order": result["order"], "new_qty": result["new_qty"]}, 200
+
+    def _cart_purchased(self, route, user_id, result):
+        total = sum(o["total_cents"] for o in result["orders"])
+        self.log.info(route=route, status=200, msg="cart purchase ok", user=user_id,
+                      lines=len(result["orders"]), total_cents=total)
+        return {
+            "ok": True,
+            "orders": result["orders"],
+            "total_cents": total,
+            "new_qty": {str(k): v for k, v in result["new_qty"].items()}
+        }, 200
+
+class CheckoutService(_CheckoutBase):
+    @instrument.route("/enquire")
     def enquire(self, item_id: str):
-        t0 = time.time()
         try:
             iid = self._parse_item_id(item_id)
 
             # 1) try Redis cache
-            cached = self.redis.get_stock_cached(iid)
+            with self.metrics.span("/enquire", "cache"):
+                cached = self.redis.get_stock_cached(iid)
             if cached is not None:
-                in_stock = cached > 0
-                self.metrics.LAT.labels("/enquire").observe(time.time()-t0)
-                self.metrics.REQS.labels("/enquire","200").inc()
-                self.log.info(route=f"/enquire/{item_id}", status=200, msg="cache", stock=cached)
-                return {"item_id": item_id, "in_stock": in_stock, "stock": cached, "source": "cache"}, 200
+                return self._cached_stock(item_id, cached)
+
+            # 2) fallback to DB (one refill per key at a time; also sets the cache)
+            with self.metrics.span("/enquire", "db"):
+                item, cached = self._refills.do(iid, lambda: self._refill(iid))
+            if cached is not None:
+                return self._cached_stock(item_id, cached)
+            return self._db_stock(item_id, item)
+        except Exception as e:
+            return self._dependency_error(f"/enquire/{item_id}", e)
 
-            # 2) fallback to DB
+    def _refill(self, iid: int):
+        """
+        Cache-miss refill, run by one thread per key in this worker (SingleFlight).
+        Across workers a short Redis lease picks the refiller; the others poll the
+        cache briefly and only hit the DB themselves if the refill doesn't land.
+        Returns (item_row, None) from the DB or (None, stock) from the cache.
+        """
+        leader, token = self.redis.acquire_refill_lease(iid)
+        if not leader:
+            deadline = time.monotonic() + REFILL_WAIT_MS / 1000.0
+            while time.monotonic() < deadline:
+                time.sleep(REFILL_POLL_MS / 1000.0)
+                cached = self.redis.get_stock_cached(iid)
+                if cached is not None:
+                    self.metrics.child(self.metrics.CACHE_REFILL, "waited_hit").inc()
+                    return None, cached
+            self.metrics.child(self.metrics.CACHE_REFILL, "waited_timeout").inc()
+        try:
             item = self.db.get_item(iid)
-            if not item:
-                self.metrics.LAT.labels("/enquire").observe(time.time()-t0)
-                self.metrics.REQS.labels("/enquire","404").inc()
-                return {"error": "item not found"}, 404
-
-            stock = int(item["qty"])
-            
-            # 3) set cache (best-effort)
-            self.redis.set_stock_cached(iid, stock, ttl_sec=300)
-
-            self.metrics.LAT.labels("/enquire").observe(time.time()-t0)
-            self.metrics.REQS.labels("/enquire","200").inc()
-            self.log.info(route=f"/enquire/{item_id}", status=200, msg="db", stock=stock)
-            return {
-                "item_id": item_id,
-                "in_stock": stock > 0,
-                "stock": stock,
-                "source": "db",
-                "name": item["name"],
-                "price_cents": int(item["price_cents"])
-            }, 200
+            self.metrics.child(self.metrics.CACHE_REFILL, "db").inc()
+            if item:
+                # set cache (best-effort), jittered TTL
+                self.redis.set_stock_cached(iid, int(item["qty"]))
+            return item, None
+        finally:
+            if token:
+                self.redis.release_refill_lease(iid, token)
+
+    @instrument.route("/enquire_batch")
+    def enquire_many(self, item_ids):
+        """
+        Batch enquiry for listing pages: one MGET for all ids, one ANY() query for
+        the misses and one pipelined backfill. Items keep their per-item source.
+        """
+        parsed, bad = self._parse_batch(item_ids)
+        if bad:
+            return bad
+        try:
+            iids = {iid for iid in parsed.values() if iid is not None}
+
+            # 1) one MGET for the whole batch
+            with self.metrics.span("/enquire_batch", "cache"):
+                cached = self.redis.get_stock_cached_many(iids)
+            misses = [iid for iid in iids if cached.get(iid) is None]
+
+            # 2) one query for every miss, 3) one pipelined backfill
+            rows = {}
+            if misses:
+                with self.metrics.span("/enquire_batch", "db"):
+                    rows = self.db.get_items(misses)
+                if rows is None:
+                    raise RuntimeError("db get_items failed")
+                with self.metrics.span("/enquire_batch", "cache_fill"):
+                    self.redis.set_stock_cached_many({iid: int(r["qty"]) for iid, r in rows.items()})
+
+            return self._batch_stock(parsed, cached, rows, misses)
         except Exception as e:
-            self.metrics.LAT.labels("/enquire").observe(time.time()-t0)
-            self.metrics.REQS.labels("/enquire","502").inc()
-            self.log.error(route=f"/enquire/{item_id}", status=502, msg="dependency error", err=str(e))
-            return {"ok": False, "error": "dependency error"}, 502
+            return self._dependency_error("/enquire", e)
 
+    @instrument.route("/checkout")
     def checkout(self, user_id: str, item_id: str, qty: int):
-        t0 = time.time()
-        route = f"/checkout/{item_id}/{qty if qty is not None else ''}".rstrip("/")
+        route = self._checkout_route(item_id, qty)
         if qty is None or qty <= 0 or not user_id:
-            self.metrics.LAT.labels("/checkout").observe(time.time()-t0)
-            self.metrics.REQS.labels("/checkout","400").inc()
-            self.log.warn(route=route, status=400, msg="bad request", user=user_id)
-            return {"error":"bad request"}, 400
+            return self._bad_request(route, user_id)
 
         iid = self._parse_item_id(item_id)
 
         # Per-user per-item lock (5s)
-        locked, lock_key, token = self.redis.acquire_user_item_lock(user_id, item_id, ttl_sec=5)
+        with self.metrics.span("/checkout", "lock"):
+            locked, lock_key, token = self.redis.acquire_user_item_lock(user_id, item_id, ttl_sec=5)
         if not locked:
-            self.metrics.LAT.labels("/checkout").observe(time.time()-t0)
-            self.metrics.REQS.labels("/checkout","429").inc()
-            self.log.warn(route=route, status=429, msg="rate limited", user=user_id)
-            return {"error":"rate limited, try again in a few seconds"}, 429
+            return self._rate_limited(route, user_id)
 
+        reserved = committed = False
         try:
-            # consult cache to short-circuit obvious OOS
-            cached = self.redis.get_stock_cached(iid)
-            if cached is not None and cached < qty:
-                self.metrics.LAT.labels("/checkout").observe(time.time()-t0)
-                self.metrics.REQS.labels("/checkout","409").inc()
-                self.log.warn(route=route, status=409, msg="out of stock (cache)", user=user_id, stock=cached)
-                return {"ok": False, "error":"out of stock", "stock_cached": cached}, 409
+            # reserve in Redis first: obvious OOS is rejected without touching Postgres
+            with self.metrics.span("/checkout", "cache"):
+                status, cached = self.redis.reserve_stock(iid, qty)
+            if status == "oos":
+                return self._out_of_stock(route, user_id, "cache", {"stock": cached}, stock_cached=cached)
+            reserved = status == "reserved"
 
             # DB purchase (atomic)
-            result = self.db.purchase(iid, qty)
+            with self.metrics.span("/checkout", "db"):
+                result = self.db.purchase(iid, qty, record_order=self.orders is None, shard_key=user_id)
             if not result:
-                self.metrics.LAT.labels("/checkout").observe(time.time()-t0)
-                self.metrics.REQS.labels("/checkout","409").inc()
-                self.log.warn(route=route, status=409, msg="out of stock (db)", user=user_id)
-                return {"ok": False, "error":"out of stock"}, 409
+                if reserved:
+                    reserved = False
+                    self.redis.release_stock(iid, qty)
+                return self._out_of_stock(route, user_id, "db")
+            committed = True  # stock is taken in Postgres: the reservation stands from here on
+
+            # Not cached at reserve time: keep any cache filled meanwhile in step (best-effort)
+            if not reserved:
+                with self.metrics.span("/checkout", "cache"):
+                    self.redis.decr_stock_cached(iid, by=qty)
+
+            if self.orders:
+                with self.metrics.span("/checkout", "orders"):
+                    self.orders.submit([result["order"]])
+
+            return self._purchased(route, user_id, result)
+
+        except Exception as e:
+            # an order that couldn't be queued or stored (OrderLost) fails the request, but
+            # the stock is already gone in Postgres, so the cache keeps its reservation too
+            if reserved and not committed:
+                self.redis.release_stock(iid, qty)
+            return self._dependency_error(route, e, user=user_id)
+        finally:
+            if token:
+                with self.metrics.span("/checkout", "release"):
+                    self.redis.release_lock(lock_key, token)
+
+    @instrument.route("/checkout_cart")
+    def checkout_many(self, user_id: str, items):
+        route = "/checkout"
+        lines = self._parse_cart(items)
+        if not lines or not user_id:
+            return self._bad_request(route, user_id)
+
+        # one lock per user cart instead of one per line
+        with self.metrics.span("/checkout_cart", "lock"):
+            locked, lock_key, token = self.redis.acquire_user_item_lock(user_id, "cart", ttl_sec=5)
+        if not locked:
+            return self._rate_limited(route, user_id)
+
+        try:
+            # DB purchase: single transaction for the whole cart
+            with self.metrics.span("/checkout_cart", "db"):
+                result = self.db.purchase_many(lines, record_order=self.orders is None)
+            if result is None:
+                raise RuntimeError("db purchase_many failed")
+            if "short" in result:
+                return self._out_of_stock(route, user_id, "db", {"items": result["short"]}, items=result["short"])
+
+            # Update cache for every line in one pipeline (best-effort)
+            with self.metrics.span("/checkout_cart", "cache"):
+                self.redis.decr_stock_cached_many({o["item_id"]: o["qty"] for o in result["orders"]})
 
-            # Update cache (best-effort)
-            self.redis.decr_stock_cached(iid, by=qty)
+            if self.orders:
+                with self.metrics.span("/checkout_cart", "orders"):
+                    self.orders.submit(result["orders"])
 
-            self.metrics.LAT.labels("/checkout").observe(time.time()-t0)
-            self.metrics.REQS.labels("/checkout","200").inc()
-            self.log.info(route=route, status=200, msg="purchase ok", user=user_id, order=result["order"])
-            return {"ok": True, "order": result["order"], "new_qty": result["new_qty"]}, 200
+            return self._cart_purchased(route, user_id, result)
 
         except Exception as e:
-            self.metrics.LAT.labels("/checkout").observe(time.time()-t0)
-            self.metrics.REQS.labels("/checkout","502").inc()
-            self.log.error(route=route, status=502, msg="dependency error", user=user_id, err=str(e))
-            return {"ok": False, "error":"dependency error"}, 502
+            return self._dependency_error(route, e, user=user_id)
         finally:
             if token:
-                self.redis.release_lock(lock_key, token)
+                with self.metrics.span("/checkout_cart", "release"):
+                    self.redis.release_lock(lock_key, token)
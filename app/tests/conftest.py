@@ -0,0 +1,4 @@
+# Tests import the app packages (core, services) the way app.py does, from app/.
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
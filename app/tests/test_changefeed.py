@@ -0,0 +1,92 @@
+import pytest
+
+pytest.importorskip("psycopg")  # core.changefeed imports the driver at module level
+from core import changefeed
+from core.changefeed import StockChangeFeed
+
+class _Counter:
+    def __init__(self):
+        self.counts = {}
+
+    def labels(self, result):
+        return _Inc(self.counts, result)
+
+    def observe(self, v): pass
+
+class _Inc:
+    def __init__(self, counts, key):
+        self.counts, self.key = counts, key
+
+    def inc(self, n=1):
+        self.counts[self.key] = self.counts.get(self.key, 0) + n
+
+class _Metrics:
+    def __init__(self):
+        self.CHANGEFEED_EVENTS = _Counter()
+        self.CHANGEFEED_LAG = _Counter()
+
+    def child(self, metric, *labels):
+        return metric.labels(*labels)
+
+class _Redis:
+    # in-memory stand-in with the SWAP_STOCK_LUA semantics
+    def __init__(self, **stock):
+        self.d = {int(k[1:]): v for k, v in stock.items()}
+
+    def get_stock_cached_many(self, ids):
+        return {i: self.d.get(i) for i in ids}
+
+    def swap_stock_cached_many(self, fresh, seen):
+        n = 0
+        for i, qty in fresh.items():
+            if self.d.get(i) == seen.get(i):
+                self.d[i] = qty
+                n += 1
+            else:
+                self.d.pop(i, None)
+        return n
+
+    def delete_stock_cached_many(self, ids):
+        for i in ids:
+            self.d.pop(i, None)
+        return True
+
+class _DB:
+    def __init__(self, rows, during_read=None):
+        self.rows, self.during_read = rows, during_read
+
+    def get_items(self, ids):
+        if self.during_read:
+            self.during_read()
+        return {i: {"qty": self.rows[i]} for i in ids if i in self.rows}
+
+def _feed(redis, db):
+    m = _Metrics()
+    return StockChangeFeed(None, m, redis, db), m.CHANGEFEED_EVENTS.counts
+
+def test_invalidate_drops_the_keys(monkeypatch):
+    monkeypatch.setattr(changefeed, "CHANGEFEED_MODE", "invalidate")
+    redis = _Redis(i1=5, i2=7)
+    feed, counts = _feed(redis, _DB({1: 9}))
+    assert feed.apply({1})
+    assert redis.d == {2: 7} and counts == {"invalidated": 1}
+
+def test_update_rewrites_changed_items_and_drops_deleted_ones(monkeypatch):
+    monkeypatch.setattr(changefeed, "CHANGEFEED_MODE", "update")
+    redis = _Redis(i1=5, i2=7)
+    feed, counts = _feed(redis, _DB({1: 9}))
+    assert feed.apply({1, 2})
+    assert redis.d == {1: 9}
+    assert counts == {"updated": 1, "invalidated": 1}
+
+def test_update_does_not_undo_a_concurrent_reservation(monkeypatch):
+    monkeypatch.setattr(changefeed, "CHANGEFEED_MODE", "update")
+    redis = _Redis(i1=5)
+
+    def checkout():
+        redis.d[1] -= 2  # RESERVE_STOCK_LUA's DECRBY between the snapshot and the SET
+
+    feed, counts = _feed(redis, _DB({1: 9}, during_read=checkout))
+    assert feed.apply({1})
+    assert 1 not in redis.d  # dropped: the next read refills from Postgres
+    assert counts == {"updated": 0, "invalidated": 1}
@@ -0,0 +1,54 @@
+from core import health
+from core.health import _Dep
+
+def test_first_probe_sets_state_directly():
+    up, down = _Dep(), _Dep()
+    up.record(True, 1.0)
+    down.record(False, 1.0)
+    assert up.up is True and down.up is False
+
+def test_consecutive_failures_take_it_down(monkeypatch):
+    monkeypatch.setattr(health, "HEALTH_FAIL_THRESHOLD", 3)
+    d = _Dep()
+    d.record(True, 1.0)
+    d.record(False, 1.0)
+    d.record(False, 1.0)
+    assert d.up is True
+    d.record(True, 1.0)  # a good probe resets the count
+    d.record(False, 1.0)
+    d.record(False, 1.0)
+    assert d.up is True
+    d.record(False, 1.0)
+    assert d.up is False and d.view()["consecutive_failures"] == 3
+
+def test_consecutive_successes_bring_it_back(monkeypatch):
+    monkeypatch.setattr(health, "HEALTH_RECOVER_THRESHOLD", 2)
+    d = _Dep()
+    d.record(False, 1.0)
+    d.record(True, 1.0)
+    d.record(False, 1.0)
+    d.record(True, 1.0)
+    assert d.up is False
+    d.record(True, 1.0)
+    assert d.up is True and d.view()["consecutive_failures"] == 0
+
+def test_slow_probe_counts_as_bad(monkeypatch):
+    monkeypatch.setattr(health, "HEALTH_SLOW_MS", 100.0)
+    monkeypatch.setattr(health, "HEALTH_FAIL_THRESHOLD", 2)
+    d = _Dep()
+    d.record(True, 250.0)
+    assert d.up is False and d.latency_ms == 250.0
+    d = _Dep()
+    d.record(True, 5.0)
+    d.record(True, 250.0)
+    d.record(True, 250.0)
+    assert d.up is False
+
+def test_inline_probe_reports_each_result(monkeypatch):
+    monkeypatch.setattr(health, "HEALTH_SLOW_MS", 100.0)
+    d = _Dep()
+    d.record(True, 1.0, inline=True)
+    d.record(False, 1.0, inline=True)
+    assert d.up is False
+    d.record(True, 250.0, inline=True)  # no latency cut-off inline
+    assert d.up is True
@@ -0,0 +1,55 @@
+import time
+from core.local_cache import LocalCache
+
+class _Counter:
+    def __init__(self):
+        self.counts = {}
+
+    def labels(self, result):
+        self._result = result
+        return self
+
+    def inc(self, n=1):
+        self.counts[self._result] = self.counts.get(self._result, 0) + n
+
+class _Metrics:
+    def __init__(self):
+        self.L1_OPS = _Counter()
+
+    def child(self, metric, *labels):
+        return metric.labels(*labels)
+
+def test_get_set_and_metrics():
+    m = _Metrics()
+    c = LocalCache(max_items=10, ttl_sec=60, metrics=m)
+    assert c.get("stock:1") is None
+    c.set("stock:1", 5)
+    assert c.get("stock:1") == 5
+    assert m.L1_OPS.counts == {"miss": 1, "hit": 1}
+
+def test_entries_expire():
+    c = LocalCache(ttl_sec=0.01)
+    c.set("k", 1)
+    time.sleep(0.02)
+    assert c.get("k") is None
+
+def test_least_recently_used_is_evicted():
+    m = _Metrics()
+    c = LocalCache(max_items=2, ttl_sec=60, metrics=m)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert c.get("b") is None and c.get("a") == 1 and c.get("c") == 3
+    assert m.L1_OPS.counts["eviction"] == 1
+
+def test_invalidate_and_clear():
+    m = _Metrics()
+    c = LocalCache(ttl_sec=60, metrics=m)
+    for k in "abc":
+        c.set(k, k)
+    c.invalidate("a", "missing")
+    assert c.get("a") is None and c.get("b") == "b"
+    c.clear()
+    assert c.get("b") is None and c.get("c") is None
+    assert m.L1_OPS.counts["invalidate"] == 3
@@ -0,0 +1,50 @@
+import json, queue
+from core import logging as jlog
+from core.logging import JsonLogger, _STOP, _parse_sampling, _status_match
+
+def _logger(spec=""):
+    log = JsonLogger(service="test")
+    log._rules = _parse_sampling(spec)
+    return log
+
+def test_status_match():
+    assert _status_match("*", 503)
+    assert _status_match("200", 200)
+    assert _status_match("2xx", 204)
+    assert not _status_match("2xx", 409)
+    assert not _status_match("200", 201)
+    assert not _status_match("4x", 404)
+
+def test_parse_sampling_skips_bad_rules():
+    assert _parse_sampling("/enquire:200=0.01, bogus ,*:5XX=1") == [
+        ("/enquire", "200", 0.01), ("*", "5xx", 1.0)]
+
+def test_keep_first_matching_rule_wins(monkeypatch):
+    log = _logger("/enquire:200=0,/enquire:*=1,*:2xx=0")
+    assert not log._keep({"route": "/enquire/I001", "status": 200})
+    assert log._keep({"route": "/enquire/I001", "status": 404})
+    assert not log._keep({"route": "/checkout/I001/1", "status": 200})
+    assert log._keep({"route": "/checkout/I001/1", "status": 409})
+    monkeypatch.setattr(jlog.random, "random", lambda: 0.5)
+    log._rules = _parse_sampling("*:*=0.4")
+    assert not log._keep({"route": "/x", "status": 200})
+    log._rules = _parse_sampling("*:*=0.6")
+    assert log._keep({"route": "/x", "status": 200})
+
+def test_keep_records_without_route_or_status():
+    log = _logger("*:*=0")
+    assert log._keep({"msg": "startup"})
+    assert log._keep({"route": "/enquire", "msg": "no status"})
+    assert not log._keep({"route": "/enquire", "status": 200})
+
+def test_drain_survives_unserializable_records(capsys):
+    log = _logger()
+    log._q = queue.Queue()
+    loop = {}
+    loop["self"] = loop
+    for kv in ({"n": 1}, loop, {"n": 2, "big": 2**70, 3: "int key"}, _STOP):
+        log._q.put(kv)
+    log._drain()
+    lines = [json.loads(l) for l in capsys.readouterr().out.splitlines()]
+    assert [l["n"] for l in lines] == [1, 2]
+    assert lines[1]["big"] == 2**70 and lines[1]["3"] == "int key"
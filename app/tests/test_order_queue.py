@@ -0,0 +1,191 @@
+import asyncio, contextlib
+import pytest
+from core.order_queue import AsyncOrderQueue, OrderFlusher, OrderLost, OrderQueue
+
+class _Metric:
+    def __init__(self):
+        self.counts = {}
+        self.values = []
+
+    def labels(self, *labels):
+        return _Child(self, labels)
+
+    def observe(self, v):
+        self.values.append(v)
+
+    def set(self, v):
+        self.values.append(v)
+
+class _Child:
+    def __init__(self, metric, labels):
+        self.metric, self.key = metric, labels
+
+    def inc(self, n=1):
+        self.metric.counts[self.key] = self.metric.counts.get(self.key, 0) + n
+
+class _Metrics:
+    def __init__(self):
+        self.ORDER_QUEUE_OPS = _Metric()
+        self.ORDER_FLUSH_BATCH = _Metric()
+        self.ORDER_FLUSH_LAG = _Metric()
+        self.ORDER_QUEUE_DEPTH = _Metric()
+
+    def child(self, metric, *labels):
+        return metric.labels(*labels)
+
+class _Log:
+    def __init__(self):
+        self.errors = []
+
+    def info(self, **kw): pass
+    def error(self, **kw): self.errors.append(kw)
+
+class _Redis:
+    def __init__(self, up=True):
+        self.up = up
+        self.stream = []
+        self.pending = []
+        self.acked = []
+        self.seq = 0
+
+    def enqueue_orders(self, entries):
+        if not self.up:
+            return False
+        for e in entries:
+            self.stream.append((f"{self.seq}-0", {k: str(v) for k, v in e.items()}))
+            self.seq += 1
+        return True
+
+    def ensure_order_group(self): pass
+
+    def read_orders(self, consumer, count, pending=False):
+        if pending:
+            return list(self.pending)
+        batch, self.stream = self.stream[:count], self.stream[count:]
+        self.pending += batch
+        return batch
+
+    def claim_stale_orders(self, consumer, idle_ms, count):
+        return []
+
+    def ack_orders(self, ids):
+        self.acked += ids
+        self.pending = [(i, f) for i, f in self.pending if i not in ids]
+
+    def order_queue_depth(self):
+        return len(self.stream) + len(self.pending)
+
+class _DB:
+    def __init__(self, up=True):
+        self.up = up
+        self.rows = {}
+
+    def insert_orders(self, orders):
+        if not self.up:
+            return None
+        # ON CONFLICT (order_key) DO NOTHING
+        new = [o for o in orders if o["order_key"] not in self.rows]
+        self.rows.update((o["order_key"], o) for o in new)
+        return len(new)
+
+class _AsyncWrap:
+    def __init__(self, inner):
+        self.inner = inner
+
+    def __getattr__(self, name):
+        fn = getattr(self.inner, name)
+        async def call(*a, **kw):
+            return fn(*a, **kw)
+        return call
+
+def _order(item_id=1, qty=2):
+    return {"item_id": item_id, "qty": qty, "unit_price_cents": 100, "total_cents": 100 * qty}
+
+def test_submit_enqueues_and_stamps_order_key():
+    m, redis, db = _Metrics(), _Redis(), _DB()
+    o = _order()
+    OrderQueue(_Log(), m, redis, db).submit([o])
+    assert len(redis.stream) == 1 and not db.rows
+    assert redis.stream[0][1]["order_key"] == o["order_key"]
+    assert m.ORDER_QUEUE_OPS.counts == {("enqueue", "ok"): 1}
+
+def test_submit_falls_back_to_db_when_redis_is_down():
+    m, db = _Metrics(), _DB()
+    OrderQueue(_Log(), m, _Redis(up=False), db).submit([_order(), _order(2)])
+    assert len(db.rows) == 2
+    assert m.ORDER_QUEUE_OPS.counts == {("enqueue", "fallback"): 1}
+
+def test_submit_raises_when_queue_and_db_both_fail():
+    m, log = _Metrics(), _Log()
+    with pytest.raises(OrderLost):
+        OrderQueue(log, m, _Redis(up=False), _DB(up=False)).submit([_order()])
+    assert m.ORDER_QUEUE_OPS.counts == {("enqueue", "error"): 1}
+    assert log.errors and log.errors[0]["orders"][0]["item_id"] == 1
+
+def test_async_submit_raises_when_queue_and_db_both_fail():
+    q = AsyncOrderQueue(_Log(), _Metrics(), _AsyncWrap(_Redis(up=False)), _AsyncWrap(_DB(up=False)))
+    with pytest.raises(OrderLost):
+        asyncio.run(q.submit([_order()]))
+
+def test_flush_acks_after_insert():
+    m, redis, db = _Metrics(), _Redis(), _DB()
+    OrderQueue(_Log(), m, redis, db).submit([_order(), _order(2)])
+    f = OrderFlusher(_Log(), m, redis, db)
+    assert f.flush_once() == 2
+    assert len(db.rows) == 2
+    assert redis.acked == ["0-0", "1-0"] and not redis.pending
+    assert m.ORDER_QUEUE_OPS.counts[("flush", "ok")] == 1
+    assert m.ORDER_FLUSH_BATCH.values == [2]
+
+def test_flush_keeps_entries_pending_when_insert_fails_and_retries_without_duplicates():
+    m, redis, db = _Metrics(), _Redis(), _DB(up=False)
+    OrderQueue(_Log(), m, redis, db).submit([_order()])
+    f = OrderFlusher(_Log(), m, redis, db)
+    assert f.flush_once() == 0
+    assert not redis.acked and len(redis.pending) == 1
+    assert f._retry_pending
+    assert m.ORDER_QUEUE_OPS.counts[("flush", "error")] == 1
+
+    # the row made it in before a lost ack: the redelivery must not add a second one
+    key = redis.pending[0][1]["order_key"]
+    db.up = True
+    db.rows[key] = {"order_key": key}
+    assert f.flush_once() == 1
+    assert list(db.rows) == [key]
+    assert redis.acked == ["0-0"] and not redis.pending
+    assert f.flush_once() == 0 and not f._retry_pending
+
+class _CheckoutRedis:
+    def __init__(self):
+        self.released = []
+
+    def acquire_user_item_lock(self, user_id, item_id, ttl_sec):
+        return True, "lock", "tok"
+
+    def release_lock(self, key, token): pass
+
+    def reserve_stock(self, iid, qty):
+        return "reserved", 5
+
+    def release_stock(self, iid, qty):
+        self.released.append((iid, qty))
+
+class _CheckoutDB:
+    def purchase(self, iid, qty, record_order, shard_key=None):
+        return {"order": _order(iid, qty), "new_qty": 3}
+
+class _CheckoutMetrics(_Metrics):
+    def span(self, route, stage):
+        return contextlib.nullcontext()
+
+    def record_request(self, route, code, seconds): pass
+
+def test_checkout_fails_when_the_order_is_lost():
+    from services.checkoutService import CheckoutService
+    m, redis, log = _CheckoutMetrics(), _CheckoutRedis(), _Log()
+    log.warn = log.info
+    orders = OrderQueue(log, m, _Redis(up=False), _DB(up=False))
+    body, code = CheckoutService(log, m, redis, _CheckoutDB(), orders).checkout("u1", "I001", 2)
+    assert code == 502 and not body["ok"]
+    # Postgres already took the stock: the cache reservation must stand
+    assert redis.released == []
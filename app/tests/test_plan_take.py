@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("psycopg")  # core.db imports the driver at module level
+from core.db import _plan_take, _split
+
+def _rows(**qty):
+    return {int(k[1:]): {"qty": v} for k, v in qty.items()}
+
+def test_unsharded_lines_come_from_inventory_qty():
+    short, plan = _plan_take([1, 2], {1: 2, 2: 1}, _rows(i1=5, i2=1), [])
+    assert short is None
+    assert plan == ([1, 2], [2, 1], ([], [], []), {1: 3, 2: 0})
+
+def test_sharded_item_takes_base_then_shards_in_order():
+    shards = [{"item_id": 1, "shard": 0, "qty": 1}, {"item_id": 1, "shard": 1, "qty": 4}]
+    short, plan = _plan_take([1], {1: 4}, _rows(i1=2), shards)
+    assert short is None
+    base_ids, base_qtys, upd, new_qty = plan
+    assert (base_ids, base_qtys) == ([1], [2])
+    assert upd == ([1, 1], [0, 1], [1, 1])
+    assert new_qty == {1: 3}
+
+def test_empty_base_is_skipped():
+    shards = [{"item_id": 3, "shard": 2, "qty": 3}]
+    _, (base_ids, base_qtys, upd, new_qty) = _plan_take([3], {3: 3}, _rows(i3=0), shards)
+    assert base_ids == [] and upd == ([3], [2], [3]) and new_qty == {3: 0}
+
+def test_short_and_unknown_items_are_reported():
+    shards = [{"item_id": 1, "shard": 0, "qty": 1}]
+    short, plan = _plan_take([1, 2, 9], {1: 3, 2: 1, 9: 1}, _rows(i1=1, i2=1), shards)
+    assert plan is None and short == [1, 9]
+
+def test_split_spreads_the_remainder_over_the_first_shards():
+    assert _split(10, 4) == [3, 3, 2, 2]
+    assert sum(_split(7, 3)) == 7
@@ -0,0 +1,104 @@
+import asyncio, threading, time
+import pytest
+from core.singleflight import AsyncSingleFlight, SingleFlight
+
+def test_concurrent_callers_share_one_call():
+    sf = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def fn():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return "row"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(sf.do(1, fn)))
+    leader.start()
+    started.wait(1)
+    followers = [threading.Thread(target=lambda: results.append(sf.do(1, fn))) for _ in range(5)]
+    for t in followers:
+        t.start()
+    for t in [leader] + followers:
+        t.join(2)
+    assert calls == [1] and results == ["row"] * 6
+    # the key is released afterwards: the next call runs again
+    assert sf.do(1, lambda: "fresh") == "fresh"
+
+def test_followers_get_the_leaders_exception():
+    sf = SingleFlight()
+    started = threading.Event()
+
+    def boom():
+        started.set()
+        time.sleep(0.05)
+        raise RuntimeError("db down")
+
+    errors = []
+
+    def call():
+        try:
+            sf.do("k", boom)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(1)
+    follower = threading.Thread(target=call)
+    follower.start()
+    leader.join(2)
+    follower.join(2)
+    assert errors == ["db down", "db down"]
+
+def test_async_callers_share_one_call():
+    sf = AsyncSingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 7
+
+    async def run():
+        return await asyncio.gather(*(sf.do("k", fn) for _ in range(5)))
+
+    assert asyncio.run(run()) == [7] * 5
+    assert calls == [1]
+
+def test_async_exception_reaches_every_caller():
+    sf = AsyncSingleFlight()
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise ValueError("nope")
+
+    async def run():
+        return await asyncio.gather(*(sf.do("k", boom) for _ in range(3)), return_exceptions=True)
+
+    errs = asyncio.run(run())
+    assert all(isinstance(e, ValueError) for e in errs)
+    assert sf._calls == {}
+
+def test_async_cancelled_leader_does_not_fail_followers():
+    sf = AsyncSingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "row"
+
+    async def run():
+        leader = asyncio.create_task(sf.do("k", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(sf.do("k", fn))
+        await asyncio.sleep(0.01)
+        leader.cancel()  # e.g. the leader's client disconnected
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == "row"
+    assert calls == [1] and sf._calls == {}